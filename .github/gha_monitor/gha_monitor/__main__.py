@@ -14,16 +14,25 @@
 import logging
 import os
 
+from . import aggregate
 from . import github
 from . import sns
+from . import state
 from datetime import datetime, timedelta
-from dateutil import parser, tz
+from dateutil import tz
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-# What time range to consider alerting on failures.
-TIME_WINDOW_BEGIN = datetime.now().astimezone(tz.UTC) - timedelta(hours=float(os.getenv('MONITOR_FREQ_IN_HOURS')))
+# What time range to consider alerting on failures, when there is no cursor.
+MONITOR_FREQ = timedelta(hours=float(os.getenv('MONITOR_FREQ_IN_HOURS')))
+TIME_WINDOW_BEGIN = datetime.now().astimezone(tz.UTC) - MONITOR_FREQ
 TIME_WINDOW_END = datetime.now().astimezone(tz.UTC)
+# Where the cursor is kept between invocations: a local file or s3://bucket/key
+CURSOR_LOCATION = os.getenv('GHA_MONITOR_STATE',
+                            os.path.expanduser(f"~/.cache/gha_monitor/{os.getenv('GITHUB_REPO_ORG')}_"
+                                               f"{os.getenv('GITHUB_REPO')}_cursor.json"))
+# Log the notices instead of publishing them, and leave the cursor where it is
+DRY_RUN = os.getenv('GHA_MONITOR_DRY_RUN') is not None
 
 
 class GitHubActions(github.GitHubClient):
@@ -34,74 +43,69 @@ class GitHubActions(github.GitHubClient):
         # Use from within an Action - ignored if username set
         'token': os.getenv('GITHUB_TOKEN', None),
         'repo_organization': os.getenv('GITHUB_REPO_ORG'),
-        'repo': os.getenv('GITHUB_REPO')
+        'repo': os.getenv('GITHUB_REPO'),
+        # ETags and workflow names kept between invocations
+        'cache_file': os.getenv('GHA_MONITOR_CACHE',
+                                os.path.expanduser(f"~/.cache/gha_monitor/{os.getenv('GITHUB_REPO_ORG')}_"
+                                                   f"{os.getenv('GITHUB_REPO')}.json")),
+        'max_workers': int(os.getenv('GHA_MONITOR_WORKERS', '4')),
+        # Set to use a local stand-in (see standin.py) instead of api.github.com
+        'api_url': os.getenv('GITHUB_API_URL', None)
     }
 
 
 class S2nNotices(sns.SNSClient):
     params = {
-        'topic_arn': 'arn:aws:sns:us-west-2:024603541914:s2n_notices'
+        'topic_arn': 'arn:aws:sns:us-west-2:024603541914:s2n_notices',
+        'endpoint_url': os.getenv('SNS_ENDPOINT_URL', None)
     }
 
 
-def message_text():
-    """ Formatting for text message. """
-    return """
-s2n GitHub Action monitor notice
-State: {conclusion}
-Repo: {repo}
-GHA failure time: {time}
-Workflow name: {workflow_name}
-URL: {url}
-started by: {commit_owner}\n
-"""
-
-
 def main():
     """ Main entrypoint. """
     logging.info('Starting up')
     plaintext_notice = []
     gh_api = GitHubActions()
-    s2n_text_client = S2nNotices()
+    checked_at = datetime.now().astimezone(tz.UTC)
 
-    # Get the Action workflow log from the Github API
-    gh_api.get_workflow_log_chunk(final_state='failure')
-    logging.info(f"Looking for failures newer than {TIME_WINDOW_BEGIN} in {gh_api.params['repo_organization']}"
-                 f"/{gh_api.params['repo']}")
-    if gh_api.worklog:
-        for enhanced_worklog in gh_api.worklog:
-            # Parse the event date/time so we can compare it
-            datetime_creation = parser.parse(enhanced_worklog['created_at'])
-            logging.debug(f"looking at event from {enhanced_worklog['created_at']}")
-
-            # If the event is recent enough, process it.
-            if datetime_creation > TIME_WINDOW_BEGIN:
-                logging.debug(f"Workflow_url: {enhanced_worklog['workflow_url']}")
-                # The name of the workflow isn't in the failure object, look it up.
-                enhanced_worklog['workflow_name'] = gh_api.get_workflow_name(enhanced_worklog['workflow_url'].split('/')[-1:][0])
-                enhanced_worklog['repo'] = gh_api.params['repo']
-
-                # Construct a notification string.
-                notice_msg = message_text().format(
-                    conclusion=enhanced_worklog['conclusion'],
-                    time=enhanced_worklog['created_at'],
-                    url=enhanced_worklog['html_url'],
-                    commit_owner=enhanced_worklog['head_commit']['author']['email'],
-                    repo=enhanced_worklog['repo'],
-                    workflow_name=enhanced_worklog['workflow_name'])
-                logging.debug(notice_msg)
-                plaintext_notice.append(notice_msg)
-            else:
-                logging.debug("event outside time range.")
-    else:
-        logging.info("GH API returned empty worklog")
+    # Only look at runs the previous invocations haven't reported
+    cursor = state.Cursor(CURSOR_LOCATION, MONITOR_FREQ).load()
+    since = cursor.since(TIME_WINDOW_BEGIN)
 
+    # Get every failed run since the cursor from the Github API
+    logging.info(f"Looking for failures newer than {since} in {gh_api.params['repo_organization']}"
+                 f"/{gh_api.params['repo']}")
+    gh_api.get_workflow_runs(since, final_state='failure')
+    new_runs = [run for run in gh_api.worklog if cursor.is_new(run)]
+    logging.info(f"{len(new_runs)} of {len(gh_api.worklog)} failures are new")
+    if new_runs:
+        # The name of the workflow isn't in the failure object, look each one up once.
+        workflow_names = gh_api.get_workflow_names(aggregate.workflow_id(run) for run in new_runs)
+
+        # One notice per workflow, branch and commit author, however many times it failed.
+        for group in aggregate.group_failures(new_runs, workflow_names):
+            notice_msg = aggregate.notice_text(group, gh_api.params['repo'])
+            logging.debug(notice_msg)
+            plaintext_notice.append(notice_msg)
+        logging.info(f"{len(new_runs)} failures grouped into {len(plaintext_notice)} notices")
+    gh_api.save_cache()
 
     # Relay messages to SNS
     if plaintext_notice:
-        # Combine multiple message together.
-        logging.info(s2n_text_client.publish("\n".join(plaintext_notice)))
-        logging.info(f"Notices published")
+        if DRY_RUN:
+            logging.info("\n".join(plaintext_notice))
+        else:
+            # Combine multiple message together.
+            logging.info(S2nNotices().publish_batch(plaintext_notice))
+            logging.info(f"Notices published")
+
+    # A dry run reports nothing, so the real run after it must still see these failures
+    if DRY_RUN:
+        logging.info("Dry run, not moving the cursor")
+    else:
+        # Only move the cursor once the notices are out, so a failed publish is retried
+        cursor.advance(new_runs, checked_at)
+        cursor.save()
     logging.info("Done")
 
 
@@ -0,0 +1,110 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import collections
+from dateutil import parser
+
+# Run URLs listed per group, the rest are only counted
+MAX_URLS_PER_GROUP = 5
+
+# Longest notice for a single group
+MAX_NOTICE_BYTES = 4 * 1024
+
+
+def workflow_id(run):
+    return run['workflow_url'].split('/')[-1]
+
+
+def commit_author(run):
+    head_commit = run.get('head_commit') or {}
+    return (head_commit.get('author') or {}).get('email', 'unknown')
+
+
+class FailureGroup:
+    """
+    The failures of one workflow, on one branch, started by one commit author.
+    """
+
+    def __init__(self, workflow_name, branch, author):
+        self.workflow_name = workflow_name
+        self.branch = branch
+        self.author = author
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.conclusions = collections.Counter()
+        self.commits = set()
+        # Newest first, at most MAX_URLS_PER_GROUP
+        self.urls = []
+
+    @property
+    def key(self):
+        return self.workflow_name, self.branch, self.author
+
+    def add(self, run):
+        created_at = parser.parse(run['created_at'])
+        self.count += 1
+        self.conclusions[run['conclusion']] += 1
+        self.commits.add((run.get('head_commit') or {}).get('id'))
+        if self.first is None or created_at < self.first:
+            self.first = created_at
+        if self.last is None or created_at > self.last:
+            self.last = created_at
+
+        self.urls.append((created_at, run['html_url']))
+        self.urls.sort(reverse=True)
+        del self.urls[MAX_URLS_PER_GROUP:]
+
+
+def group_failures(runs, workflow_names):
+    """
+    Collapse runs into FailureGroups, most recent failure first.
+
+    :param runs: workflow runs, as returned by GitHubClient.get_workflow_runs
+    :param workflow_names: dict of workflow id to name
+    """
+    groups = {}
+    for run in runs:
+        workflow_name = workflow_names.get(workflow_id(run), workflow_id(run))
+        key = (workflow_name, run.get('head_branch'), commit_author(run))
+        if key not in groups:
+            groups[key] = FailureGroup(*key)
+        groups[key].add(run)
+
+    return sorted(groups.values(), key=lambda group: group.last, reverse=True)
+
+
+def notice_text(group, repo):
+    """ Formatting for the text message of one group, at most MAX_NOTICE_BYTES long. """
+    lines = [
+        "",
+        "s2n GitHub Action monitor notice",
+        f"State: {', '.join(f'{conclusion} x{n}' for conclusion, n in sorted(group.conclusions.items()))}",
+        f"Repo: {repo}",
+        f"Workflow name: {group.workflow_name}",
+        f"Branch: {group.branch}",
+        f"started by: {group.author}",
+        f"Failures: {group.count} across {len(group.commits)} commit(s)",
+        f"GHA failure time: {group.first.isoformat()}" if group.count == 1 else
+        f"GHA failure times: {group.first.isoformat()} to {group.last.isoformat()}",
+    ]
+    lines.extend(f"URL: {url}" for _, url in group.urls)
+    if group.count > len(group.urls):
+        lines.append(f"... and {group.count - len(group.urls)} more")
+    text = "\n".join(lines) + "\n"
+
+    encoded = text.encode('utf-8')
+    if len(encoded) > MAX_NOTICE_BYTES:
+        marker = "\n[truncated]\n"
+        text = encoded[:MAX_NOTICE_BYTES - len(marker)].decode('utf-8', errors='ignore') + marker
+    return text
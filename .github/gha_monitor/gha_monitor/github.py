@@ -1,8 +1,88 @@
+import collections
+import concurrent.futures
+import json
 import logging
+import math
+import os
+import threading
 from agithub import GitHub
+from dateutil import parser
+from urllib.parse import urlparse
 
 logger = logging.getLogger()
 
+# The most runs the API returns per page
+RUNS_PER_PAGE = 100
+
+# Only these fields of a workflow run are used, so only these are cached
+RUN_FIELDS = ('id', 'conclusion', 'created_at', 'html_url', 'head_branch', 'head_commit', 'workflow_url')
+
+
+class ResponseCache:
+    """
+    State kept between invocations in a JSON file: the ETag and body of every
+    page of runs fetched last time, and an LRU cache of workflow names.
+
+    GitHub answers a request with a matching If-None-Match header with a 304,
+    which doesn't count against the rate limit, so unchanged pages are free.
+    """
+    MAX_WORKFLOW_NAMES = 256
+
+    def __init__(self, path):
+        self.path = path
+        self.pages = {}
+        self.workflow_names = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+                self.pages = state.get('pages', {})
+                self.workflow_names = collections.OrderedDict(state.get('workflow_names', []))
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable cache {path}: {e}")
+
+    def get_page(self, key):
+        with self._lock:
+            return self.pages.get(key)
+
+    def set_page(self, key, etag, body):
+        with self._lock:
+            self.pages[key] = {'etag': etag, 'body': body}
+
+    def get_workflow_name(self, workflow_id):
+        with self._lock:
+            name = self.workflow_names.get(workflow_id)
+            if name is not None:
+                self.workflow_names.move_to_end(workflow_id)
+            return name
+
+    def set_workflow_name(self, workflow_id, name):
+        with self._lock:
+            self.workflow_names[workflow_id] = name
+            self.workflow_names.move_to_end(workflow_id)
+            while len(self.workflow_names) > self.MAX_WORKFLOW_NAMES:
+                self.workflow_names.popitem(last=False)
+
+    def save(self, keep_pages):
+        """
+        Write the cache, keeping only the pages fetched this time.
+        """
+        if self.path is None:
+            return
+
+        with self._lock:
+            state = {
+                'pages': {k: v for k, v in self.pages.items() if k in keep_pages},
+                'workflow_names': list(self.workflow_names.items()),
+            }
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(self.path + '.tmp', self.path)
+
 
 class GitHubClient:
     # Over-ride
@@ -10,16 +90,51 @@ class GitHubClient:
         'github_username': None,
         'secret': None,
         'repo_organization': None,
-        'repo': None
+        'repo': None,
+        # Where ResponseCache is kept between invocations, None to disable it
+        'cache_file': None,
+        # Number of concurrent API requests
+        'max_workers': 4,
+        # e.g. http://localhost:8080 for a local stand-in, None for api.github.com
+        'api_url': None,
     }
 
     def __init__(self):
-        self._github = GitHub.GitHub(username=self.params['github_username'], password=self.params['github_password'],
-                                     token=self.params['token'])
+        self._github = self._new_client()
+        # agithub keeps the last response's headers on the client, so every thread gets its own
+        self._local = threading.local()
+        self._local.github = self._github
         self.response = {}
         self.worklog = None
         self.repo_org = self.params['repo_organization']
         self.repo = self.params['repo']
+        self.cache = ResponseCache(self.params.get('cache_file'))
+        self._pages_used = set()
+
+    def _new_client(self):
+        api_url = self.params.get('api_url')
+        if not api_url:
+            return GitHub.GitHub(username=self.params['github_username'], password=self.params['github_password'],
+                                 token=self.params['token'])
+
+        url = urlparse(api_url)
+        if url.scheme == 'https':
+            github = GitHub.GitHub(username=self.params['github_username'], password=self.params['github_password'],
+                                   token=self.params['token'], api_url=url.netloc)
+        else:
+            # agithub refuses to send credentials over plain HTTP, and a local stand-in doesn't need them
+            logging.info(f"Not sending credentials to {api_url}")
+            github = GitHub.GitHub(api_url=url.netloc)
+        # agithub always uses HTTPS, but a local stand-in may not
+        github.client.prop.secure_http = url.scheme == 'https'
+        github.client.prop.url_prefix = url.path.rstrip('/') or None
+        return github
+
+    def _client(self):
+        github = getattr(self._local, 'github', None)
+        if github is None:
+            github = self._local.github = self._new_client()
+        return github
 
     def get_workflow_log_chunk(self, chunk=1, final_state='failure'):
         """
@@ -40,14 +155,93 @@ class GitHubClient:
                                                                           status=final_state)
         return status_code
 
+    def _get_runs_page(self, page, final_state):
+        """
+        Fetch one page of runs, conditionally if it was cached last time.
+        Returns (total_count, runs).
+        """
+        key = f"{self.repo_org}/{self.repo}/runs?status={final_state}&page={page}"
+        cached = self.cache.get_page(key)
+        headers = {'If-None-Match': cached['etag']} if cached is not None else {}
+
+        github = self._client()
+        (status_code, response) = \
+            github.repos[self.repo_org][self.repo].actions.runs.get(page=page, per_page=RUNS_PER_PAGE,
+                                                                    status=final_state, headers=headers)
+        self._pages_used.add(key)
+
+        if status_code == 304:
+            logging.debug(f"Page {page} is unchanged")
+            body = cached['body']
+        elif status_code == 200:
+            body = {
+                'total_count': response['total_count'],
+                'workflow_runs': [{k: run.get(k) for k in RUN_FIELDS} for run in response['workflow_runs']],
+            }
+            etag = dict((k.lower(), v) for k, v in github.getheaders()).get('etag')
+            if etag is not None:
+                self.cache.set_page(key, etag, body)
+        else:
+            raise RuntimeError(f"GitHub returned {status_code} for page {page} of runs: {response}")
+
+        return body['total_count'], body['workflow_runs']
+
+    def get_workflow_runs(self, since, final_state='failure'):
+        """
+        Return every run with the final state created after since, newest first.
+
+        The first page gives the total number of runs. The remaining pages
+        are fetched max_workers at a time, and paging stops at the first batch
+        reaching a run older than since. The runs are also kept in self.worklog.
+        """
+        total_count, first_page = self._get_runs_page(1, final_state)
+        # The pages are cached, so don't extend them in place
+        runs = list(first_page)
+        pages = math.ceil(total_count / RUNS_PER_PAGE)
+
+        def older_than_window(page_runs):
+            return any(parser.parse(run['created_at']) <= since for run in page_runs)
+
+        next_page = 2
+        reached_window_end = older_than_window(runs)
+        max_workers = self.params.get('max_workers', 4)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while not reached_window_end and next_page <= pages:
+                batch = range(next_page, min(next_page + max_workers, pages + 1))
+                for _, page_runs in executor.map(lambda p: self._get_runs_page(p, final_state), batch):
+                    runs.extend(page_runs)
+                    reached_window_end = reached_window_end or older_than_window(page_runs)
+                next_page += len(batch)
+
+        logging.info(f"Fetched {next_page - 1} of {pages} pages of {final_state} runs")
+        self.worklog = [run for run in runs if parser.parse(run['created_at']) > since]
+        return self.worklog
+
     def get_workflow_name(self, workflow_id):
+        workflow_name = self.cache.get_workflow_name(workflow_id)
+        if workflow_name is not None:
+            return workflow_name
+
         logging.debug(f"Looking up workflow_id {workflow_id}")
         (status_code, response) = \
-            self._github.repos[self.repo_org][self.repo].actions.workflows[workflow_id].get()
+            self._client().repos[self.repo_org][self.repo].actions.workflows[workflow_id].get()
         workflow_name = response['name']
         logging.debug(f"Github workflow lookup gave us {workflow_name}")
+        self.cache.set_workflow_name(workflow_id, workflow_name)
         return workflow_name
 
+    def get_workflow_names(self, workflow_ids):
+        """
+        Return a dict of workflow id to name. Each id is only looked up once,
+        and names already in the cache aren't looked up at all.
+        """
+        workflow_ids = sorted(set(workflow_ids))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.params.get('max_workers', 4)) as executor:
+            return dict(zip(workflow_ids, executor.map(self.get_workflow_name, workflow_ids)))
+
+    def save_cache(self):
+        self.cache.save(self._pages_used)
+
 
 class GitHubWorklog:
     def __init__(self, worklog):
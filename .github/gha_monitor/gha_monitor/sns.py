@@ -14,13 +14,39 @@
 import boto3
 
 
+# SNS rejects larger messages
+MAX_MESSAGE_BYTES = 256 * 1024
+
+
 class SNSClient:
-    params = {'topic_arn': None}
+    params = {'topic_arn': None, 'endpoint_url': None}
 
     def __init__(self):
-        self.client = boto3.client('sns')
+        # endpoint_url points at an SNS compatible stand-in for testing
+        self.client = boto3.client('sns', endpoint_url=self.params.get('endpoint_url'))
 
     def publish(self, message: None):
         """ Make the boto call """
         response = self.client.publish(TopicArn=self.params['topic_arn'], Message=message)
         return response
+
+    def publish_batch(self, messages, separator="\n"):
+        """
+        Publish messages joined together, in as few publish calls as SNS's
+        size limit allows. Returns the responses.
+        """
+        responses = []
+        batch = []
+        batch_bytes = 0
+        for message in messages:
+            message_bytes = len(message.encode('utf-8')) + len(separator)
+            if batch and batch_bytes + message_bytes > MAX_MESSAGE_BYTES:
+                responses.append(self.publish(separator.join(batch)))
+                batch = []
+                batch_bytes = 0
+            batch.append(message)
+            batch_bytes += message_bytes
+
+        if batch:
+            responses.append(self.publish(separator.join(batch)))
+        return responses
@@ -0,0 +1,124 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+A local stand-in for the parts of the GitHub API the monitor uses, serving
+a recorded list of runs such as tests/force_push_failure_response.json:
+
+    python -m gha_monitor.standin --runs tests/force_push_failure_response.json --port 8080 --now
+    GITHUB_API_URL=http://localhost:8080 GHA_MONITOR_DRY_RUN=1 python -m gha_monitor
+
+Pages of runs are served with an ETag and answer If-None-Match with a 304,
+like GitHub does.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import re
+from datetime import datetime
+from dateutil import parser, tz
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+RUNS_PATH = re.compile(r'^/repos/[^/]+/[^/]+/actions/runs$')
+WORKFLOW_PATH = re.compile(r'^/repos/[^/]+/[^/]+/actions/workflows/([^/]+)$')
+
+
+def load_runs(path, now=False):
+    """
+    Load the recorded runs, newest first. With now, the creation times are
+    shifted so the newest run was created now.
+    """
+    with open(path) as f:
+        runs = json.load(f)['workflow_runs']
+    runs.sort(key=lambda run: parser.parse(run['created_at']), reverse=True)
+
+    if now and runs:
+        shift = datetime.now().astimezone(tz.UTC) - parser.parse(runs[0]['created_at'])
+        for run in runs:
+            created_at = parser.parse(run['created_at']) + shift
+            run['created_at'] = created_at.strftime('%Y-%m-%dT%H:%M:%SZ')
+    return runs
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Set by serve()
+    runs = []
+
+    def _send_json(self, body):
+        data = json.dumps(body).encode('utf-8')
+        etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if RUNS_PATH.match(url.path):
+            page = int(query.get('page', ['1'])[0])
+            per_page = int(query.get('per_page', ['30'])[0])
+            runs = self.runs
+            if 'status' in query:
+                runs = [run for run in runs if run.get('conclusion') == query['status'][0]]
+            self._send_json({
+                'total_count': len(runs),
+                'workflow_runs': runs[(page - 1) * per_page:page * per_page],
+            })
+            return
+
+        workflow = WORKFLOW_PATH.match(url.path)
+        if workflow:
+            workflow_id = workflow.group(1)
+            self._send_json({'id': int(workflow_id) if workflow_id.isdigit() else workflow_id,
+                             'name': f"Workflow {workflow_id}"})
+            return
+
+        self.send_error(404)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+def serve(runs, host, port):
+    StandInHandler.runs = runs
+    server = ThreadingHTTPServer((host, port), StandInHandler)
+    logging.info(f"Serving {len(runs)} runs on http://{host}:{server.server_port}")
+    server.serve_forever()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--runs', required=True, help='JSON file with a workflow_runs list')
+    arg_parser.add_argument('--host', default='localhost')
+    arg_parser.add_argument('--port', default=8080, type=int)
+    arg_parser.add_argument('--now', action='store_true', help='Shift the runs so the newest was created now')
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(load_runs(args.runs, args.now), args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import json
+import logging
+import os
+from dateutil import parser
+
+logger = logging.getLogger()
+
+
+def _split_s3(location):
+    bucket, _, key = location[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def _s3_client():
+    import boto3
+    # S3_ENDPOINT_URL points at any S3 compatible store, e.g. a local stand-in
+    return boto3.client('s3', endpoint_url=os.getenv('S3_ENDPOINT_URL'))
+
+
+def read_location(location):
+    """ Return the contents of a local file or s3://bucket/key, or None if it doesn't exist. """
+    if location.startswith('s3://'):
+        client = _s3_client()
+        bucket, key = _split_s3(location)
+        try:
+            return client.get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8')
+        except client.exceptions.NoSuchKey:
+            return None
+
+    if not os.path.exists(location):
+        return None
+    with open(location) as f:
+        return f.read()
+
+
+def write_location(location, data):
+    """ Replace the contents of a local file or s3://bucket/key. """
+    if location.startswith('s3://'):
+        bucket, key = _split_s3(location)
+        _s3_client().put_object(Bucket=bucket, Key=key, Body=data.encode('utf-8'))
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(location)), exist_ok=True)
+    with open(location + '.tmp', 'w') as f:
+        f.write(data)
+    os.replace(location + '.tmp', location)
+
+
+class Cursor:
+    """
+    Where the last invocation stopped: the time it checked up to (the
+    high-water mark), and the ids of the runs it reported that were created
+    within `overlap` of that time.
+
+    Runs are listed by creation time but only show up as failed once they
+    complete, so the next invocation looks back `overlap` before the mark
+    and skips the runs it already reported.
+    """
+
+    def __init__(self, location, overlap):
+        self.location = location
+        self.overlap = overlap
+        self.high_water_mark = None
+        # Reported run id -> creation time
+        self.seen = {}
+
+    def load(self):
+        data = read_location(self.location) if self.location else None
+        if data is None:
+            logging.info("No cursor found, starting from the time window")
+            return self
+
+        state = json.loads(data)
+        if state.get('high_water_mark') is not None:
+            self.high_water_mark = parser.parse(state['high_water_mark'])
+        self.seen = {int(run_id): parser.parse(created_at) for run_id, created_at in state.get('seen', {}).items()}
+        logging.info(f"Resuming from {self.high_water_mark}")
+        return self
+
+    def since(self, default):
+        """ The oldest creation time a new run can have. """
+        if self.high_water_mark is None:
+            return default
+        return self.high_water_mark - self.overlap
+
+    def is_new(self, run):
+        return run['id'] not in self.seen
+
+    def advance(self, runs, checked_at):
+        """
+        Mark runs as reported and move the mark to checked_at, forgetting the
+        runs too old to be listed again.
+        """
+        for run in runs:
+            self.seen[run['id']] = parser.parse(run['created_at'])
+
+        self.high_water_mark = checked_at
+        oldest = self.since(None)
+        self.seen = {run_id: created_at for run_id, created_at in self.seen.items() if created_at >= oldest}
+
+    def save(self):
+        if not self.location:
+            return
+
+        write_location(self.location, json.dumps({
+            'high_water_mark': self.high_water_mark.isoformat() if self.high_water_mark is not None else None,
+            'seen': {str(run_id): created_at.isoformat() for run_id, created_at in self.seen.items()},
+        }))
@@ -21,6 +21,8 @@
 #include <sys/mman.h>
 #include <poll.h>
 #include <netdb.h>
+#include <dirent.h>
+#include <limits.h>
 
 #include <stdlib.h>
 #include <signal.h>
@@ -44,7 +46,8 @@
 #include "tls/s2n_tls13.h"
 #include "utils/s2n_safety.h"
 
-#define MAX_CERTIFICATES 50
+#define CERT_SUFFIX "_cert.pem"
+#define KEY_SUFFIX "_key.pem"
 
 static char default_certificate_chain[] =
     "-----BEGIN CERTIFICATE-----"
@@ -231,6 +234,105 @@ static uint8_t unsafe_verify_host_fn(const char *host_name, size_t host_name_len
     return 1;
 }
 
+/* A growable list of PEM encoded certificates or private keys */
+struct pem_list {
+    const char **pems;
+    int count;
+    int capacity;
+};
+
+static void pem_list_add(struct pem_list *list, const char *pem)
+{
+    if (list->count == list->capacity) {
+        list->capacity = list->capacity ? list->capacity * 2 : 16;
+        list->pems = realloc(list->pems, list->capacity * sizeof(*list->pems));
+        if (list->pems == NULL) {
+            fprintf(stderr, "Error allocating memory for %d certificates\n", list->capacity);
+            exit(1);
+        }
+    }
+
+    list->pems[list->count++] = pem;
+}
+
+static void pem_list_append(struct pem_list *list, const char *path)
+{
+    char *pem = load_file_to_cstring(path);
+    if (pem == NULL) {
+        exit(1);
+    }
+
+    pem_list_add(list, pem);
+}
+
+static int compare_names(const void *a, const void *b)
+{
+    return strcmp(*(char *const *) a, *(char *const *) b);
+}
+
+/* Load every <name>_cert.pem in a directory, and the matching <name>_key.pem.
+ * Files are loaded in alphabetical order, so the first certificate of each type is the default.
+ */
+static void load_cert_dir(const char *dir, struct pem_list *certificates, struct pem_list *private_keys)
+{
+    DIR *dirp = opendir(dir);
+    if (dirp == NULL) {
+        fprintf(stderr, "Error opening certificate directory '%s': %s\n", dir, strerror(errno));
+        exit(1);
+    }
+
+    char **names = NULL;
+    int num_names = 0;
+    int capacity = 0;
+    const size_t suffix_len = strlen(CERT_SUFFIX);
+    struct dirent *entry = NULL;
+    while ((entry = readdir(dirp)) != NULL) {
+        const size_t name_len = strlen(entry->d_name);
+        if (name_len <= suffix_len || strcmp(entry->d_name + name_len - suffix_len, CERT_SUFFIX) != 0) {
+            continue;
+        }
+
+        if (num_names == capacity) {
+            capacity = capacity ? capacity * 2 : 16;
+            names = realloc(names, capacity * sizeof(*names));
+            if (names == NULL) {
+                fprintf(stderr, "Error allocating memory for %d certificate names\n", capacity);
+                exit(1);
+            }
+        }
+
+        names[num_names] = malloc(name_len + 1);
+        if (names[num_names] == NULL) {
+            fprintf(stderr, "Error allocating memory for certificate name\n");
+            exit(1);
+        }
+        memcpy(names[num_names], entry->d_name, name_len + 1);
+        num_names++;
+    }
+    closedir(dirp);
+
+    qsort(names, num_names, sizeof(*names), compare_names);
+
+    for (int i = 0; i < num_names; i++) {
+        char cert_path[PATH_MAX];
+        char key_path[PATH_MAX];
+        const int prefix_len = (int) (strlen(names[i]) - suffix_len);
+        const int cert_path_len = snprintf(cert_path, sizeof(cert_path), "%s/%s", dir, names[i]);
+        const int key_path_len = snprintf(key_path, sizeof(key_path), "%s/%.*s%s", dir, prefix_len, names[i], KEY_SUFFIX);
+        if (cert_path_len < 0 || (size_t) cert_path_len >= sizeof(cert_path)
+                || key_path_len < 0 || (size_t) key_path_len >= sizeof(key_path)) {
+            fprintf(stderr, "Error loading '%s' from '%s': the path is longer than %d bytes\n", names[i], dir, PATH_MAX - 1);
+            exit(1);
+        }
+
+        pem_list_append(certificates, cert_path);
+        pem_list_append(private_keys, key_path);
+        free(names[i]);
+    }
+
+    free(names);
+}
+
 void usage()
 {
     fprintf(stderr, "usage: s2nd [options] host port\n");
@@ -246,6 +348,9 @@ void usage()
     fprintf(stderr, "    Path to a PEM encoded certificate [chain]. Option can be repeated to load multiple certs.\n");
     fprintf(stderr, "  --key\n");
     fprintf(stderr, "    Path to a PEM encoded private key that matches cert. Option can be repeated to load multiple certs.\n");
+    fprintf(stderr, "  --cert-dir [directory path]\n");
+    fprintf(stderr, "    Load every <name>" CERT_SUFFIX " in the directory, with the private key in <name>" KEY_SUFFIX ".\n");
+    fprintf(stderr, "    Can be combined with --cert and --key.\n");
     fprintf(stderr, "  -m\n");
     fprintf(stderr, "  --mutualAuth\n");
     fprintf(stderr, "    Request a Client Certificate. Any RSA Certificate will be accepted.\n");
@@ -399,10 +504,8 @@ int main(int argc, char *const *argv)
      * The associated private key for each cert will be at the same index in private_keys. If the user mixes up the
      * order of --cert --key for a given cert/key pair, s2n will fail to load the cert and s2nd will exit.
      */
-    int num_user_certificates = 0;
-    int num_user_private_keys = 0;
-    const char *certificates[MAX_CERTIFICATES] = { 0 };
-    const char *private_keys[MAX_CERTIFICATES] = { 0 };
+    struct pem_list certificates = { 0 };
+    struct pem_list private_keys = { 0 };
 
     struct conn_settings conn_settings = { 0 };
     int fips_mode = 0;
@@ -427,6 +530,7 @@ int main(int argc, char *const *argv)
         {"parallelize", no_argument, &parallelize, 1},
         {"prefer-throughput", no_argument, NULL, 'p'},
         {"cert", required_argument, NULL, 'r'},
+        {"cert-dir", required_argument, NULL, 'R'},
         {"self-service-blinding", no_argument, NULL, 's'},
         {"ca-dir", required_argument, 0, 'd'},
         {"ca-file", required_argument, 0, 't'},
@@ -470,12 +574,7 @@ int main(int argc, char *const *argv)
             usage();
             break;
         case 'k':
-            if (num_user_private_keys == MAX_CERTIFICATES) {
-                fprintf(stderr, "Cannot support more than %d certificates!\n", MAX_CERTIFICATES);
-                exit(1);
-            }
-            private_keys[num_user_private_keys] = load_file_to_cstring(optarg);
-            num_user_private_keys++;
+            pem_list_append(&private_keys, optarg);
             break;
         case 'l':
             conn_settings.prefer_low_latency = 1;
@@ -493,12 +592,10 @@ int main(int argc, char *const *argv)
             conn_settings.prefer_throughput = 1;
             break;
         case 'r':
-            if (num_user_certificates == MAX_CERTIFICATES) {
-                fprintf(stderr, "Cannot support more than %d certificates!\n", MAX_CERTIFICATES);
-                exit(1);
-            }
-            certificates[num_user_certificates] = load_file_to_cstring(optarg);
-            num_user_certificates++;
+            pem_list_append(&certificates, optarg);
+            break;
+        case 'R':
+            load_cert_dir(optarg, &certificates, &private_keys);
             break;
         case 's':
             conn_settings.self_service_blinding = 1;
@@ -644,27 +741,25 @@ int main(int argc, char *const *argv)
         exit(1);
     }
 
-    if (num_user_certificates != num_user_private_keys) {
-        fprintf(stderr, "Mismatched certificate(%d) and private key(%d) count!\n", num_user_certificates, num_user_private_keys);
+    if (certificates.count != private_keys.count) {
+        fprintf(stderr, "Mismatched certificate(%d) and private key(%d) count!\n", certificates.count, private_keys.count);
         exit(1);
     }
 
-    int num_certificates = 0;
-    if (num_user_certificates == 0) {
-        certificates[0] = default_certificate_chain;
-        private_keys[0] = default_private_key;
-        num_certificates = 1;
-    } else {
-        num_certificates = num_user_certificates;
+    if (certificates.count == 0) {
+        pem_list_add(&certificates, default_certificate_chain);
+        pem_list_add(&private_keys, default_private_key);
     }
 
-    for (int i = 0; i < num_certificates; i++) {
+    for (int i = 0; i < certificates.count; i++) {
         struct s2n_cert_chain_and_key *chain_and_key = s2n_cert_chain_and_key_new();
-        GUARD_EXIT(s2n_cert_chain_and_key_load_pem(chain_and_key, certificates[i], private_keys[i]), "Error getting certificate/key");
+        GUARD_EXIT(s2n_cert_chain_and_key_load_pem(chain_and_key, certificates.pems[i], private_keys.pems[i]), "Error getting certificate/key");
 
         GUARD_EXIT(s2n_config_add_cert_chain_and_key_to_store(config, chain_and_key), "Error setting certificate/key");
     }
 
+    printf("Loaded %d certificates\n", certificates.count);
+
     if (ocsp_response_file_path) {
         int fd = open(ocsp_response_file_path, O_RDONLY);
         if (fd < 0) {
@@ -16,6 +16,7 @@ copywrite = """# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserv
 
 import argparse
 import boto3
+import cfn_flip
 import configparser
 import hashlib
 import json
@@ -35,6 +36,11 @@ from troposphere.codebuild import Artifacts, Environment, Source, Project
 logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Kept in --output-dir between runs: the template fragment built for each config section, keyed by section_key(),
+# and the sha256 of the template last deployed to each stack.
+SECTION_CACHE = ".section_cache.json"
+DEPLOYED = ".deployed.json"
+
 
 def build_cw_event(template=Template, project_name=None, role=None, target_job=None, hour=12, input_json=None):
     """ Create a CloudWatch Event to run a CodeBuild Project. """
@@ -312,8 +318,77 @@ def display_change_set(description):
         logging.info("Summary of changes: {}".format("".join(items)))
 
 
-def modify_existing_stack(client, config, codebuild):
-    """Modify and exist Codebuild project's CloudFormation stack"""
+def load_template(path):
+    """ Load a CloudFormation template written by this script, or None if there isn't one. """
+    try:
+        with open(path) as fh:
+            return cfn_flip.load_yaml(fh.read())
+    except OSError:
+        return None
+
+
+def diff_values(old, new, path, depth=3):
+    """ List the paths where two parts of a template differ, down to depth levels. """
+    if old == new:
+        return []
+    if depth == 0 or not isinstance(old, dict) or not isinstance(new, dict):
+        return [path]
+
+    changed = []
+    for key in sorted(set(old) | set(new)):
+        changed.extend(diff_values(old.get(key), new.get(key), f"{path}.{key}" if path else key, depth - 1))
+    return changed
+
+
+def diff_templates(old, new):
+    """
+    Compare two templates resource by resource, without calling CloudFormation.
+    Returns a list of (action, logical id, resource type, changed paths), like a change set.
+    """
+    old_resources = old.get('Resources', {})
+    new_resources = new.get('Resources', {})
+    changes = []
+    for logical_id in sorted(set(old_resources) | set(new_resources)):
+        old_resource = old_resources.get(logical_id)
+        new_resource = new_resources.get(logical_id)
+        if old_resource is None:
+            changes.append(("Add", logical_id, new_resource.get('Type'), []))
+        elif new_resource is None:
+            changes.append(("Remove", logical_id, old_resource.get('Type'), []))
+        elif old_resource != new_resource:
+            changes.append(("Modify", logical_id, new_resource.get('Type'), diff_values(old_resource, new_resource, "")))
+
+    # Outputs aren't in change sets, but are listed so nothing is hidden.
+    old_outputs = old.get('Outputs', {})
+    new_outputs = new.get('Outputs', {})
+    for name in sorted(set(old_outputs) | set(new_outputs)):
+        if name not in old_outputs:
+            changes.append(("Add", name, "Output", []))
+        elif name not in new_outputs:
+            changes.append(("Remove", name, "Output", []))
+        elif old_outputs[name] != new_outputs[name]:
+            changes.append(("Modify", name, "Output", []))
+    return changes
+
+
+def display_template_diff(changes, baseline):
+    """Same layout as display_change_set."""
+    if not changes:
+        logging.info(f"No changes from {baseline}")
+        return
+
+    for action, logical_id, resource_type, paths in changes:
+        items = [f"\n\t{'Action':<20} {action:>10}",
+                 f"\n\t{'LogicalResourceId':<20} {logical_id:>10}",
+                 f"\n\t{'ResourceType':<20} {str(resource_type):>10}"]
+        if paths:
+            items.append(f"\n\t{'Changed':<20} {str(paths):>10}")
+        logging.info("Summary of changes: {}".format("".join(items)))
+    logging.info(f"{len(changes)} changes from {baseline}")
+
+
+def modify_existing_stack(client, config, template_body):
+    """Modify and exist Codebuild project's CloudFormation stack. Returns True if the change set was executed."""
     stack_name = config.get("Global", "stack_name")
 
     # ChangeSetNames are required to start with an Alphabetic character, and to be unique.
@@ -322,7 +397,7 @@ def modify_existing_stack(client, config, codebuild):
 
     client.create_change_set(
         StackName=stack_name,
-        TemplateBody=codebuild.to_yaml(),
+        TemplateBody=template_body,
         Capabilities=["CAPABILITY_IAM"],
         ChangeSetName=change_set_name)
 
@@ -337,7 +412,7 @@ def modify_existing_stack(client, config, codebuild):
     if key != "Y":
         logging.info("Exiting without executing change set")
         client.delete_change_set(StackName=stack_name, ChangeSetName=change_set_name)
-        return
+        return False
 
     logging.info(f"Executing {change_set_name}")
     exc = client.execute_change_set(
@@ -347,18 +422,31 @@ def modify_existing_stack(client, config, codebuild):
     waiter = client.get_waiter('stack_update_complete')
     waiter.wait(StackName=stack_name, WaiterConfig={"Delay": 5, "MaxAttempt": 6})
     logging.info(f"Update completed: {exc}")
+    return True
 
 
-def create_new_stack(client, config, codebuild):
-    """Create a new CloudFormation stack for the Codebuild project"""
+def create_new_stack(client, config, template_body):
+    """Create a new CloudFormation stack for the Codebuild project. Returns True once the stack is created."""
+    stack_name = config.get("Global", "stack_name")
     try:
         result = client.create_stack(
-            StackName=config.get("Global", "stack_name"),
-            TemplateBody=codebuild.to_yaml(),
+            StackName=stack_name,
+            TemplateBody=template_body,
             Capabilities=["CAPABILITY_IAM"])
         logging.info("Creating stack {}".format(result['StackId']))
     except client.exceptions.AlreadyExistsException as e:
         logging.error("Stack already exists, you must use the --modify-existing flag to update a stack")
+        return False
+
+    # A stack that fails to create rolls back, and must not be recorded as deployed.
+    waiter = client.get_waiter('stack_create_complete')
+    try:
+        waiter.wait(StackName=stack_name, WaiterConfig={"Delay": 10})
+    except exceptions.WaiterError as e:
+        logging.error(f"Stack creation did not complete: {e}")
+        return False
+    logging.info(f"Created stack {stack_name}")
+    return True
 
 
 def validate_cfn(boto_client: boto3.client, cfn_template: str):
@@ -371,6 +459,69 @@ def validate_cfn(boto_client: boto3.client, cfn_template: str):
         raise SystemExit(f"Failed: {e}")
 
 
+def load_state(path):
+    """ Load one of the JSON files kept in --output-dir, or an empty dict. """
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(path, state):
+    with open(path + '.tmp', 'w') as fh:
+        json.dump(state, fh, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def section_key(config, job):
+    """
+    Hash everything the resources of a config section are built from: this script, the section, the snippet section
+    it takes its values from and the Global and CFNRole sections.
+    """
+    digest = hashlib.sha256()
+    with open(os.path.abspath(__file__), 'rb') as fh:
+        digest.update(fh.read())
+
+    sections = ['Global', 'CFNRole', job]
+    if config.has_option(job, 'snippet'):
+        sections.append(config.get(job, 'snippet'))
+    for section in sections:
+        items = sorted(config.items(section)) if config.has_section(section) else None
+        digest.update(json.dumps([section, items]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def build_section(config, job, cw_event_role):
+    """ Build the resources and outputs of one CodeBuild or CloudWatchEvent config section, as a template dict. """
+    fragment = Template()
+    if ':' in job:
+        job_title = job.split(':')[1]
+    if 'CodeBuild:' in job:
+        service_role = build_codebuild_role(config, template=fragment, project_name=job_title).to_dict()
+
+        # Pull the env out of the section, and use the snippet for the other values.
+        # Note: only env is over-ridden with snippets.
+        if 'snippet' in config[job]:
+            build_project(template=fragment, project_name=job_title, section=config.get(job, 'snippet'),
+                          service_role=service_role['Ref'], raw_env=config.get(job, 'env'))
+        else:
+            build_project(template=fragment, project_name=job_title, section=job, service_role=service_role['Ref'])
+
+        # Scheduled runs triggered by CloudWatch.
+        build_cw_event(template=fragment, project_name=job_title, role=cw_event_role)
+    if 'CloudWatchEvent' in job:
+        # CloudWatch input allows us to over-ride environment variables passed to codebuild.
+        cw_input = json.loads(config.get(job, 'input'))
+        # Note that for Cloudwatch, we're need to reference an existing CodeBuild Job.
+        build_cw_event(template=fragment, project_name=job_title, target_job=config.get(job, 'build_job_name'),
+                       role=cw_event_role,
+                       hour=config.get(job, 'start_time'), input_json=cw_input)
+
+    fragment = fragment.to_dict()
+    return {part: fragment.get(part, {}) for part in ('Resources', 'Outputs')}
+
+
 def main(args, config):
     """ Create the CFN template and do stuff with said template. """
     codebuild = Template()
@@ -378,62 +529,94 @@ def main(args, config):
     # Create a single CloudWatch Event role to allow codebuild:startBuild
     cw_event_role = build_cw_cb_role(codebuild, config)
     temp_yaml_filename = args.output_dir + "/s2n_codebuild_projects.yml"
+    section_cache_filename = os.path.join(args.output_dir, SECTION_CACHE)
+    deployed_filename = os.path.join(args.output_dir, DEPLOYED)
 
     # Role used by GitHub Actions.
     if config.has_option('Global', 'create_github_role') and config.getboolean('Global', 'create_github_role'):
         build_github_role(codebuild, config)
 
-    # Walk the config file, adding each stanza to the Troposphere template.
+    # Walk the config file, adding each stanza to the template. Only the stanzas that changed since the last run are
+    # built again, the others come from the section cache.
+    template = codebuild.to_dict()
+    section_cache = load_state(section_cache_filename)
+    new_section_cache = {}
     for job in config.sections():
-        if ':' in job:
-            job_title = job.split(':')[1]
-        if 'CodeBuild:' in job:
-            service_role = build_codebuild_role(config,template=codebuild, project_name=job_title).to_dict()
-
-            # Pull the env out of the section, and use the snippet for the other values.
-            # Note: only env is over-ridden with snippets.
-            if 'snippet' in config[job]:
-                build_project(template=codebuild, project_name=job_title, section=config.get(job, 'snippet'),
-                              service_role=service_role['Ref'], raw_env=config.get(job, 'env'))
-            else:
-                build_project(template=codebuild, project_name=job_title, section=job, service_role=service_role['Ref'])
-
-            # Scheduled runs triggered by CloudWatch.
-            build_cw_event(template=codebuild, project_name=job_title, role=cw_event_role)
-        if 'CloudWatchEvent' in job:
-            # CloudWatch input allows us to over-ride environment variables passed to codebuild.
-            cw_input = json.loads(config.get(job, 'input'))
-            # Note that for Cloudwatch, we're need to reference an existing CodeBuild Job.
-            build_cw_event(template=codebuild, project_name=job_title, target_job=config.get(job, 'build_job_name'),
-                           role=cw_event_role,
-                           hour=config.get(job, 'start_time'), input_json=cw_input)
-
-    # Write out a CloudFormation template.  This is ephemeral and is not used again.
+        if 'CodeBuild:' not in job and 'CloudWatchEvent' not in job:
+            continue
+        key = section_key(config, job)
+        fragment = section_cache.get(key) or build_section(config, job, cw_event_role)
+        new_section_cache[key] = fragment
+        for part in ('Resources', 'Outputs'):
+            template.setdefault(part, {}).update(fragment[part])
+    save_state(section_cache_filename, new_section_cache)
+    logging.info(f"Built {len(set(new_section_cache) - set(section_cache))} of {len(new_section_cache)} config sections")
+
+    # Serialize the template once, the same way Template.to_yaml() does.
+    template_body = cfn_flip.to_yaml(json.dumps(template, indent=4, sort_keys=True))
+    template_hash = hashlib.sha256(template_body.encode('utf-8')).hexdigest()
+
+    # Compare against the last template deployed from here, or else the last one written, before it is overwritten.
+    stack_name = config.get("Global", "stack_name")
+    deployed_yaml_filename = os.path.join(args.output_dir, f"deployed-{stack_name}.yml")
+    baseline = deployed_yaml_filename if os.path.exists(deployed_yaml_filename) else temp_yaml_filename
+    previous = load_template(baseline)
+
+    # Write out a CloudFormation template, with its hash next to it.
     with(open(temp_yaml_filename, 'w')) as fh:
-        fh.write(codebuild.to_yaml())
-        logging.info(f"Wrote cfn yaml file to {temp_yaml_filename}")
+        fh.write(template_body)
+    with(open(temp_yaml_filename + ".sha256", 'w')) as fh:
+        fh.write(template_hash + "\n")
+    logging.info(f"Wrote cfn yaml file to {temp_yaml_filename} (sha256 {template_hash})")
+
+    changes = None
+    if previous is not None and (args.diff or args.modify_existing):
+        changes = diff_templates(previous, cfn_flip.load_yaml(template_body))
+        display_template_diff(changes, baseline)
+
+    if args.noop or args.diff:
+        logging.info(f"Respecting {'diff' if args.diff else 'noop'}, Done.")
+        return
 
-    if args.noop:
-        logging.info("Respecting noop, Done.")
+    deployed = load_state(deployed_filename)
+    if deployed.get(stack_name) == template_hash and not args.force:
+        logging.info(f"The template is unchanged since it was last deployed to {stack_name}, Done.")
         return
-    else:
-        # Fire up the boto, exit gracefully if the user doesn't have creds setup.
-        client = boto3.client('cloudformation', region_name=config.get('Global', 'aws_region'))
-        try:
-            validate_cfn(client, codebuild.to_yaml())
-        except exceptions.NoCredentialsError:
-            raise SystemExit(f"Something went wrong with your AWS credentials;  Exiting.")
-
-        # Default to not making changes
-        if not args.production:
-            logging.info('Production flag not set, skipping mutating behavior.')
+
+    # The local diff is enough to back out, only go to CloudFormation if the changes are wanted. The last template
+    # written may never have been deployed, so only a diff against the deployed one can show there's nothing to do.
+    if changes is not None and args.production and args.modify_existing:
+        if not changes and baseline == deployed_yaml_filename and not args.force:
+            logging.info("Nothing to change, Done.")
+            return
+        key = input('\nCreate a change set for these changes? [Y/n]')
+        if key != "Y":
+            logging.info("Exiting without contacting CloudFormation")
             return
 
-        if args.modify_existing is True:
-            modify_existing_stack(client, config, codebuild)
-        else:
-            create_new_stack(client, config, codebuild)
+    # Fire up the boto, exit gracefully if the user doesn't have creds setup.
+    client = boto3.client('cloudformation', region_name=config.get('Global', 'aws_region'))
+    try:
+        validate_cfn(client, template_body)
+    except exceptions.NoCredentialsError:
+        raise SystemExit(f"Something went wrong with your AWS credentials;  Exiting.")
+
+    # Default to not making changes
+    if not args.production:
+        logging.info('Production flag not set, skipping mutating behavior.')
+        return
+
+    if args.modify_existing is True:
+        changed = modify_existing_stack(client, config, template_body)
+    else:
+        changed = create_new_stack(client, config, template_body)
 
+    if changed:
+        deployed[stack_name] = template_hash
+        save_state(deployed_filename, deployed)
+        # The baseline for the next local diff
+        with(open(deployed_yaml_filename, 'w')) as fh:
+            fh.write(template_body)
 
 
 if __name__ == '__main__':
@@ -447,6 +630,11 @@ if __name__ == '__main__':
     parser.add_argument('--noop', dest='noop', action='store_true',
                         help='Create a local CFN yaml- but do no validation.')
     parser.add_argument('--output-dir', dest='output_dir', default='cfn', help="Directory to write CFN files")
+    parser.add_argument('--diff', dest='diff', action='store_true', default=False,
+                        help='Show the resources changed since the last template deployed from --output-dir (or '
+                             'the last one written there), without contacting CloudFormation.')
+    parser.add_argument('--force', dest='force', action='store_true', default=False,
+                        help='Validate and deploy the template even if it was already deployed from this directory.')
     args = parser.parse_args()
 
     config = configparser.RawConfigParser()
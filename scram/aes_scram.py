@@ -4,7 +4,11 @@ from Crypto import Random
 rndfile = Random.new()
 import hashlib
 import hmac
+import mmap
+import os
 import sys
+import tempfile
+from collections import namedtuple
  
 DEBUG_ENABLED = True
 
@@ -12,6 +16,32 @@ DEBUG_ENABLED = True
 # (Eg "0x0001", 0x00 is the MSB and 0x01 is the LSB, meaning 0x0001 == 1)
 ENDIANNESS = 'big'
 
+# Fixed SCRAM field lengths, in bytes
+NONCE_LEN = 12
+X_LEN = 34
+TAG_LEN = 16
+
+# Constant parts of the S1..S4 derivation strings. These never change, so they are built once rather than on every call.
+S1_CONST = (0x01).to_bytes(4, ENDIANNESS) + bytes(8) + bytes(8) + bytes(16)
+S2_CONST = (0x02).to_bytes(4, ENDIANNESS) + bytes(8) + bytes(8) + bytes(16) + bytes(32)
+S3_CONST = (0x03).to_bytes(4, ENDIANNESS) + bytes(8) + bytes(8)
+S3_SUFFIX = bytes(32)
+S4_CONST = (0x04).to_bytes(4, ENDIANNESS)
+
+# Number of bytes encrypted and authenticated per step by scram_encrypt_file()
+FILE_CHUNK_SIZE = 1024 * 1024
+
+# Status codes returned by scram_decrypt_checked()
+DECRYPT_OK = 0
+DECRYPT_BAD_NONCE_LEN = 1
+DECRYPT_BAD_X_LEN = 2
+DECRYPT_BAD_TAG_LEN = 3
+DECRYPT_BAD_PADDING_LEN = 4
+DECRYPT_BAD_TAG = 5
+
+# Result of scram_decrypt_checked(). M is None unless status is DECRYPT_OK.
+ScramDecryptResult = namedtuple('ScramDecryptResult', ['status', 'M'])
+
 # Convert Integer value to byte string
 def byteStr(val, numBytes):
 	return val.to_bytes(numBytes, ENDIANNESS)
@@ -127,6 +157,99 @@ def scram_encrypt(K, N, A, M, F):
 	return C, X, Tag
 
 
+def scram_encrypt_file(K, N, A, M_path, C_path, F, chunk_size=FILE_CHUNK_SIZE):
+	"""
+	SCRAM Encryption of a file into a file
+	
+	Produces the same C, X and Tag as scram_encrypt(), but M is read through an mmap and C is written straight into
+	an mmap of the output file. The padded message and A || C are never materialized: CTR encryption and the GMAC
+	are fed chunk_size bytes at a time, so peak memory does not depend on the message size.
+	
+	Parameters:
+		K: Key
+		N: Nonce
+		A: Additional Authenticated Data
+		M_path: Path of the Plaintext Message
+		C_path: Path the Ciphertext is written to
+		F: Frame Size
+		chunk_size: Number of bytes processed per step
+		
+	Returns:
+		C_LEN: Ciphertext length written to C_path
+		X: Excrypted R and Padding Len
+		Tag: Authentication Tag
+	"""
+	R = rndfile.read(32)
+	
+	M_LEN = os.path.getsize(M_path)
+	PADDING_LEN = 0
+	
+	if (F > 0):
+		PADDING_LEN = (F - M_LEN) % F
+	
+	PADDING_LEN_STR = byteStr(PADDING_LEN, 2)
+	C_LEN = M_LEN + PADDING_LEN
+	
+	debugInt("len(M)", M_LEN)
+	debugInt("PADDING_LEN", PADDING_LEN)
+	
+	# Derive Message encryption key (KE) and MAC key (KM)
+	KE = hmac.new(K, N + S1_CONST + R, hashlib.sha512).digest()[0:32]
+	KM = hmac.new(K, N + S2_CONST, hashlib.sha512).digest()[0:32]
+	
+	ctr = AES.new(key=KE, mode=AES.MODE_CTR, nonce=N)
+	gmac = AES.new(key=KM, mode=AES.MODE_GCM, nonce=N)
+	gmac.update(A)
+	
+	with open(M_path, 'rb') as m_file, open(C_path, 'w+b') as c_file:
+		c_file.truncate(C_LEN)
+		
+		# mmap() refuses zero length mappings, an empty message with no padding simply has an empty ciphertext
+		if C_LEN > 0:
+			c_map = mmap.mmap(c_file.fileno(), C_LEN)
+			m_map = mmap.mmap(m_file.fileno(), 0, access=mmap.ACCESS_READ) if M_LEN > 0 else b''
+			try:
+				with memoryview(m_map) as m_view, memoryview(c_map) as c_view:
+					offset = 0
+					
+					# Encrypt the message, then the 0x00 padding bytes, through the same CTR keystream
+					while offset < M_LEN:
+						end = min(offset + chunk_size, M_LEN)
+						ctr.encrypt(m_view[offset:end], output=c_view[offset:end])
+						gmac.update(c_view[offset:end])
+						offset = end
+					
+					while offset < C_LEN:
+						end = min(offset + chunk_size, C_LEN)
+						ctr.encrypt(bytes(end - offset), output=c_view[offset:end])
+						gmac.update(c_view[offset:end])
+						offset = end
+				
+				c_map.flush()
+			finally:
+				c_map.close()
+				if M_LEN > 0:
+					m_map.close()
+	
+	T = gmac.digest()
+	
+	# Derive a one-time pad (U3) from T and encrypt R and PaddingLen with it
+	U3 = hmac.new(K, N + S3_CONST + T + S3_SUFFIX, hashlib.sha512).digest()
+	Y1 = bytes(a ^ b for (a,b) in zip (U3[0:32], R))
+	Y0 = bytes(a ^ b for (a,b) in zip (U3[32:34], PADDING_LEN_STR))
+	X = Y1 + Y0
+	
+	# Authenticate (Tag) T and R
+	S4 = N + S4_CONST + byteStr(len(A), 8) + byteStr(M_LEN, 8) + T + R
+	Tag = hmac.new(K, S4, hashlib.sha512).digest()[0:16]
+	
+	debugInt("len(C)", C_LEN)
+	debugByteStr("X", X)
+	debugByteStr("Tag", Tag)
+	
+	return C_LEN, X, Tag
+
+
 def scram_decrypt(K, N, A, C, X, Tag):
 	"""
 	SCRAM Decryption
@@ -172,7 +295,7 @@ def scram_decrypt(K, N, A, C, X, Tag):
 	U4_calculated  = hmac.new(K, S4_calculated, hashlib.sha512).digest()
 	Tag_calculated = U4_calculated[0:16]
 	 
-	if(Tag == Tag_calculated):
+	if(hmac.compare_digest(Tag, Tag_calculated)):
 	    print ("PASSED: Authentication")
 	else:
 	    print ("FAILED: Authentication")
@@ -211,6 +334,65 @@ def scram_decrypt(K, N, A, C, X, Tag):
 	return M_calculated
 
 
+def scram_decrypt_checked(K, N, A, C, X, Tag):
+	"""
+	SCRAM Decryption with early rejection
+	
+	Same algorithm as scram_decrypt(), but intended to be called at high rates (eg as a fuzzing oracle) where most
+	inputs are invalid. The structural lengths of N, X and Tag are validated before any cryptographic work is done,
+	the decrypted padding length is checked against len(C) before the tag is computed, and the tag is compared in
+	constant time. Nothing is printed.
+	
+	Parameters:
+		K: Key
+		N: Nonce
+		A: Additional Authenticated Data
+		C: Ciphertext
+		X: Encrypted Random value R and Padding Length
+		Tag: Tag
+		
+	Returns:
+		ScramDecryptResult(status, M): status is one of the DECRYPT_* codes, M is the decrypted Message when status
+		is DECRYPT_OK and None otherwise
+	"""
+	if len(N) != NONCE_LEN:
+		return ScramDecryptResult(DECRYPT_BAD_NONCE_LEN, None)
+	if len(X) != X_LEN:
+		return ScramDecryptResult(DECRYPT_BAD_X_LEN, None)
+	if len(Tag) != TAG_LEN:
+		return ScramDecryptResult(DECRYPT_BAD_TAG_LEN, None)
+	
+	# Derive MAC key (KM) and T = GMAC (N, A||C, null)
+	KM = hmac.new(K, N + S2_CONST, hashlib.sha512).digest()[0:32]
+	gmac = AES.new(key=KM, mode=AES.MODE_GCM, nonce=N)
+	gmac.update(A)
+	gmac.update(C)
+	T = gmac.digest()
+	
+	# Derive one-time pad U3 from T and recover PADDING_LEN first, so impossible lengths are rejected before U4
+	U3 = hmac.new(K, N + S3_CONST + T + S3_SUFFIX, hashlib.sha512).digest()
+	PADDING_LEN = ((U3[32] ^ X[32]) << 8) | (U3[33] ^ X[33])
+	C_LEN = len(C)
+	if PADDING_LEN > C_LEN:
+		return ScramDecryptResult(DECRYPT_BAD_PADDING_LEN, None)
+	
+	R = (int.from_bytes(U3[0:32], ENDIANNESS) ^ int.from_bytes(X[0:32], ENDIANNESS)).to_bytes(32, ENDIANNESS)
+	M_LEN = C_LEN - PADDING_LEN
+	
+	# Authenticate R
+	# S4 = N || 0x00 0x00 0x00 0x4 || A_LEN_STR || M_LEN_STR || T || R 
+	S4 = N + S4_CONST + byteStr(len(A), 8) + byteStr(M_LEN, 8) + T + R
+	Tag_calculated = hmac.new(K, S4, hashlib.sha512).digest()[0:16]
+	if not hmac.compare_digest(Tag, Tag_calculated):
+		return ScramDecryptResult(DECRYPT_BAD_TAG, None)
+	
+	# Authenticated, derive KE and decrypt
+	KE = hmac.new(K, N + S1_CONST + R, hashlib.sha512).digest()[0:32]
+	PADDED_MSG = AES.new(key=KE, mode=AES.MODE_CTR, nonce=N).decrypt(C)
+	
+	return ScramDecryptResult(DECRYPT_OK, PADDED_MSG[0:M_LEN])
+
+
 def main(argv):
 	# Generate Random 28 Byte Message
 	M = rndfile.read(28)
@@ -238,6 +420,31 @@ def main(argv):
 	else:
 		print("PASSED: Decryption")
 	
+	if(scram_decrypt_checked(K, N, A, C, X, Tag) != (DECRYPT_OK, M)):
+		print ("FAILED: Checked Decryption")
+	else:
+		print("PASSED: Checked Decryption")
+	
+	if(scram_decrypt_checked(K, N, A, C, X, bytes(a ^ 0x01 for a in Tag)).status != DECRYPT_BAD_TAG):
+		print ("FAILED: Checked Decryption Rejects Bad Tag")
+	else:
+		print("PASSED: Checked Decryption Rejects Bad Tag")
+	
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		M_path = os.path.join(tmp_dir, "M")
+		C_path = os.path.join(tmp_dir, "C")
+		with open(M_path, 'wb') as m_file:
+			m_file.write(M)
+		
+		C_LEN, X, Tag = scram_encrypt_file(K, N, A, M_path, C_path, F, chunk_size=16)
+		with open(C_path, 'rb') as c_file:
+			C = c_file.read()
+	
+	if(C_LEN != len(C) or scram_decrypt_checked(K, N, A, C, X, Tag) != (DECRYPT_OK, M)):
+		print ("FAILED: File Encryption")
+	else:
+		print("PASSED: File Encryption")
+	
 	return
 
 if __name__ == "__main__":
@@ -18,26 +18,153 @@
 # before any proof is built.
 
 
+import argparse
+import concurrent.futures
+import hashlib
+import json
 import logging
 import os
 import subprocess
 import sys
+import time
+
+
+CMD = ["make", "-B", "cbmc-batch.yaml"]
+
+# Records the inputs and output of every cbmc-batch.yaml built, so that
+# unchanged proofs are skipped on the next run.
+MANIFEST = ".prepare-manifest.json"
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Build the cbmc-batch.yaml file of every proof.")
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=os.cpu_count(),
+        help="Number of makes to run at once (default: %(default)s)")
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Rebuild every cbmc-batch.yaml, even if its inputs are unchanged")
+    parser.add_argument(
+        "--manifest", default=MANIFEST,
+        help="Where to record the inputs of each build (default: %(default)s)")
+    return parser.parse_args()
+
+
+def hash_file(path, digest):
+    digest.update(path.encode())
+    try:
+        with open(path, "rb") as handle:
+            digest.update(handle.read())
+    except OSError:
+        # A missing input, e.g. an uninitialized submodule, is an input too
+        digest.update(b"<missing>")
+
+
+def input_hash(proof_dir):
+    """Hash the Makefiles that the cbmc-batch.yaml of proof_dir is made from.
+
+    These are the proof's own Makefile and every Makefile* in the directories
+    above it, up to the directory this program runs in.
+    """
+    digest = hashlib.sha256(" ".join(CMD).encode())
+    hash_file(os.path.join(proof_dir, "Makefile"), digest)
+
+    directory = proof_dir
+    while directory not in (".", ""):
+        directory = os.path.dirname(directory)
+        for fyle in sorted(os.listdir(directory or ".")):
+            if fyle.startswith("Makefile"):
+                hash_file(os.path.join(directory, fyle), digest)
+    return digest.hexdigest()
+
+
+def output_hash(proof_dir):
+    digest = hashlib.sha256()
+    hash_file(os.path.join(proof_dir, "cbmc-batch.yaml"), digest)
+    return digest.hexdigest()
+
+
+def load_manifest(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    with open(path + ".tmp", "w") as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def prepare(proof_dir):
+    """Build the cbmc-batch.yaml of one proof.
+
+    Returns (returncode, seconds, output).
+    """
+    start = time.perf_counter()
+    proc = subprocess.run(
+        CMD, cwd=proof_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True)
+    return proc.returncode, time.perf_counter() - start, proc.stdout
 
 
 def main():
-    # Unconditionally rebuild the cbmc-batch.yaml file for every proof in
-    # the source tree, so that the CI parameters for each proof are updated
-    # before the proof is run.
-    cmd = ["make", "-B", "cbmc-batch.yaml"]
-    ok = True
+    args = get_args()
+    manifest = {} if args.force else load_manifest(args.manifest)
+
+    proof_dirs = []
     for root, _, fyles in os.walk("."):
         if "cbmc-batch.yaml" in fyles:
-            proc = subprocess.run(cmd, cwd=root)
-            if proc.returncode:
+            proof_dirs.append(os.path.normpath(root))
+
+    # Unchanged inputs give an unchanged cbmc-batch.yaml, as long as the one
+    # built last time is still there.
+    todo = {}
+    skipped = []
+    for proof_dir in sorted(proof_dirs):
+        inputs = input_hash(proof_dir)
+        entry = manifest.get(proof_dir, {})
+        if entry.get("inputs") == inputs and \
+                entry.get("output") == output_hash(proof_dir):
+            skipped.append(proof_dir)
+        else:
+            todo[proof_dir] = inputs
+
+    # The makes are independent, so run them all, collecting the failures
+    # instead of stopping at the first one.
+    ok = True
+    timings = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            pool.submit(prepare, proof_dir): proof_dir for proof_dir in todo}
+        for future in concurrent.futures.as_completed(futures):
+            proof_dir = futures[future]
+            returncode, seconds, output = future.result()
+            timings.append((seconds, proof_dir, returncode))
+            if returncode:
                 ok = False
+                manifest.pop(proof_dir, None)
                 logging.error(
-                    "Failed to build cbmc-batch.yaml in %s (return code %d)",
-                    root, proc.returncode)
+                    "Failed to build cbmc-batch.yaml in %s (return code %d)\n%s",
+                    proof_dir, returncode, output)
+            else:
+                manifest[proof_dir] = {
+                    "inputs": todo[proof_dir],
+                    "output": output_hash(proof_dir),
+                }
+
+    # Forget the proofs that no longer exist
+    manifest = {k: v for k, v in manifest.items() if k in proof_dirs}
+    save_manifest(args.manifest, manifest)
+
+    for seconds, proof_dir, returncode in sorted(timings, reverse=True):
+        print("%8.2fs  %s%s" % (
+            seconds, proof_dir, "" if returncode == 0 else "  FAILED"))
+    print("Built %d of %d cbmc-batch.yaml files (%d unchanged) in %.2fs of make time" % (
+        len(todo), len(proof_dirs), len(skipped), sum(t[0] for t in timings)))
 
     sys.exit(0 if ok else 1)
 
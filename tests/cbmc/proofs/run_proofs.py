@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+#
+# Copyright Amazon.com Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is
+# located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Runs every proof under the current directory on this machine, as a local
+# alternative to https://github.com/awslabs/aws-batch-cbmc.
+#
+# Proofs run longest first, as many at once as --jobs and the memory budget
+# allow, using the time and peak memory each proof took last time. The result
+# of a proof is reused as long as its harness, the sources it includes, its
+# Makefiles and the version of CBMC are unchanged.
+
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+
+from prepare import hash_file, input_hash
+
+
+# The time, peak memory and result of the last run of every proof
+HISTORY = ".run-proofs-history.json"
+
+PROOF_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SRCDIR = os.path.abspath(os.path.join(PROOF_ROOT, "..", ".."))
+
+# The Makefile variables the source lists are written with, as set by
+# Makefile.common and Makefile-project-defines
+MAKE_VARIABLES = {
+    "SRCDIR": SRCDIR,
+    "PROOF_ROOT": PROOF_ROOT,
+    "PROOF_SOURCE": os.path.join(PROOF_ROOT, "sources"),
+    "PROOF_STUB": os.path.join(PROOF_ROOT, "stubs"),
+    "CBMC_ROOT": PROOF_ROOT,
+}
+INCLUDE_DIRS = [
+    os.path.join(PROOF_ROOT, "include"),
+    SRCDIR,
+    os.path.join(SRCDIR, "api"),
+]
+
+ASSIGNMENT = re.compile(r"^([A-Za-z_]+)\s*([+:?]?=)\s*(.*)$")
+REFERENCE = re.compile(r"\$\(([A-Za-z_]+)\)")
+INCLUDE = re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)
+
+# Proof verdicts. Only SUCCESSFUL and FAILED are cached, errors and timeouts
+# are retried.
+SUCCESSFUL = "SUCCESSFUL"
+FAILED = "FAILED"
+ERROR = "ERROR"
+TIMEOUT = "TIMEOUT"
+CACHED = "CACHED"
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Run every CBMC proof under the current directory.")
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=os.cpu_count(),
+        help="Most proofs to run at once (default: %(default)s)")
+    parser.add_argument(
+        "--memory-gb", type=float,
+        default=os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**30,
+        help="Total memory the running proofs may use (default: all of it, "
+             "%(default).1f)")
+    parser.add_argument(
+        "--default-memory-gb", type=float, default=8,
+        help="Memory to reserve for a proof that hasn't run before "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "--timeout", type=float, default=None,
+        help="Seconds after which a proof is stopped")
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Run every proof, even if its result is cached")
+    parser.add_argument(
+        "--history", default=HISTORY,
+        help="Where the time, memory and result of each proof are kept "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "proofs", nargs="*",
+        help="Proof directories to run (default: every proof)")
+    args = parser.parse_args()
+
+    # Proofs are identified, and their Makefiles found, by their path
+    # relative to the current directory
+    proofs = []
+    for proof in args.proofs:
+        relative = os.path.relpath(os.path.abspath(proof))
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            parser.error("%s is not under the current directory" % proof)
+        proofs.append(relative)
+    args.proofs = proofs
+    return args
+
+
+def find_proofs():
+    proofs = []
+    for root, _, fyles in os.walk("."):
+        if "cbmc-batch.yaml" in fyles and "Makefile" in fyles:
+            proofs.append(os.path.normpath(root))
+    return sorted(proofs)
+
+
+def read_makefile(path, variables):
+    """Collect the assignments of a Makefile, appending for +="""
+    try:
+        with open(path) as handle:
+            lines = handle.read().replace("\\\n", " ").splitlines()
+    except OSError:
+        return
+    for line in lines:
+        match = ASSIGNMENT.match(line.strip())
+        if not match:
+            continue
+        name, operator, value = match.groups()
+        if operator == "+=":
+            variables[name] = (variables.get(name, "") + " " + value).strip()
+        elif operator != "?=" or name not in variables:
+            variables[name] = value
+
+
+def expand(value, variables, depth=0):
+    if depth > 10:
+        return value
+    return REFERENCE.sub(
+        lambda m: expand(variables.get(m.group(1), ""), variables, depth + 1),
+        value)
+
+
+def proof_sources(proof):
+    """The harness and source files a proof's Makefile builds."""
+    variables = dict(MAKE_VARIABLES)
+    read_makefile(os.path.join(PROOF_ROOT, "proofs", "Makefile-project-defines"), variables)
+    read_makefile(os.path.join(proof, "Makefile"), variables)
+    sources = []
+    for name in ("PROOF_SOURCES", "PROJECT_SOURCES"):
+        for source in expand(variables.get(name, ""), variables).split():
+            sources.append(os.path.normpath(os.path.join(proof, source)))
+    return sources
+
+
+def included_files(sources):
+    """The sources, and every header they include, transitively."""
+    seen = set()
+    todo = list(sources)
+    while todo:
+        path = todo.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        try:
+            with open(path, errors="replace") as handle:
+                text = handle.read()
+        except OSError:
+            continue
+        for name in INCLUDE.findall(text):
+            for directory in [os.path.dirname(path)] + INCLUDE_DIRS:
+                candidate = os.path.normpath(os.path.join(directory, name))
+                if os.path.isfile(candidate):
+                    todo.append(candidate)
+                    break
+            # Anything not found is a system header
+    return sorted(seen)
+
+
+def cbmc_version():
+    try:
+        return subprocess.run(
+            ["cbmc", "--version"], stdout=subprocess.PIPE,
+            universal_newlines=True).stdout.strip()
+    except OSError:
+        return "unknown"
+
+
+def proof_key(proof, version):
+    """Identifies everything the result of a proof depends on."""
+    digest = hashlib.sha256(version.encode())
+    digest.update(input_hash(proof).encode())
+    for path in included_files(proof_sources(proof)):
+        hash_file(path, digest)
+    return digest.hexdigest()
+
+
+def verdict(proof):
+    try:
+        with open(os.path.join(proof, "cbmc.txt"), errors="replace") as handle:
+            text = handle.read()
+    except OSError:
+        return ERROR
+    if "VERIFICATION SUCCESSFUL" in text:
+        return SUCCESSFUL
+    if "VERIFICATION FAILED" in text:
+        return FAILED
+    return ERROR
+
+
+def run_proof(proof, timeout):
+    """Run one proof with make.
+
+    Returns (verdict, seconds, peak memory in kB). The peak is that of the
+    largest process make waited for, which is CBMC.
+    """
+    # Don't mistake the last run's report for this one's
+    if os.path.exists(os.path.join(proof, "cbmc.txt")):
+        os.remove(os.path.join(proof, "cbmc.txt"))
+
+    start = time.perf_counter()
+    with open(os.path.join(proof, "run-proofs.log"), "w") as log:
+        proc = subprocess.Popen(
+            ["make"], cwd=proof, stdout=log, stderr=subprocess.STDOUT,
+            start_new_session=True)
+        timed_out = False
+        while True:
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                break
+            if not timed_out and timeout is not None and \
+                    time.perf_counter() - start > timeout:
+                # make's children are in its session, stop them too
+                os.killpg(proc.pid, 9)
+                timed_out = True
+            time.sleep(0.1)
+    # Let Popen know the process is gone
+    proc.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) \
+        else -os.WTERMSIG(status)
+    seconds = time.perf_counter() - start
+
+    if timed_out:
+        result = TIMEOUT
+    else:
+        result = verdict(proof)
+        if proc.returncode and result == SUCCESSFUL:
+            result = ERROR
+    return result, seconds, rusage.ru_maxrss
+
+
+def load_history(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_history(path, history):
+    with open(path + ".tmp", "w") as handle:
+        json.dump(history, handle, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+class Scheduler:
+    """Picks the next proof to run.
+
+    Proofs are started longest first, as long as their estimated memory fits
+    in what the running proofs leave of the budget. A proof too large for the
+    budget still runs, once nothing else is running.
+    """
+
+    def __init__(self, proofs, history, memory_kb, default_memory_kb):
+        self.memory_kb = memory_kb
+        self.used_kb = 0
+        self.estimates = {}
+        for proof in proofs:
+            last = history.get(proof, {})
+            # A proof never run may be the longest, so start it early
+            seconds = last.get("seconds", float("inf"))
+            if "max_rss_kb" in last:
+                # Leave some room for a proof growing since last time
+                memory = last["max_rss_kb"] * 1.25
+            else:
+                memory = default_memory_kb
+            self.estimates[proof] = (seconds, memory)
+        self.queue = sorted(
+            proofs, key=lambda p: self.estimates[p][0], reverse=True)
+
+    def next(self, running):
+        for proof in self.queue:
+            memory = self.estimates[proof][1]
+            if not running or self.used_kb + memory <= self.memory_kb:
+                self.queue.remove(proof)
+                self.used_kb += memory
+                return proof
+        return None
+
+    def done(self, proof):
+        self.used_kb -= self.estimates[proof][1]
+
+
+def main():
+    args = get_args()
+    history = load_history(args.history)
+    proofs = args.proofs or find_proofs()
+    version = cbmc_version()
+
+    results = {}
+    todo = []
+    keys = {}
+    for proof in proofs:
+        keys[proof] = proof_key(proof, version)
+        last = history.get(proof, {})
+        if not args.force and last.get("key") == keys[proof] and \
+                last.get("result") in (SUCCESSFUL, FAILED):
+            results[proof] = (last["result"], CACHED)
+        else:
+            todo.append(proof)
+
+    scheduler = Scheduler(
+        todo, history, args.memory_gb * 2**20, args.default_memory_gb * 2**20)
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        running = {}
+        while scheduler.queue or running:
+            while len(running) < args.jobs:
+                proof = scheduler.next(running)
+                if proof is None:
+                    break
+                running[pool.submit(run_proof, proof, args.timeout)] = proof
+
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                proof = running.pop(future)
+                scheduler.done(proof)
+                result, seconds, max_rss_kb = future.result()
+                results[proof] = (result, seconds)
+                history[proof] = {
+                    "key": keys[proof],
+                    "result": result,
+                    "seconds": seconds,
+                    "max_rss_kb": max_rss_kb,
+                }
+                save_history(args.history, history)
+                logging.warning("%s: %s in %.1fs, %.1f GB", proof, result,
+                                seconds, max_rss_kb / 2**20)
+
+    for proof in sorted(results):
+        result, seconds = results[proof]
+        print("%-10s %10s  %s" % (
+            result, seconds if seconds == CACHED else "%.1fs" % seconds, proof))
+    print("Ran %d of %d proofs (%d cached) in %.1fs" % (
+        len(todo), len(proofs), len(proofs) - len(todo),
+        time.perf_counter() - start))
+
+    ok = all(result == SUCCESSFUL for result, _ in results.values())
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#  http://aws.amazon.com/apache2.0
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+"""
+Run a fuzzing campaign over several fuzz tests at once.
+
+runFuzzTest.sh gives every test the whole machine for a fixed time, one test
+after another. This script shares the same wall clock budget between all the
+tests instead: the budget is cut into rounds of --slice seconds, and each round
+runs one single-core libFuzzer process per core. The tests whose feature
+coverage grew the most per second in their last slice get the cores first;
+a test waiting for a core gains priority every round, so none is starved.
+
+Each test fuzzes a copy of corpus/TEST_NAME for the whole campaign. At the end
+the new inputs are merged and minimized back into corpus/TEST_NAME, for all the
+tests in parallel, like runFuzzTest.sh does.
+
+Every slice is appended as a JSON line to --timeseries: the test, when it ran,
+its executions/sec and the features it covered and found.
+
+Negative tests run for one slice and pass if they fail, as in runFuzzTest.sh.
+
+With FUZZ_COVERAGE set, every test starts from empty coverage profiles, and
+the same per test reports as runFuzzTest.sh's are written to
+$COVERAGE_DIR/fuzz for calcTotalCov.sh. A test whose report fails, fails.
+
+    ./fuzz_campaign.py --budget 3600 s2n_client_hello_recv_fuzz_test s2n_server_fuzz_test
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+LIBFUZZER_ARGS = ["-timeout=5", "-max_len=4096", "-print_final_stats=1"]
+MIN_TEST_PER_SEC = 1000
+MIN_FEATURES_COVERED = 100
+
+# Features per second a test is assumed to find, even if it found none
+MIN_GROWTH = 0.1
+
+# libFuzzer status lines, e.g. "#4096	pulse  cov: 1234 ft: 5678 corp: 90/1Mb exec/s: 2048 rss: 64Mb"
+STATUS = re.compile(r"^#(\d+)\s+\w+\s+cov: (\d+) ft: (\d+)")
+EXECUTED_UNITS = re.compile(r"stat::number_of_executed_units: (\d+)")
+MERGE_RESULT = re.compile(r"\d+ new files .*$", re.MULTILINE)
+
+PQ_TESTS = re.compile(r"bike|sike|kyber")
+
+FUZZ_DIR = os.path.dirname(os.path.abspath(__file__))
+S2N_ROOT = os.environ.get("S2N_ROOT", os.path.join(FUZZ_DIR, "..", ".."))
+FUZZCOV_SOURCES = [os.path.join(S2N_ROOT, d) for d in
+                   ("api", "bin", "crypto", "error", "pq-crypto", "stuffer", "tls", "utils")]
+
+
+def is_negative(test_name):
+    return test_name.endswith("_negative_test")
+
+
+class Target:
+    """ A fuzz test, and what it did so far in the campaign. """
+
+    def __init__(self, name, work_dir):
+        self.name = name
+        self.corpus = os.path.join(work_dir, name)
+        self.seconds = 0.0
+        self.execs = 0
+        self.features = 0
+        # Features found per second in the last slice
+        self.growth = None
+        self.rounds_waiting = 0
+        self.failure = None
+
+    def priority(self):
+        # A test never run goes first, then the fastest growing. Every round
+        # spent waiting doubles the priority, so a test whose coverage
+        # stopped growing still gets a slice now and then.
+        if self.growth is None:
+            return float("inf")
+        return (self.growth + MIN_GROWTH) * 2 ** self.rounds_waiting
+
+
+def environment(test_name):
+    env = dict(os.environ)
+    env["ASAN_OPTIONS"] = env.get("ASAN_OPTIONS", "") + "symbolize=1"
+    env["LSAN_OPTIONS"] = env.get("LSAN_OPTIONS", "") + "log_threads=1"
+    env["UBSAN_OPTIONS"] = env.get("UBSAN_OPTIONS", "") + "print_stacktrace=1"
+
+    test_specific_overrides = os.path.join(FUZZ_DIR, "LD_PRELOAD", test_name + "_overrides.so")
+    global_overrides = os.path.join(FUZZ_DIR, "LD_PRELOAD", "global_overrides.so")
+    if os.path.exists(test_specific_overrides):
+        env["LD_PRELOAD"] = test_specific_overrides + " " + global_overrides
+    else:
+        env["LD_PRELOAD"] = global_overrides
+
+    if env.get("FUZZ_COVERAGE"):
+        env["LLVM_PROFILE_FILE"] = os.path.join(FUZZ_DIR, "profiles", test_name, test_name + ".%p.profraw")
+    return env
+
+
+def parse_output(output):
+    """
+    Return (executions, features covered by the corpus it started with,
+    features covered at the end) from libFuzzer's output.
+    """
+    execs = sum(int(n) for n in EXECUTED_UNITS.findall(output))
+    initial_features = None
+    features = 0
+    for line in output.splitlines():
+        match = STATUS.match(line)
+        if match:
+            if initial_features is None:
+                initial_features = int(match.group(3))
+            features = max(features, int(match.group(3)))
+    return execs, initial_features or 0, features
+
+
+def run_slice(target, seconds, log_dir):
+    """ Fuzz target for seconds on one core. Returns (exit code, output, seconds taken). """
+    start = time.monotonic()
+    cmd = ["./" + target.name] + LIBFUZZER_ARGS + [
+        "-max_total_time=%d" % seconds,
+        "-artifact_prefix=%s-" % target.name,
+        target.corpus]
+    proc = subprocess.run(cmd, cwd=FUZZ_DIR, env=environment(target.name), stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT, universal_newlines=True, errors="replace")
+
+    with open(os.path.join(log_dir, target.name + "_output.txt"), "a") as log:
+        log.write(proc.stdout)
+    return proc.returncode, proc.stdout, time.monotonic() - start
+
+
+def merge_corpus(target):
+    """ Keep only the new inputs that reach new features, like runFuzzTest.sh. """
+    corpus = os.path.join(FUZZ_DIR, "corpus", target.name)
+    proc = subprocess.run(["./" + target.name, "-merge=1", corpus, target.corpus], cwd=FUZZ_DIR,
+                          env=environment(target.name), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          universal_newlines=True, errors="replace")
+    results = [m.group(0) for m in MERGE_RESULT.finditer(proc.stdout)]
+    return proc.returncode, results[-1] if results else ""
+
+
+def clear_profiles(target):
+    """ Remove the coverage profiles of earlier runs, like runFuzzTest.sh. """
+    profiles = os.path.join(FUZZ_DIR, "profiles", target.name)
+    os.makedirs(profiles, exist_ok=True)
+    for profraw in glob.glob(os.path.join(profiles, "*.profraw")):
+        os.remove(profraw)
+
+
+def llvm_major_version():
+    try:
+        output = subprocess.run(["llvm-cov", "--version"], stdout=subprocess.PIPE, universal_newlines=True).stdout
+    except OSError:
+        # coverage_report will say llvm-cov is missing
+        return 0
+    match = re.search(r"(\d+)\.\d+", output)
+    return int(match.group(1)) if match else 0
+
+
+def coverage_report(target, coverage_dir, llvm_version):
+    """
+    Merge the coverage profiles of every slice and write the reports
+    runFuzzTest.sh writes, for calcTotalCov.sh. Returns None, or why it failed.
+    """
+    profiles = os.path.join(FUZZ_DIR, "profiles", target.name)
+    profdata = os.path.join(profiles, target.name + ".profdata")
+    profraws = glob.glob(os.path.join(profiles, "*.profraw"))
+    if not profraws:
+        # A negative test may crash before writing its profile
+        return None if is_negative(target.name) else "no coverage profiles"
+
+    llvm_cov_args = ["-instr-profile=" + profdata, os.path.join(S2N_ROOT, "lib", "libs2n.so")] + FUZZCOV_SOURCES
+    report = os.path.join(coverage_dir, "fuzz", target.name + "_cov")
+    try:
+        subprocess.run(["llvm-profdata", "merge", "-sparse"] + profraws + ["-o", profdata], check=True)
+        with open(report + ".txt", "w") as out:
+            subprocess.run(["llvm-cov", "report"] + llvm_cov_args + ["-show-functions"], stdout=out, check=True)
+
+        # LCOV instead of HTML, if this LLVM supports it
+        if llvm_version > 8:
+            with open(report + ".info", "w") as out:
+                subprocess.run(["llvm-cov", "export"] + llvm_cov_args + ["-format=lcov"], stdout=out, check=True)
+            subprocess.run(["genhtml", "-q", "-o", os.path.join(coverage_dir, "html", target.name),
+                            report + ".info"], check=True)
+        else:
+            with open(report + ".html", "w") as out:
+                subprocess.run(["llvm-cov", "show"] + llvm_cov_args + ["-use-color", "-format=html"], stdout=out,
+                               check=True)
+    except subprocess.CalledProcessError as e:
+        return "coverage report failed, %s exited with %d" % (e.cmd[0], e.returncode)
+    except OSError as e:
+        return "coverage report failed: %s" % e
+    return None
+
+
+def get_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tests", nargs="*", help="Fuzz tests to run (default: $FUZZ_TESTS, or every built test)")
+    parser.add_argument("--budget", type=int, default=None,
+                        help="Wall clock seconds for the campaign (default: $FUZZ_TIMEOUT_SEC per test)")
+    parser.add_argument("--slice", type=int, default=60, help="Seconds a test runs before the cores are shared again")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Number of tests fuzzing at once")
+    parser.add_argument("--timeseries", default=os.path.join(FUZZ_DIR, "fuzz_timeseries.jsonl"),
+                        help="Where to append a JSON line per slice")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = get_args(argv)
+    tests = args.tests or os.environ.get("FUZZ_TESTS", "").split() or sorted(
+        os.path.basename(c)[:-2] for c in glob.glob(os.path.join(FUZZ_DIR, "*_test.c")))
+    if os.environ.get("S2N_TEST_IN_FIPS_MODE"):
+        for test in [t for t in tests if PQ_TESTS.search(t)]:
+            print("Skipping %s because PQ crypto is not supported in FIPS mode..." % test)
+        tests = [t for t in tests if not PQ_TESTS.search(t)]
+
+    budget = args.budget
+    if budget is None:
+        budget = int(os.environ.get("FUZZ_TIMEOUT_SEC", "120")) * len(tests)
+
+    coverage_dir = None
+    if os.environ.get("FUZZ_COVERAGE"):
+        coverage_dir = os.environ["COVERAGE_DIR"]
+        os.makedirs(os.path.join(coverage_dir, "fuzz"), exist_ok=True)
+
+    work_dir = tempfile.mkdtemp(prefix="fuzz_campaign.")
+    targets = []
+    for test in tests:
+        target = Target(test, work_dir)
+        os.makedirs(os.path.join(FUZZ_DIR, "corpus", test), exist_ok=True)
+        shutil.copytree(os.path.join(FUZZ_DIR, "corpus", test), target.corpus)
+        if coverage_dir is not None:
+            clear_profiles(target)
+        targets.append(target)
+    for test in tests:
+        log = os.path.join(FUZZ_DIR, test + "_output.txt")
+        if os.path.exists(log):
+            os.remove(log)
+
+    start = time.monotonic()
+    negatives = [t for t in targets if is_negative(t.name)]
+    positives = [t for t in targets if not is_negative(t.name)]
+
+    with open(args.timeseries, "a") as timeseries, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        while True:
+            remaining = budget - (time.monotonic() - start)
+            # The negative tests only need one slice
+            candidates = [t for t in positives if t.failure is None] + negatives
+            if remaining < 1 or not candidates:
+                break
+
+            candidates.sort(key=lambda t: t.priority(), reverse=True)
+            running = candidates[:args.jobs]
+            for target in candidates[args.jobs:]:
+                target.rounds_waiting += 1
+            seconds = int(min(args.slice, remaining))
+
+            round_start = time.monotonic() - start
+            futures = {pool.submit(run_slice, target, seconds, FUZZ_DIR): target for target in running}
+            for future in concurrent.futures.as_completed(futures):
+                target = futures[future]
+                returncode, output, elapsed = future.result()
+                execs, initial_features, features = parse_output(output)
+                new_features = max(features - max(target.features, initial_features), 0)
+
+                target.growth = new_features / max(elapsed, 1)
+                target.rounds_waiting = 0
+                target.seconds += elapsed
+                target.execs += execs
+                target.features = max(target.features, features)
+                if (returncode != 0) != is_negative(target.name):
+                    target.failure = "exit code %d" % returncode
+                if is_negative(target.name):
+                    negatives.remove(target)
+                    for artifact in glob.glob(os.path.join(FUZZ_DIR, target.name + "-*")):
+                        os.remove(artifact)
+
+                timeseries.write(json.dumps({
+                    "test": target.name,
+                    "start_s": round(round_start, 3),
+                    "seconds": round(elapsed, 3),
+                    "executions": execs,
+                    "executions_per_sec": int(execs / elapsed) if elapsed else 0,
+                    "features": features,
+                    "new_features": new_features,
+                    "returncode": returncode,
+                }) + "\n")
+                timeseries.flush()
+
+        # Merge what every positive test found back into its corpus, all at once
+        merges = {target: pool.submit(merge_corpus, target) for target in positives if target.failure is None}
+        if coverage_dir is not None:
+            llvm_version = llvm_major_version()
+            reports = {target: pool.submit(coverage_report, target, coverage_dir, llvm_version)
+                       for target in targets}
+            # A test without a coverage report fails, like it would in runFuzzTest.sh
+            for target, report in reports.items():
+                error = report.result()
+                if error is not None and target.failure is None:
+                    target.failure = error
+
+    failures = 0
+    for target in targets:
+        tests_per_sec = int(target.execs / target.seconds) if target.seconds else 0
+        if target.failure is not None:
+            failures += 1
+            print("\033[31;1mFAILED\033[0m %-45s %s, see %s_output.txt" % (target.name, target.failure, target.name))
+            continue
+
+        line = "\033[32;1mPASSED\033[0m %-45s %5ds %10d tests, %6d test/sec, %5d features covered" % (
+            target.name, target.seconds, target.execs, tests_per_sec, target.features)
+        if target in merges:
+            returncode, results = merges[target].result()
+            line += ", " + results
+        print(line)
+
+        if not is_negative(target.name):
+            if tests_per_sec < MIN_TEST_PER_SEC:
+                print("\033[33;1mWARNING!\033[0m %s is only %d tests/sec, which is below %d/sec! "
+                      "Fuzz tests are more effective at higher rates." % (target.name, tests_per_sec, MIN_TEST_PER_SEC))
+            if target.features < MIN_FEATURES_COVERED:
+                failures += 1
+                print("\033[33;1mWARNING!\033[0m %s only covers %d features, which is below %d! This is likely a bug."
+                      % (target.name, target.features, MIN_FEATURES_COVERED))
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    print("%d tests in %ds, %d failed" % (len(targets), time.monotonic() - start, failures))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
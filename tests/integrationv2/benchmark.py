@@ -0,0 +1,69 @@
+import json
+import os
+import pytest
+
+from global_flags import get_flag, S2N_BENCHMARK_OUTPUT
+
+
+# Network conditions the benchmarks are run under. None is the unmodified loopback
+# device, the others are passed to the emulated_network fixture.
+NETWORK_PROFILES = [
+    None,
+    {"name": "wan", "mtu": 1500, "delay_ms": 20, "rate": "100mbit"},
+    {"name": "lossy_wan", "mtu": 1500, "delay_ms": 50, "jitter_ms": 5, "loss_percent": 1, "rate": "20mbit"},
+]
+
+
+def get_network_name(profile):
+    return "loopback" if profile is None else profile["name"]
+
+
+def setup_network(emulated_network, profile):
+    """
+    Create the emulated network for a profile, or return None for the plain loopback device.
+    """
+    if profile is None:
+        return None
+
+    return emulated_network(**{k: v for k, v in profile.items() if k != "name"})
+
+
+def skip_unless_benchmarking():
+    """
+    Benchmarks are slow and their results are only useful when recorded, so they
+    only run when --benchmark-output is set.
+    """
+    if get_flag(S2N_BENCHMARK_OUTPUT) is None:
+        pytest.skip("Benchmarks only run with --benchmark-output")
+
+
+def parse_benchmark_results(stdout, marker):
+    """
+    Return the JSON object printed on every line of stdout starting with marker.
+    """
+    results = []
+    for line in stdout.decode('utf-8', errors='replace').splitlines():
+        if line.startswith(marker):
+            results.append(json.loads(line[len(marker):]))
+
+    return results
+
+
+def record_benchmark(name, parameters, measurements):
+    """
+    Append one JSON line to the benchmark output file.
+
+    The file is opened in append mode and every line is written with a single
+    write, so parallel pytest-xdist workers can share the same file.
+    """
+    line = json.dumps({
+        "benchmark": name,
+        "parameters": {k: str(v) for k, v in parameters.items()},
+        "measurements": measurements,
+    }, sort_keys=True) + "\n"
+
+    fd = os.open(get_flag(S2N_BENCHMARK_OUTPUT), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode('utf-8'))
+    finally:
+        os.close(fd)
@@ -0,0 +1,231 @@
+import collections
+import struct
+
+
+# Link layer types we know how to strip, see https://www.tcpdump.org/linktypes.html
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+
+# The pcap magic number tells us the byte order and the timestamp resolution
+_PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+
+_ETHERTYPE_IPV4 = 0x0800
+_ETHERTYPE_IPV6 = 0x86dd
+_ETHERTYPE_VLAN = 0x8100
+_IP_PROTOCOL_TCP = 6
+
+_TCP_FLAG_SYN = 0x02
+
+# TLS record content types
+TLS_CHANGE_CIPHER_SPEC = 20
+TLS_ALERT = 21
+TLS_HANDSHAKE = 22
+TLS_APPLICATION_DATA = 23
+_TLS_CONTENT_TYPES = (TLS_CHANGE_CIPHER_SPEC, TLS_ALERT, TLS_HANDSHAKE, TLS_APPLICATION_DATA)
+_TLS_RECORD_HEADER_LEN = 5
+
+
+# A TCP flow in one direction: (source address, source port, destination address, destination port)
+Flow = collections.namedtuple('Flow', 'src sport dst dport')
+
+# A single TCP segment. `ip_length` is the length of the IP packet, `payload` is the TCP payload.
+TcpSegment = collections.namedtuple('TcpSegment', 'timestamp flow seq flags ip_length payload')
+
+# A single TLS record. `length` does not include the 5 byte record header. `start_time` is the timestamp
+# of the segment carrying the first byte of the record, `end_time` the one carrying the last byte.
+TlsRecord = collections.namedtuple('TlsRecord', 'flow content_type version length start_time end_time')
+
+
+def read_pcap(data):
+    """
+    Iterate over the packets in a pcap capture, such as the output of `tcpdump -w -`.
+
+    Yields (timestamp, linktype, packet) tuples. `packet` is a memoryview into `data`,
+    so no packet bytes are copied. A truncated final packet is silently dropped, which
+    happens if the capture process was killed.
+    """
+    if data is None or len(data) < 24:
+        return
+
+    view = memoryview(data)
+    magic = bytes(view[0:4])
+    if magic not in _PCAP_MAGIC:
+        raise ValueError("Not a pcap capture (magic {})".format(magic.hex()))
+
+    endian, resolution = _PCAP_MAGIC[magic]
+    linktype = struct.unpack_from(endian + 'I', view, 20)[0]
+    record_header = struct.Struct(endian + 'IIII')
+
+    offset = 24
+    while offset + record_header.size <= len(view):
+        ts_sec, ts_frac, incl_len, _ = record_header.unpack_from(view, offset)
+        offset += record_header.size
+        if offset + incl_len > len(view):
+            break
+
+        yield ts_sec + ts_frac * resolution, linktype, view[offset:offset + incl_len]
+        offset += incl_len
+
+
+def _strip_link_layer(linktype, packet):
+    """
+    Return (ethertype, network layer packet), or (None, None) for unsupported frames.
+    """
+    if linktype == LINKTYPE_ETHERNET:
+        ethertype = struct.unpack_from('!H', packet, 12)[0]
+        offset = 14
+        while ethertype == _ETHERTYPE_VLAN:
+            ethertype = struct.unpack_from('!H', packet, offset + 2)[0]
+            offset += 4
+        return ethertype, packet[offset:]
+    elif linktype == LINKTYPE_LINUX_SLL:
+        return struct.unpack_from('!H', packet, 14)[0], packet[16:]
+    elif linktype == LINKTYPE_RAW:
+        version = packet[0] >> 4
+        return (_ETHERTYPE_IPV4 if version == 4 else _ETHERTYPE_IPV6), packet
+    elif linktype == LINKTYPE_NULL:
+        # The address family is in host byte order, 2 is AF_INET everywhere
+        family = struct.unpack_from('=I', packet, 0)[0]
+        return (_ETHERTYPE_IPV4 if family == 2 else _ETHERTYPE_IPV6), packet[4:]
+
+    return None, None
+
+
+def decode_tcp_segments(pcap_data):
+    """
+    Decode every TCP segment in a pcap capture. Non TCP packets are skipped.
+    """
+    for timestamp, linktype, packet in read_pcap(pcap_data):
+        ethertype, ip = _strip_link_layer(linktype, packet)
+
+        if ethertype == _ETHERTYPE_IPV4 and len(ip) >= 20:
+            header_len = (ip[0] & 0x0f) * 4
+            ip_length = struct.unpack_from('!H', ip, 2)[0]
+            if ip[9] != _IP_PROTOCOL_TCP:
+                continue
+            src = '.'.join(str(b) for b in ip[12:16])
+            dst = '.'.join(str(b) for b in ip[16:20])
+        elif ethertype == _ETHERTYPE_IPV6 and len(ip) >= 40:
+            # Extension headers are not expected on the loopback device
+            header_len = 40
+            ip_length = header_len + struct.unpack_from('!H', ip, 4)[0]
+            if ip[6] != _IP_PROTOCOL_TCP:
+                continue
+            src = bytes(ip[8:24]).hex()
+            dst = bytes(ip[24:40]).hex()
+        else:
+            continue
+
+        tcp = ip[header_len:ip_length]
+        if len(tcp) < 20:
+            continue
+
+        sport, dport, seq = struct.unpack_from('!HHI', tcp, 0)
+        data_offset = (tcp[12] >> 4) * 4
+        flags = tcp[13]
+
+        yield TcpSegment(timestamp, Flow(src, sport, dst, dport), seq, flags, ip_length, tcp[data_offset:])
+
+
+class _TlsStream(object):
+    """
+    Reassembles one direction of a TCP connection and splits it into TLS records.
+    """
+    def __init__(self, flow):
+        self.flow = flow
+        self.next_seq = None
+        self.pending = {}
+        self.buffer = bytearray()
+        # Timestamp of the segment holding self.buffer[0]
+        self.buffer_start_time = None
+        self.is_tls = True
+
+    def add(self, segment):
+        if segment.flags & _TCP_FLAG_SYN:
+            self.next_seq = (segment.seq + 1) & 0xffffffff
+            return []
+
+        if self.next_seq is None:
+            # The capture started mid-stream, sync on the first segment we see
+            self.next_seq = segment.seq
+
+        # Drop empty segments (ACKs) and retransmissions of data we already consumed
+        if len(segment.payload) == 0 or ((segment.seq - self.next_seq) & 0xffffffff) > 0x7fffffff:
+            return []
+
+        self.pending[segment.seq] = segment
+
+        records = []
+        while self.next_seq in self.pending:
+            in_order = self.pending.pop(self.next_seq)
+            self.next_seq = (self.next_seq + len(in_order.payload)) & 0xffffffff
+            records.extend(self._consume(in_order))
+
+        return records
+
+    def _consume(self, segment):
+        if not self.is_tls:
+            return []
+
+        if len(self.buffer) == 0:
+            self.buffer_start_time = segment.timestamp
+        self.buffer += segment.payload
+
+        records = []
+        while len(self.buffer) >= _TLS_RECORD_HEADER_LEN:
+            content_type = self.buffer[0]
+            if content_type not in _TLS_CONTENT_TYPES:
+                # Not TLS (or we lost sync). Stop looking at this flow.
+                self.is_tls = False
+                self.buffer = bytearray()
+                break
+
+            version, length = struct.unpack_from('!HH', self.buffer, 1)
+            total = _TLS_RECORD_HEADER_LEN + length
+            if len(self.buffer) < total:
+                break
+
+            records.append(TlsRecord(self.flow, content_type, version, length, self.buffer_start_time, segment.timestamp))
+            del self.buffer[:total]
+            self.buffer_start_time = segment.timestamp
+
+        return records
+
+
+def decode_tls_records(pcap_data):
+    """
+    Decode all the TLS records in a pcap capture, in the order they completed.
+
+    Each direction of each TCP connection is reassembled independently. Retransmitted
+    segments are ignored and out of order segments are held until the gap is filled.
+    Records which were not fully captured are not returned.
+    """
+    streams = {}
+    records = []
+    for segment in decode_tcp_segments(pcap_data):
+        stream = streams.get(segment.flow)
+        if stream is None:
+            stream = _TlsStream(segment.flow)
+            streams[segment.flow] = stream
+
+        records.extend(stream.add(segment))
+
+    return records
+
+
+def filter_records(records, content_type=None, sport=None, dport=None):
+    """
+    Return the records matching the given content type and TCP ports. A value of
+    None matches anything.
+    """
+    return [r for r in records
+            if (content_type is None or r.content_type == content_type)
+            and (sport is None or r.flow.sport == sport)
+            and (dport is None or r.flow.dport == dport)]
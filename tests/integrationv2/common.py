@@ -326,11 +326,40 @@ class Results(object):
     # Any exception thrown while running the process
     exception = None
 
-    def __init__(self, stdout, stderr, exit_code, exception):
+    # The process' resource usage (a resource.struct_rusage) from os.wait4
+    rusage = None
+
+    # The process' peak resident set size in kB, or None if it couldn't be sampled
+    peak_rss_kb = None
+
+    # Seconds from launching the process until it was reaped
+    wall_time = None
+
+    def __init__(self, stdout, stderr, exit_code, exception, output_parser=None, rusage=None, peak_rss_kb=None, wall_time=None):
         self.stdout = stdout
         self.stderr = stderr
         self.exit_code = exit_code
         self.exception = exception
+        self.rusage = rusage
+        self.peak_rss_kb = peak_rss_kb
+        self.wall_time = wall_time
+
+        # The provider's OutputParser, used to build `output`
+        self.output_parser = output_parser
+        self._output = None
+
+    @property
+    def output(self):
+        """
+        The handshake details parsed from stdout (a HandshakeOutput). Stdout is
+        parsed the first time this is used, and the result is cached.
+        """
+        if self._output is None:
+            if self.output_parser is None:
+                raise ValueError("This provider has no output parser")
+            self._output = self.output_parser.parse(self.stdout)
+
+        return self._output
 
     def __str__(self):
         return "Stdout: {}\nStderr: {}\nExit code: {}\nException: {}".format(self.stdout, self.stderr, self.exit_code, self.exception)
@@ -2,6 +2,8 @@ import collections
 
 from common import Certificates, Ciphers, Curves, Protocols, AvailablePorts
 from constants import TEST_SNI_CERT_DIRECTORY
+from global_flags import get_flag, S2N_PKI_MANIFEST
+from pki import load_certificates
 from providers import S2N, OpenSSL, BoringSSL
 
 
@@ -55,6 +57,11 @@ ALL_TEST_CERTS = [
 ]
 
 
+# Certificates generated by pki.py, if a manifest was passed with --pki-manifest.
+# Each one also has `ca`, `sans` and `depth` attributes.
+GENERATED_CERTS = load_certificates(get_flag(S2N_PKI_MANIFEST))
+
+
 # List of all ciphers that will be tested.
 ALL_TEST_CIPHERS = [
     Ciphers.DHE_RSA_AES128_SHA,
@@ -1,11 +1,18 @@
 import pytest
-from global_flags import set_flag, S2N_PROVIDER_VERSION, S2N_FIPS_MODE, S2N_NO_PQ
+from global_flags import set_flag, S2N_PROVIDER_VERSION, S2N_FIPS_MODE, S2N_NO_PQ, S2N_BENCHMARK_OUTPUT, S2N_PKI_MANIFEST
+
+
+pytest_plugins = ["impact", "report"]
 
 
 def pytest_addoption(parser):
     parser.addoption("--provider-version", action="store", dest="provider-version", default=None, type=str, help="Set the version of the TLS provider")
     parser.addoption("--fips-mode", action="store", dest="fips-mode", default=False, type=int, help="S2N is running in FIPS mode")
     parser.addoption("--no-pq", action="store", dest="no-pq", default=False, type=int, help="Turn off PQ support")
+    parser.addoption("--benchmark-output", action="store", dest="benchmark-output", default=None, type=str, help="Run the benchmarks and append their results to this file")
+    parser.addoption("--pem-cache", action="store", dest="pem-cache", default=None, type=str, help="Copy the test PEMs into a directory under this path (e.g. /dev/shm) and use them from there")
+    parser.addoption("--pki-manifest", action="store", dest="pki-manifest", default=None, type=str, help="Load the certificates generated by pki.py from this manifest")
+    parser.addoption("--validate-pems", action="store_true", dest="validate-pems", default=False, help="Load every cached PEM once before running any test")
 
 
 def pytest_configure(config):
@@ -25,6 +32,8 @@ def pytest_configure(config):
         set_flag(S2N_FIPS_MODE, True)
 
     set_flag(S2N_PROVIDER_VERSION, config.getoption('provider-version', None))
+    set_flag(S2N_BENCHMARK_OUTPUT, config.getoption('benchmark-output', None))
+    set_flag(S2N_PKI_MANIFEST, config.getoption('pki-manifest', None))
 
 
 def pytest_collection_modifyitems(config, items):
@@ -44,3 +53,36 @@ def pytest_collection_modifyitems(config, items):
     if removed:
         config.hook.pytest_deselected(items=removed)
         items[:] = kept
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    """
+    Report how often the providers reused a cached command line. With xdist
+    the counts are only kept by the workers, so nothing is reported.
+    """
+    # providers reads the global flags on import, so it can't be imported
+    # before pytest_configure has set them.
+    from providers import CommandLineTemplates
+    if CommandLineTemplates.hits or CommandLineTemplates.misses:
+        terminalreporter.write_line("Command line templates: {} hits, {} misses".format(
+            CommandLineTemplates.hits, CommandLineTemplates.misses))
+
+
+@pytest.fixture(scope='session')
+def pem_cache(request):
+    """
+    Session wide PemCache, or None unless --pem-cache is set. The Cert and
+    Cipher objects point at the cached copies until the session ends, and the
+    managed_process fixture rewrites any other PEM path on the command line.
+    """
+    cache_root = request.config.getoption('pem-cache', None)
+    if cache_root is None:
+        yield None
+        return
+
+    from pem_cache import preload_pems
+    cache, restore = preload_pems(cache_root, validate=request.config.getoption('validate-pems', False))
+    try:
+        yield cache
+    finally:
+        restore()
@@ -0,0 +1,371 @@
+"""
+Runs the handshakes from test_well_known_endpoints.py concurrently.
+
+Each check is an s2nc process, launched through the S2N provider exactly like
+the test does, but up to --jobs of them run at once under an asyncio
+semaphore instead of one at a time per pytest worker.
+
+Live mode connects to the real endpoints. Pass --record to save what each
+endpoint negotiated:
+
+    python endpoint_driver.py --record endpoint_profiles.json
+
+Replay mode needs no network. Every recorded profile (protocol, cipher and
+curve) is served by a local stand-in: openssl s_server restricted to the
+recorded parameters, or s2nd for the PQ profiles OpenSSL doesn't support.
+Checks with the same profile share a stand-in. A check fails if s2nc
+negotiates anything other than what was recorded, so the replay doubles as a
+regression test and, with --benchmark-output, as a benchmark. Profiles no
+stand-in can serve, such as a cipher missing from common.Ciphers or one the
+OpenSSL in $S2N_LIBCRYPTO doesn't support, are reported as skipped:
+
+    python endpoint_driver.py --replay endpoint_profiles.json --benchmark-output=/tmp/bench.jsonl
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import sys
+import time
+
+from global_flags import get_flag, set_flag, S2N_NO_PQ, S2N_FIPS_MODE, S2N_BENCHMARK_OUTPUT, S2N_PROVIDER_VERSION
+
+# OpenSSL reads the provider version when providers.py is imported. Under
+# pytest, conftest.py has already set it from --provider-version.
+if get_flag(S2N_PROVIDER_VERSION) is None:
+    set_flag(S2N_PROVIDER_VERSION, os.environ.get("S2N_LIBCRYPTO", "openssl-1.1.1"))
+
+from benchmark import record_benchmark
+from configuration import available_ports, PROTOCOLS
+from common import ProviderOptions, Protocols, Protocol, Ciphers, Cipher, Curves, Certificates
+from providers import Provider, S2N, OpenSSL
+
+
+PROFILES_VERSION = 1
+
+# s2nc prints the curve names used by s2n
+_CURVE_NAMES = {
+    'x25519': 'X25519',
+    'secp256r1': 'P256',
+    'secp384r1': 'P384',
+}
+
+# The protocols and ciphers by the names s2nc prints, which are the names recorded
+_PROTOCOLS_BY_NAME = {p.name: p for p in vars(Protocols).values() if isinstance(p, Protocol)}
+_CIPHERS_BY_NAME = {c.name: c for c in vars(Ciphers).values() if isinstance(c, Cipher)}
+
+# One handshake to run. `endpoint` is an entry of ENDPOINTS in test_well_known_endpoints.py.
+EndpointCheck = collections.namedtuple('EndpointCheck', 'endpoint protocol')
+
+
+def check_key(check):
+    """
+    Identifies a check in the recorded profiles.
+    """
+    preferences = check.endpoint.get('cipher_preference_version')
+    return "{}-{}-{}".format(check.endpoint['endpoint'], preferences or 'Default', check.protocol.name)
+
+
+def _client_options(check, host, port, trust_store):
+    options = ProviderOptions(
+        mode=Provider.ClientMode,
+        host=host,
+        port=port,
+        insecure=trust_store is None,
+        client_trust_store=trust_store,
+        protocol=check.protocol)
+
+    if 'cipher_preference_version' in check.endpoint:
+        options.cipher = check.endpoint['cipher_preference_version']
+
+    if host != check.endpoint['endpoint']:
+        # Send the real endpoint name to the stand-in
+        options.extra_flags = ['-n', check.endpoint['endpoint']]
+
+    return options
+
+
+async def _run_client(semaphore, check, options, timeout):
+    """
+    Run one s2nc and return its result as a dict.
+    """
+    provider = S2N(options)
+    async with semaphore:
+        start = time.perf_counter()
+        proc = await asyncio.create_subprocess_exec(*provider.get_cmd_line(), stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+            timed_out = False
+        except asyncio.TimeoutError:
+            proc.kill()
+            stdout, stderr = await proc.communicate()
+            timed_out = True
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+    output = provider.output_parser.parse(stdout)
+    return {
+        "check": check_key(check),
+        "exit_code": proc.returncode,
+        "timed_out": timed_out,
+        "elapsed_ms": elapsed_ms,
+        "protocol": output.protocol.name if output.protocol is not None else None,
+        "cipher": output.cipher,
+        "curve": output.curve,
+        "kem": output.kem,
+        "stderr": stderr.decode('utf-8', errors='replace').strip(),
+    }
+
+
+class StandIn(object):
+    """
+    A local server playing the part of an endpoint, for the given number of
+    connections. It is ready once `marker` is printed.
+    """
+    def __init__(self, provider_class, options, marker):
+        self.provider = provider_class(options)
+        self.port = options.port
+        self.marker = marker
+        self.proc = None
+        self._drain = None
+
+    async def start(self, timeout):
+        self.proc = await asyncio.create_subprocess_exec(*self.provider.get_cmd_line(),
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+
+        async def wait_for_marker():
+            while True:
+                line = await self.proc.stdout.readline()
+                if not line:
+                    raise RuntimeError("Stand-in exited before it was ready: {}".format(
+                        " ".join(self.provider.get_cmd_line())))
+                if self.marker.encode('utf-8') in line:
+                    return
+
+        await asyncio.wait_for(wait_for_marker(), timeout)
+
+        # Keep reading, so a chatty server never blocks on a full pipe
+        self._drain = asyncio.ensure_future(self.proc.stdout.read())
+
+    async def stop(self):
+        if self.proc.returncode is None:
+            self.proc.kill()
+        await self.proc.wait()
+        await self._drain
+
+
+def _unservable(profile):
+    """
+    Return why no stand-in can negotiate the recorded profile, or None.
+    """
+    protocol = _PROTOCOLS_BY_NAME.get(profile["protocol"])
+    if protocol is None:
+        return "unknown protocol {}".format(profile["protocol"])
+
+    if profile.get("kem") is not None:
+        # s2nd negotiates the PQ key exchanges from its own preferences
+        return None
+
+    cipher = _CIPHERS_BY_NAME.get(profile["cipher"])
+    if cipher is None:
+        return "no stand-in for cipher {}".format(profile["cipher"])
+    if not OpenSSL.supports_protocol(protocol) or not OpenSSL.supports_cipher(cipher):
+        return "{} can't serve {} with {}".format(OpenSSL.get_version(), profile["cipher"], profile["protocol"])
+
+    return None
+
+
+def _stand_in_for(profile, port, connections):
+    """
+    Return a StandIn negotiating the recorded profile, which _unservable must accept.
+    """
+    protocol = _PROTOCOLS_BY_NAME[profile["protocol"]]
+
+    options = ProviderOptions(
+        mode=Provider.ServerMode,
+        host="localhost",
+        port=port,
+        protocol=protocol,
+        reconnects_before_exit=connections)
+
+    if profile.get("kem") is not None:
+        # OpenSSL can't serve the PQ key exchanges
+        return StandIn(S2N, options, 'Listening on')
+
+    cipher = _CIPHERS_BY_NAME[profile["cipher"]]
+    certificate = Certificates.ECDSA_256 if cipher.algorithm == 'EC' else Certificates.RSA_2048_SHA256
+    options.cipher = cipher
+    options.cert = certificate.cert
+    options.key = certificate.key
+    if profile.get("curve") in _CURVE_NAMES:
+        options.curve = getattr(Curves, _CURVE_NAMES[profile["curve"]])
+
+    return StandIn(OpenSSL, options, 'ACCEPT')
+
+
+def _profile_key(profile):
+    return (profile["protocol"], profile["cipher"], profile.get("curve"), profile.get("kem"))
+
+
+async def run_live(checks, jobs, timeout, trust_store):
+    semaphore = asyncio.Semaphore(jobs)
+    return await asyncio.gather(*(
+        _run_client(semaphore, check, _client_options(check, check.endpoint['endpoint'], "443", trust_store), timeout)
+        for check in checks))
+
+
+async def run_replay(checks, profiles, jobs, timeout):
+    """
+    Replay every check with a successful recording against a shared stand-in.
+    Checks without one, or whose profile no stand-in can serve, are reported
+    as skipped.
+    """
+    groups = collections.OrderedDict()
+    skipped = []
+    for check in checks:
+        profile = profiles.get(check_key(check))
+        if profile is None or profile.get("protocol") is None:
+            skipped.append({"check": check_key(check), "skipped": "no recording"})
+            continue
+
+        reason = _unservable(profile)
+        if reason is not None:
+            skipped.append({"check": check_key(check), "skipped": reason})
+            continue
+        groups.setdefault(_profile_key(profile), (profile, []))[1].append(check)
+
+    stand_ins = []
+    semaphore = asyncio.Semaphore(jobs)
+    try:
+        clients = []
+        for profile, group in groups.values():
+            stand_in = _stand_in_for(profile, next(available_ports), len(group))
+            await stand_in.start(timeout)
+            stand_ins.append(stand_in)
+            for check in group:
+                clients.append(_run_client(semaphore, check, _client_options(check, "localhost", stand_in.port, None), timeout))
+
+        results = await asyncio.gather(*clients)
+    finally:
+        for stand_in in stand_ins:
+            await stand_in.stop()
+
+    return list(results) + skipped
+
+
+def _failed(result, profiles, expected_failures, replay):
+    """
+    Return why a check failed, or None.
+    """
+    if result.get("skipped"):
+        return None
+
+    endpoint = result["check"]
+    if result["timed_out"]:
+        reason = "timed out"
+    elif result["exit_code"] != 0:
+        lines = result["stderr"].splitlines()
+        reason = "exit code {}: {}".format(result["exit_code"], lines[-1] if lines else "")
+    elif replay:
+        profile = profiles[endpoint]
+        negotiated = (result["protocol"], result["cipher"])
+        recorded = (profile["protocol"], profile["cipher"])
+        reason = None if negotiated == recorded else "negotiated {}, recorded {}".format(negotiated, recorded)
+    else:
+        reason = None
+
+    if reason is not None and any(endpoint.startswith(name + "-") for name in expected_failures):
+        return None
+
+    return reason
+
+
+def load_profiles(path):
+    with open(path) as f:
+        recording = json.load(f)
+
+    return {profile["check"]: profile for profile in recording["profiles"]}
+
+
+def write_profiles(path, results):
+    profiles = []
+    for result in results:
+        if result["exit_code"] != 0:
+            continue
+        profiles.append({k: result[k] for k in ("check", "protocol", "cipher", "curve", "kem")})
+
+    with open(path + ".tmp", 'w') as f:
+        json.dump({"version": PROFILES_VERSION, "profiles": profiles}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", default=None, help="Connect to the real endpoints and save what they negotiated here")
+    mode.add_argument("--replay", default=None, help="Replay the profiles saved by --record against local stand-ins")
+    parser.add_argument("--jobs", default=16, type=int, help="Number of handshakes in flight at once")
+    parser.add_argument("--timeout", default=5, type=float)
+    parser.add_argument("--no-pq", default=False, action="store_true", help="s2n was built without PQ support")
+    parser.add_argument("--fips-mode", default=False, action="store_true", help="s2n is in FIPS mode")
+    parser.add_argument("--benchmark-output", default=None, help="Append the replay timings to this file")
+    args = parser.parse_args(argv)
+
+    # The endpoints depend on the flags, so they are only imported once the flags are set
+    set_flag(S2N_NO_PQ, args.no_pq)
+    set_flag(S2N_FIPS_MODE, args.fips_mode)
+    set_flag(S2N_BENCHMARK_OUTPUT, args.benchmark_output)
+    from test_well_known_endpoints import ENDPOINTS, expected_failures
+
+    checks = [EndpointCheck(endpoint, protocol) for endpoint in ENDPOINTS for protocol in PROTOCOLS]
+
+    start = time.perf_counter()
+    if args.replay is not None:
+        profiles = load_profiles(args.replay)
+        results = asyncio.run(run_replay(checks, profiles, args.jobs, args.timeout))
+    else:
+        profiles = {}
+        if args.fips_mode:
+            trust_store = "../integration/trust-store/ca-bundle.trust.crt"
+        else:
+            trust_store = "../integration/trust-store/ca-bundle.crt"
+        results = asyncio.run(run_live(checks, args.jobs, args.timeout, trust_store))
+    elapsed = time.perf_counter() - start
+
+    failures = 0
+    for result in results:
+        if result.get("skipped"):
+            print("SKIPPED {}: {}".format(result["check"], result["skipped"]))
+            continue
+
+        reason = _failed(result, profiles, expected_failures, args.replay is not None)
+        if reason is not None:
+            failures += 1
+            print("FAILED {}: {}".format(result["check"], reason))
+
+    handshakes = [r for r in results if not r.get("skipped")]
+    print("{} handshakes, {} failed, in {:.2f}s".format(len(handshakes), failures, elapsed))
+
+    if args.record is not None:
+        write_profiles(args.record, results)
+
+    if args.benchmark_output is not None and handshakes:
+        times = sorted(r["elapsed_ms"] for r in handshakes)
+        record_benchmark("well_known_endpoints", {
+            "mode": "replay" if args.replay is not None else "live",
+            "jobs": args.jobs,
+        }, {
+            "handshakes": len(handshakes),
+            "failures": failures,
+            "elapsed_s": elapsed,
+            "handshakes_per_sec": len(handshakes) / elapsed,
+            "p50_handshake_ms": times[len(times) // 2],
+            "max_handshake_ms": times[-1],
+        })
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -3,6 +3,7 @@ import pytest
 import subprocess
 import threading
 import time
+import uuid
 
 from processes import ManagedProcess
 from providers import Provider
@@ -10,7 +11,7 @@ from common import ProviderOptions, Protocols
 
 
 @pytest.fixture
-def managed_process():
+def managed_process(request, pem_cache):
     """
     Generic process manager. This could be used to launch any process as a background
     task and cleanup when finished.
@@ -18,20 +19,35 @@ def managed_process():
     The reason a fixture is used, instead of creating a ManagedProcess() directly
     from the test, is to control the life of the process. Using the fixture
     allows cleanup after a test, even if a failure occurred.
+
+    With --json-report, every (provider, process) is also kept on the test item
+    as `managed_processes` for report.py.
     """
     processes = []
+    launched = None
+    if request.config.pluginmanager.has_plugin("json-report"):
+        launched = request.node.managed_processes = []
 
-    def _fn(provider_class: Provider, options: ProviderOptions, timeout=5):
+    def _fn(provider_class: Provider, options: ProviderOptions, timeout=5, network=None):
         provider = provider_class(options)
         cmd_line = provider.get_cmd_line()
+        if pem_cache is not None:
+            # Use the PEMs copied by the pem_cache fixture
+            cmd_line = pem_cache.rewrite(cmd_line)
+        if network is not None:
+            # Launch the process inside a network namespace from the emulated_network fixture
+            cmd_line = network.wrap(cmd_line)
         p = ManagedProcess(cmd_line,
                 provider.set_provider_ready,
                 wait_for_marker=provider.ready_to_test_marker,
                 ready_to_send=provider.ready_to_send_input_marker,
                 data_source=options.data_to_send,
-                timeout=timeout)
+                timeout=timeout,
+                output_parser=provider.output_parser)
 
         processes.append(p)
+        if launched is not None:
+            launched.append((provider, p))
         with p.ready_condition:
             p.start()
             with provider._provider_ready_condition:
@@ -89,3 +105,96 @@ def custom_mtu():
     original_mtu = _swap_mtu('lo', 1500)
     yield
     _swap_mtu('lo', original_mtu)
+
+
+class NetworkNamespace(object):
+    """
+    A private network namespace with its own loopback device. Processes launched
+    in the namespace only see that loopback device, so its MTU and the network
+    conditions emulated with `tc netem` don't affect any other test.
+    """
+    def __init__(self, name, mtu=None, delay_ms=None, jitter_ms=None, loss_percent=None, rate=None):
+        self.name = name
+        self.mtu = mtu
+        self.delay_ms = delay_ms
+        self.jitter_ms = jitter_ms
+        self.loss_percent = loss_percent
+        self.rate = rate
+
+    def wrap(self, cmd_line):
+        """
+        Return a command line that runs cmd_line inside the namespace.
+        """
+        return ["ip", "netns", "exec", self.name] + cmd_line
+
+    def _netem_args(self):
+        args = []
+        if self.delay_ms is not None:
+            args.extend(["delay", "{}ms".format(self.delay_ms)])
+            if self.jitter_ms is not None:
+                args.append("{}ms".format(self.jitter_ms))
+        if self.loss_percent is not None:
+            args.extend(["loss", "{}%".format(self.loss_percent)])
+        if self.rate is not None:
+            args.extend(["rate", str(self.rate)])
+
+        return args
+
+    def create(self):
+        subprocess.check_call(["ip", "netns", "add", self.name])
+
+        link_cmd = ["ip", "link", "set", "lo", "up"]
+        if self.mtu is not None:
+            link_cmd.extend(["mtu", str(self.mtu)])
+        subprocess.check_call(self.wrap(link_cmd))
+
+        # Every packet crosses the loopback device once, so the delay applies
+        # to each direction and the round trip time is twice the delay.
+        netem_args = self._netem_args()
+        if netem_args:
+            subprocess.check_call(self.wrap(["tc", "qdisc", "add", "dev", "lo", "root", "netem"] + netem_args))
+
+    def destroy(self):
+        subprocess.call(["ip", "netns", "delete", self.name])
+
+    def __str__(self):
+        return "mtu={} delay={} jitter={} loss={} rate={}".format(
+            self.mtu, self.delay_ms, self.jitter_ms, self.loss_percent, self.rate)
+
+
+@pytest.fixture
+def emulated_network():
+    """
+    Factory fixture which creates a private network namespace for the test:
+
+        network = emulated_network(mtu=1500, delay_ms=20, loss_percent=0.1, rate="100mbit")
+        server = managed_process(S2N, server_options, network=network)
+
+    Unlike custom_mtu, nothing on the host changes. Each test gets its own
+    namespace, so tests using this fixture can run in parallel. All namespaces
+    are deleted after the test, even if it fails.
+
+    Creating a namespace needs root privileges, the test is skipped without them.
+    """
+    namespaces = []
+
+    def _fn(mtu=None, delay_ms=None, jitter_ms=None, loss_percent=None, rate=None):
+        if os.geteuid() != 0:
+            pytest.skip("Test needs root privileges to create a network namespace")
+
+        network = NetworkNamespace("s2n-{}".format(uuid.uuid4().hex[:12]),
+                mtu=mtu,
+                delay_ms=delay_ms,
+                jitter_ms=jitter_ms,
+                loss_percent=loss_percent,
+                rate=rate)
+
+        namespaces.append(network)
+        network.create()
+        return network
+
+    try:
+        yield _fn
+    finally:
+        for network in namespaces:
+            network.destroy()
@@ -12,6 +12,12 @@ S2N_FIPS_MODE = 's2n_fips_mode'
 # (set from the S2N_LIBCRYPTO env var, which is how the original integration test works)
 S2N_PROVIDER_VERSION = 's2n_provider_version'
 
+# File that benchmark results are appended to. Benchmarks are skipped if it is not set.
+S2N_BENCHMARK_OUTPUT = 's2n_benchmark_output'
+
+# Manifest written by pki.py. The certificates it lists are in configuration.GENERATED_CERTS.
+S2N_PKI_MANIFEST = 's2n_pki_manifest'
+
 _flags = {}
 
 def get_flag(name, default=None):
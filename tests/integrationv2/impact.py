@@ -0,0 +1,337 @@
+"""
+Test impact selection.
+
+This pytest plugin only runs the integration tests that can be affected by a
+change. The changed files are mapped through IMPACT_RULES to the test modules
+and parameters (cipher, curve, protocol, certificate) they affect, and every
+other test is deselected.
+
+Selection is opt in, with --changed-since=<git ref> or --changed-files=<a,b,c>.
+If any changed file is not covered by a rule, or the changed files can't be
+determined, every test runs. If no changed file affects any of the collected
+tests, e.g. a change to the docs only, nothing runs and pytest exits with 0.
+"""
+import collections
+import fnmatch
+import os
+import pytest
+import subprocess
+
+from common import Cipher, Curve, Cert, Protocol, Protocols
+
+
+# A rule maps changed files matching `pattern` to the tests they affect.
+# `modules` limits the rule to those test files ('self' means the changed file
+# itself), `params` is a predicate on the test's parameters. None matches every
+# test. A rule with both set to None forces a full run.
+ImpactRule = collections.namedtuple('ImpactRule', 'pattern modules params')
+
+
+def _collect(params, kind):
+    """
+    Return every parameter value of the given type, including values inside
+    lists (multi cipher tests) and MultiCertTest cases.
+    """
+    found = []
+    for value in params.values():
+        if hasattr(value, 'client_ciphers'):
+            value = value.client_ciphers
+        values = value if isinstance(value, (list, tuple)) else [value]
+        found.extend(v for v in values if isinstance(v, kind))
+
+    return found
+
+
+def cipher_contains(*fragments):
+    """
+    Tests using a cipher with any of the name fragments. Tests which don't pick
+    a cipher negotiate the default preferences, so they always match.
+    """
+    def _fn(params):
+        ciphers = _collect(params, Cipher)
+        if not ciphers:
+            return True
+        return any(f in c.name for c in ciphers for f in fragments)
+
+    return _fn
+
+
+def uses_protocol(protocol):
+    """
+    Tests negotiating the given protocol. Tests which don't pick one always match.
+    """
+    def _fn(params):
+        protocols = _collect(params, Protocol)
+        return not protocols or any(p == protocol for p in protocols)
+
+    return _fn
+
+
+def uses_protocol_below(protocol):
+    """
+    Tests negotiating a protocol older than the given one. Tests which don't pick one always match.
+    """
+    def _fn(params):
+        protocols = _collect(params, Protocol)
+        return not protocols or any(p < protocol for p in protocols)
+
+    return _fn
+
+
+def uses_ecc(params):
+    """
+    Tests using an ECDHE key exchange or TLS1.3 (which always uses (EC)DHE).
+    """
+    if _collect(params, Curve):
+        return True
+    return cipher_contains('ECDHE', 'TLS_')(params) or uses_protocol(Protocols.TLS13)(params)
+
+
+def cert_algorithm(*algorithms):
+    """
+    Tests using a certificate with one of the algorithms. Tests which don't pick
+    a certificate use the default RSA certificate.
+    """
+    def _fn(params):
+        certs = _collect(params, Cert)
+        if not certs:
+            return 'RSA' in algorithms
+        return any(c.algorithm in algorithms for c in certs)
+
+    return _fn
+
+
+def any_of(*predicates):
+    def _fn(params):
+        return any(p(params) for p in predicates)
+
+    return _fn
+
+
+# Changes to these files can't affect the integration tests
+IGNORED_PATTERNS = [
+    '*.md',
+    'docs/*',
+    'tests/unit/*',
+    'tests/fuzz/*',
+    'tests/cbmc/*',
+    'tests/saw/*',
+    'tests/sidetrail/*',
+    'tests/ctverif/*',
+    'tests/benchmark/*',
+    'tests/integration/*',
+    'scram/*',
+    '.github/*',
+    'codebuild/cfn/*',
+]
+
+# The first matching rule is used, so specific rules come before general ones.
+IMPACT_RULES = [
+    # Symmetric ciphers
+    ImpactRule('crypto/s2n_aead_cipher_chacha20_poly1305.c', None, cipher_contains('CHACHA20')),
+    ImpactRule('crypto/s2n_aead_cipher_aes_gcm.c', None, cipher_contains('GCM')),
+    ImpactRule('crypto/s2n_cbc_cipher_aes.c', None, cipher_contains('AES128-SHA', 'AES256-SHA')),
+    ImpactRule('crypto/s2n_composite_cipher_aes_sha.c', None, cipher_contains('AES128-SHA', 'AES256-SHA')),
+    ImpactRule('crypto/s2n_cbc_cipher_3des.c', None, cipher_contains('DES-CBC3')),
+    ImpactRule('crypto/s2n_stream_cipher_rc4.c', None, cipher_contains('RC4')),
+    ImpactRule('tls/s2n_record_read_aead.c', None, cipher_contains('GCM', 'CHACHA20')),
+    ImpactRule('tls/s2n_aead.c', None, cipher_contains('GCM', 'CHACHA20')),
+    ImpactRule('tls/s2n_record_read_cbc.c', None, cipher_contains('-SHA', 'DES-CBC3')),
+    ImpactRule('tls/s2n_cbc.c', None, cipher_contains('-SHA', 'DES-CBC3')),
+    ImpactRule('tls/s2n_record_read_composite.c', None, cipher_contains('AES128-SHA', 'AES256-SHA')),
+    ImpactRule('tls/s2n_record_read_stream.c', None, cipher_contains('RC4')),
+
+    # Key exchange
+    ImpactRule('crypto/s2n_dhe.*', None, cipher_contains('DHE-RSA')),
+    ImpactRule('crypto/s2n_ecc_evp.*', None, uses_ecc),
+    ImpactRule('tls/s2n_ecc_preferences.*', None, uses_ecc),
+    ImpactRule('tls/extensions/s2n_*key_share.*', None, uses_protocol(Protocols.TLS13)),
+    ImpactRule('tls/extensions/s2n_client_supported_groups.*', None, uses_ecc),
+    ImpactRule('tls/extensions/s2n_ec_point_format.*', None, uses_ecc),
+
+    # Authentication
+    ImpactRule('crypto/s2n_ecdsa.*', None, any_of(cert_algorithm('EC'), cipher_contains('ECDSA'))),
+    ImpactRule('crypto/s2n_rsa_pss.*', None, cert_algorithm('RSAPSS', 'RSA')),
+    ImpactRule('crypto/s2n_rsa*', None, cert_algorithm('RSA', 'RSAPSS')),
+    ImpactRule('tls/s2n_signature_*', ['test_signature_algorithms.py', 'test_client_authentication.py'], None),
+    ImpactRule('tls/extensions/s2n_*signature_algorithms.*', ['test_signature_algorithms.py', 'test_client_authentication.py'], None),
+    ImpactRule('tls/s2n_client_cert*', ['test_client_authentication.py'], None),
+    ImpactRule('tls/s2n_server_cert_request.c', ['test_client_authentication.py'], None),
+
+    # TLS1.3
+    ImpactRule('crypto/s2n_tls13_keys.*', None, uses_protocol(Protocols.TLS13)),
+    ImpactRule('crypto/s2n_hkdf.*', None, uses_protocol(Protocols.TLS13)),
+    ImpactRule('tls/s2n_tls13*', None, uses_protocol(Protocols.TLS13)),
+    ImpactRule('tls/s2n_server_hello_retry.c', ['test_hello_retry_requests.py'], None),
+    ImpactRule('tls/extensions/s2n_cookie.*', ['test_hello_retry_requests.py'], None),
+    ImpactRule('tls/extensions/s2n_*supported_versions.*', ['test_version_negotiation.py', 'test_happy_path.py'], None),
+    ImpactRule('tls/s2n_prf.*', None, uses_protocol_below(Protocols.TLS13)),
+
+    # Features with their own tests
+    ImpactRule('tls/extensions/s2n_*server_name.*', ['test_sni_match.py', 'test_well_known_endpoints.py'], None),
+    ImpactRule('tls/s2n_resume.*', ['test_session_resumption.py', 'test_session_resumption_benchmark.py'], None),
+    ImpactRule('tls/extensions/s2n_*session_ticket.*', ['test_session_resumption.py', 'test_session_resumption_benchmark.py'], None),
+    ImpactRule('tls/s2n_server_new_session_ticket.c', ['test_session_resumption.py', 'test_session_resumption_benchmark.py'], None),
+    ImpactRule('tls/s2n_record_write.c', ['test_dynamic_record_sizes.py', 'test_fragmentation.py', 'test_record_size_benchmark.py', 'test_happy_path.py'], None),
+    ImpactRule('tls/extensions/s2n_*max_frag*', ['test_fragmentation.py'], None),
+    ImpactRule('tls/s2n_x509_validator.*', ['test_sni_match.py', 'test_well_known_endpoints.py', 'test_client_authentication.py'], None),
+    ImpactRule('tls/s2n_kem*', ['test_pq_handshake.py', 'test_well_known_endpoints.py'], None),
+    ImpactRule('tls/extensions/s2n_client_pq_kem.*', ['test_pq_handshake.py', 'test_well_known_endpoints.py'], None),
+    ImpactRule('pq-crypto/*', ['test_pq_handshake.py', 'test_well_known_endpoints.py'], None),
+
+    # Every test depends on the default preferences
+    ImpactRule('tls/s2n_cipher_preferences.*', None, None),
+    ImpactRule('tls/s2n_security_policies.*', None, None),
+
+    # A test module only affects itself. Any other file (the rest of the library,
+    # the providers, the fixtures) isn't covered by a rule and affects everything.
+    ImpactRule('tests/integrationv2/test_*.py', 'self', None),
+]
+
+
+def match_rule(path):
+    """
+    Return the rule for a changed file, 'ignored' if it can't affect the tests,
+    or None if it isn't covered by any rule.
+    """
+    for pattern in IGNORED_PATTERNS:
+        if fnmatch.fnmatch(path, pattern):
+            return 'ignored'
+
+    for rule in IMPACT_RULES:
+        if fnmatch.fnmatch(path, rule.pattern):
+            return rule
+
+    return None
+
+
+def _changed_since(ref):
+    """
+    Files changed between ref and the working tree, and files not yet added to
+    git, relative to the repository root.
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    root = subprocess.check_output(['git', 'rev-parse', '--show-toplevel'], cwd=cwd).decode('utf-8').strip()
+    output = subprocess.check_output(['git', 'diff', '--name-only', ref], cwd=root).decode('utf-8')
+    output += subprocess.check_output(['git', 'ls-files', '--others', '--exclude-standard'], cwd=root).decode('utf-8')
+    return [line for line in output.splitlines() if line]
+
+
+def _rule_selects(rule, path, item):
+    if rule.modules == 'self':
+        return item.fspath.basename == os.path.basename(path)
+
+    if rule.modules is not None and item.fspath.basename not in rule.modules:
+        return False
+
+    if rule.params is not None:
+        params = item.callspec.params if hasattr(item, 'callspec') else {}
+        return rule.params(params)
+
+    return True
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("impact", "test impact selection")
+    group.addoption("--changed-since", action="store", dest="changed-since", default=None, type=str,
+            help="Only run tests affected by files changed since this git ref")
+    group.addoption("--changed-files", action="store", dest="changed-files", default=None, type=str,
+            help="Only run tests affected by these comma separated files (relative to the repository root)")
+
+
+# None is a valid selection, meaning run every test
+_NOT_SELECTED_YET = object()
+
+
+def pytest_configure(config):
+    config._impact_summary = None
+    config._impact_selection = _NOT_SELECTED_YET
+
+
+def _selection(config):
+    """
+    Return (changed files, [(rule, path)]) to select the tests with, or None to
+    run every test. Computed once per process: with pytest-xdist, the workers
+    select the tests and the controller decides the exit status.
+    """
+    if config._impact_selection is not _NOT_SELECTED_YET:
+        return config._impact_selection
+
+    selection = None
+    changed_since = config.getoption('changed-since', None)
+    changed_files = config.getoption('changed-files', None)
+    if changed_since or changed_files:
+        selection = _select(config, changed_since, changed_files)
+
+    config._impact_selection = selection
+    return selection
+
+
+def _select(config, changed_since, changed_files):
+    try:
+        if changed_files:
+            paths = [p.strip() for p in changed_files.split(',') if p.strip()]
+        else:
+            paths = _changed_since(changed_since)
+    except (OSError, subprocess.CalledProcessError) as e:
+        config._impact_summary = "impact selection: could not determine changed files ({}), running everything".format(e)
+        return None
+
+    rules = []
+    for path in paths:
+        rule = match_rule(path)
+        if rule == 'ignored':
+            continue
+        if rule is None or (rule.modules is None and rule.params is None):
+            config._impact_summary = "impact selection: {} affects every test, running everything".format(path)
+            return None
+        rules.append((rule, path))
+
+    return paths, rules
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(config, items):
+    """
+    Runs after the uncollect_if deselection in conftest.py, so the summary only
+    counts valid tests.
+    """
+    selection = _selection(config)
+    if selection is None:
+        return
+
+    paths, rules = selection
+    kept = []
+    removed = []
+    for item in items:
+        if any(_rule_selects(rule, path, item) for rule, path in rules):
+            kept.append(item)
+        else:
+            removed.append(item)
+
+    if removed:
+        config.hook.pytest_deselected(items=removed)
+        items[:] = kept
+
+    config._impact_summary = "impact selection: {} changed files, kept {} of {} tests".format(
+            len(paths), len(kept), len(kept) + len(removed))
+    if not kept:
+        config._impact_summary += ", nothing to run"
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """
+    A change that affects none of the tests leaves nothing to run, which is a
+    pass rather than pytest's "no tests collected" failure.
+    """
+    if session.exitstatus == pytest.ExitCode.NO_TESTS_COLLECTED and _selection(session.config) is not None:
+        session.exitstatus = pytest.ExitCode.OK
+
+
+def pytest_report_collectionfinish(config, items):
+    return config._impact_summary
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    if config._impact_summary is not None:
+        terminalreporter.write_line(config._impact_summary)
@@ -0,0 +1,219 @@
+import re
+
+from common import Protocols
+
+
+# Protocol names printed by OpenSSL and BoringSSL
+_PROTOCOL_NAMES = {
+    'TLSv1.3': Protocols.TLS13,
+    'TLSv1.2': Protocols.TLS12,
+    'TLSv1.1': Protocols.TLS11,
+    'TLSv1': Protocols.TLS10,
+    'SSLv3': Protocols.SSLv3,
+}
+
+# s2nc and s2nd print the protocol as a number
+_PROTOCOL_VALUES = {p.value: p for p in _PROTOCOL_NAMES.values()}
+
+
+def _protocol_from_name(value):
+    return _PROTOCOL_NAMES.get(value.decode('utf-8'))
+
+
+def _protocol_from_value(value):
+    return _PROTOCOL_VALUES.get(int(value))
+
+
+def _is_reused(value):
+    return value == b'Reused'
+
+
+def _text(value):
+    return value.decode('utf-8', errors='replace')
+
+
+class HandshakeOutput(object):
+    """
+    The handshake details a provider printed, parsed from its stdout.
+
+    Every field holds one value per time it was printed, in order. A process
+    which made several connections (e.g. with `reconnect`) has one value per
+    connection. The properties return the first value, or None if the field
+    was never printed.
+    """
+    def __init__(self, fields):
+        self._fields = fields
+
+    def values(self, field):
+        return self._fields.get(field, [])
+
+    def count(self, field):
+        return len(self.values(field))
+
+    def _first(self, field):
+        values = self.values(field)
+        return values[0] if values else None
+
+    @property
+    def protocol(self):
+        return self._first('protocol')
+
+    @property
+    def cipher(self):
+        return self._first('cipher')
+
+    @property
+    def curve(self):
+        return self._first('curve')
+
+    @property
+    def kem(self):
+        return self._first('kem')
+
+    @property
+    def signature_type(self):
+        return self._first('signature_type')
+
+    @property
+    def signature_digest(self):
+        return self._first('signature_digest')
+
+    @property
+    def signature_algorithm(self):
+        return self._first('signature_algorithm')
+
+    @property
+    def server_name(self):
+        return self._first('server_name')
+
+    @property
+    def session_ids(self):
+        return self.values('session_id')
+
+    @property
+    def resumed(self):
+        """
+        The number of resumed handshakes.
+        """
+        return len([v for v in self.values('resumed') if v])
+
+    @property
+    def bytes_read(self):
+        return sum(self.values('bytes_read'))
+
+    @property
+    def bytes_written(self):
+        return sum(self.values('bytes_written'))
+
+
+class OutputParser(object):
+    """
+    Parses a provider's stdout into a HandshakeOutput.
+
+    Subclasses list PATTERNS as (fields, pattern, converters) tuples. `pattern`
+    matches a whole line and has one group per name in `fields`; each group is
+    passed through the matching converter before being stored. A pattern
+    without groups stores True, so the field records each time the line was
+    printed.
+
+    All the patterns are combined into a single regular expression, so the
+    output is only scanned once no matter how many fields are parsed.
+    """
+    PATTERNS = []
+
+    @classmethod
+    def _compile(cls):
+        # Cached per subclass
+        if '_regex' in cls.__dict__:
+            return cls._regex, cls._groups
+
+        alternatives = []
+        groups = {}
+        group_index = 1
+        for index, (fields, pattern, converters) in enumerate(cls.PATTERNS):
+            name = 'p{}'.format(index)
+            inner_groups = re.compile(pattern).groups
+            if inner_groups != len(fields) and inner_groups != 0:
+                raise ValueError("Pattern {} has {} groups for fields {}".format(pattern, inner_groups, fields))
+
+            alternatives.append(b'(?P<' + name.encode('utf-8') + b'>' + pattern + b')')
+            groups[name] = (fields, group_index + 1, inner_groups, converters)
+            group_index += 1 + inner_groups
+
+        cls._regex = re.compile(b'^(?:' + b'|'.join(alternatives) + b')[ \t\r]*$', re.MULTILINE)
+        cls._groups = groups
+
+        return cls._regex, cls._groups
+
+    @classmethod
+    def parse(cls, stdout):
+        regex, groups = cls._compile()
+
+        fields = {}
+        for match in regex.finditer(stdout or b''):
+            names, first_group, inner_groups, converters = groups[match.lastgroup]
+            if inner_groups == 0:
+                values = [True] * len(names)
+            else:
+                values = [converters[i](match.group(first_group + i)) for i in range(inner_groups)]
+
+            for name, value in zip(names, values):
+                fields.setdefault(name, []).append(value)
+
+        return HandshakeOutput(fields)
+
+
+class S2NOutputParser(OutputParser):
+    """
+    s2nc and s2nd print these lines (see bin/echo.c) after every handshake.
+    """
+    PATTERNS = [
+        (('protocol',), rb'Actual protocol version: (\d+)', (_protocol_from_value,)),
+        (('client_protocol',), rb'Client protocol version: (\d+)', (_protocol_from_value,)),
+        (('server_protocol',), rb'Server protocol version: (\d+)', (_protocol_from_value,)),
+        (('cipher',), rb'Cipher negotiated: (\S+)', (_text,)),
+        (('curve',), rb'Curve: (\S+)', (_text,)),
+        (('kem',), rb'KEM: (\S+)', (_text,)),
+        (('server_name',), rb'Server name: (.*?)', (_text,)),
+        (('application_protocol',), rb'Application protocol: (.*?)', (_text,)),
+        (('resumed',), rb'Resumed session', None),
+    ]
+
+
+class OpenSSLOutputParser(OutputParser):
+    """
+    Lines printed by `openssl s_client` and `openssl s_server`. The -debug hex
+    dumps are skipped because every pattern must match a whole line.
+    """
+    PATTERNS = [
+        # s_client, in the session summary
+        (('protocol',), rb'[ \t]+Protocol[ \t]+: (\S+)', (_protocol_from_name,)),
+        (('session_id',), rb'[ \t]+Session-ID: ([0-9A-F]*)', (_text,)),
+        (('resumed', 'cipher'), rb'(New|Reused), [^,]+, Cipher is (\S+)', (_is_reused, _text)),
+        (('curve',), rb'Server Temp Key: (?:ECDH, )?([^,]+),.*', (_text,)),
+        (('signature_digest',), rb'Peer signing digest: (\S+)', (_text,)),
+        (('signature_type',), rb'Peer signature type: (\S+)', (_text,)),
+        (('bytes_read', 'bytes_written'), rb'SSL handshake has read (\d+) bytes and written (\d+) bytes', (int, int)),
+
+        # s_server
+        (('protocol',), rb'Protocol version: (\S+)', (_protocol_from_name,)),
+        (('cipher',), rb'CIPHER is (\S+)', (_text,)),
+        (('resumed',), rb'Reused session-id', None),
+        (('shared_curves',), rb'Shared (?:Elliptic )?groups: (.*?)', (_text,)),
+        (('shared_signature_algorithms',), rb'Shared Signature Algorithms: (.*?)', (_text,)),
+        (('accepts_finished',), rb'[ \t]*(\d+) server accepts that finished', (int,)),
+    ]
+
+
+class BoringSSLOutputParser(OutputParser):
+    """
+    Lines printed by `bssl s_client` once connected.
+    """
+    PATTERNS = [
+        (('protocol',), rb'[ \t]+Version: (\S+)', (_protocol_from_name,)),
+        (('resumed',), rb'[ \t]+Resumed session: yes', None),
+        (('cipher',), rb'[ \t]+Cipher: (\S+)', (_text,)),
+        (('curve',), rb'[ \t]+ECDHE curve: (\S+)', (_text,)),
+        (('signature_algorithm',), rb'[ \t]+Signature algorithm: (\S+)', (_text,)),
+        (('application_protocol',), rb'[ \t]+ALPN protocol: (.*?)', (_text,)),
+    ]
@@ -0,0 +1,120 @@
+"""
+Copies the PEMs used by the tests into a cache directory (ideally on a tmpfs
+such as /dev/shm) once per session, so the thousands of provider processes
+don't all open them on a slow, possibly network mounted, checkout.
+"""
+import os
+import shutil
+import ssl
+import tempfile
+
+from common import Cert, Cipher, Certificates, Ciphers
+from constants import TEST_CERT_DIRECTORY, TRUST_STORE_BUNDLE, TRUST_STORE_TRUSTED_BUNDLE
+
+
+class PemCache(object):
+    """
+    A mirror of the PEMs in TEST_CERT_DIRECTORY, keeping the same layout.
+    Files are hard linked when the cache is on the same filesystem, and
+    copied otherwise.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        # Original path -> path in the cache
+        self.paths = {}
+
+    def add(self, path):
+        cached = self.paths.get(path)
+        if cached is not None:
+            return cached
+
+        relative = os.path.relpath(path, TEST_CERT_DIRECTORY)
+        if relative.startswith(os.pardir):
+            raise ValueError("{} is not in {}".format(path, TEST_CERT_DIRECTORY))
+
+        cached = os.path.join(self.directory, relative)
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        try:
+            os.link(path, cached)
+        except OSError:
+            shutil.copyfile(path, cached)
+
+        self.paths[path] = cached
+        return cached
+
+    def rewrite(self, cmd_line):
+        """
+        Point any argument which is a cached PEM at the copy in the cache.
+        """
+        return [self.paths.get(arg, arg) for arg in cmd_line]
+
+
+def _validate(cert=None, key=None, dhparams=None, trust_store=None):
+    """
+    Load the files the same way a TLS server would, so a missing or corrupt
+    PEM fails the whole session once instead of every test using it.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    # The test certificates include keys too small for the default security level
+    context.set_ciphers('ALL:@SECLEVEL=0')
+
+    if cert is not None:
+        context.load_cert_chain(cert, key)
+    if dhparams is not None:
+        context.load_dh_params(dhparams)
+    if trust_store is not None:
+        context.load_verify_locations(trust_store)
+
+
+def _class_values(cls, kind):
+    return [v for v in vars(cls).values() if isinstance(v, kind)]
+
+
+def preload_pems(cache_root, validate=False):
+    """
+    Copy every PEM referenced by Certificates, the Ciphers' DH parameters, the
+    SNI certificates and the trust stores into a new directory under
+    cache_root, and point the Cert and Cipher objects at the copies.
+
+    Returns the PemCache and a function restoring the original paths.
+    """
+    # configuration imports the providers, which read the command line flags
+    from configuration import SNI_CERTS
+
+    cache = PemCache(tempfile.mkdtemp(prefix='s2n-pems-', dir=cache_root))
+    originals = []
+
+    for cert in _class_values(Certificates, Cert):
+        originals.append((cert, 'cert', cert.cert))
+        originals.append((cert, 'key', cert.key))
+        cert.cert = cache.add(cert.cert)
+        cert.key = cache.add(cert.key)
+        if validate:
+            _validate(cert=cert.cert, key=cert.key)
+
+    for cipher in _class_values(Ciphers, Cipher):
+        if cipher.parameters is not None:
+            originals.append((cipher, 'parameters', cipher.parameters))
+            cipher.parameters = cache.add(cipher.parameters)
+            if validate:
+                _validate(dhparams=cipher.parameters)
+
+    # The SNI certificates are tuples shared by the test cases, so they keep
+    # their paths and are rewritten on the command line instead.
+    for cert_path, key_path, _ in SNI_CERTS.values():
+        cache.add(cert_path)
+        cache.add(key_path)
+        if validate:
+            _validate(cert=cache.add(cert_path), key=cache.add(key_path))
+
+    for bundle in (TRUST_STORE_BUNDLE, TRUST_STORE_TRUSTED_BUNDLE):
+        cache.add(bundle)
+        if validate:
+            _validate(trust_store=cache.add(bundle))
+
+    def restore():
+        for obj, attr, value in originals:
+            setattr(obj, attr, value)
+        shutil.rmtree(cache.directory, ignore_errors=True)
+
+    return cache, restore
@@ -0,0 +1,281 @@
+"""
+Generates test PKI hierarchies: a root CA, a chain of intermediates and a leaf
+certificate, for every combination of key type, chain depth and SAN count
+requested, plus any number of single-name certificates for SNI tests.
+
+Hierarchies are generated in parallel with the openssl command line tool.
+Each one is stored in a directory named after the hash of its specification,
+so re-running with the same options only generates what is missing, and an
+interrupted run can simply be restarted. A manifest listing every hierarchy is
+written last; load it with load_certificates() or pass it to the integration
+tests with --pki-manifest.
+
+    python pki.py --key-types rsa:2048,rsa:4096,ecdsa:P-256 --depths 1,3 --san-counts 1,100 --sni 50
+"""
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import Cert
+
+
+DEFAULT_OUTPUT_DIRECTORY = "../pems/generated/"
+MANIFEST_NAME = "manifest.json"
+
+# Bump this when the generated material changes, so old hierarchies are regenerated
+GENERATOR_VERSION = 1
+
+_DAYS = "36500"
+
+# A single hierarchy to generate.
+#   name: the Cert name. It includes the key type, so Cert picks the right algorithm.
+#   key_type: 'rsa', 'rsa-pss' or 'ecdsa'
+#   key_param: RSA key size or ECDSA curve name (e.g. P-256)
+#   depth: the number of CA certificates above the leaf, 1 means the root signs the leaf
+#   sans: DNS names for the leaf, the first is also the CN
+PkiSpec = collections.namedtuple('PkiSpec', 'name key_type key_param digest depth sans')
+
+
+def spec_hash(spec):
+    content = json.dumps([GENERATOR_VERSION, spec._asdict()], sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+
+def _run(cmd, cwd):
+    subprocess.run(cmd, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def _generate_key(spec, path, cwd):
+    if spec.key_type == 'ecdsa':
+        cmd = ['openssl', 'genpkey', '-algorithm', 'EC', '-pkeyopt', 'ec_paramgen_curve:{}'.format(spec.key_param)]
+    elif spec.key_type == 'rsa-pss':
+        cmd = ['openssl', 'genpkey', '-algorithm', 'RSA-PSS', '-pkeyopt', 'rsa_keygen_bits:{}'.format(spec.key_param)]
+    else:
+        cmd = ['openssl', 'genpkey', '-algorithm', 'RSA', '-pkeyopt', 'rsa_keygen_bits:{}'.format(spec.key_param)]
+
+    _run(cmd + ['-out', path], cwd)
+
+
+def _write_extensions(path, is_ca, sans):
+    lines = ["[ext]"]
+    if is_ca:
+        lines += [
+            "basicConstraints = critical, CA:TRUE",
+            "keyUsage = critical, keyCertSign, cRLSign, digitalSignature",
+        ]
+    else:
+        lines += [
+            "basicConstraints = CA:FALSE",
+            "keyUsage = keyEncipherment, dataEncipherment, digitalSignature",
+            "extendedKeyUsage = serverAuth, clientAuth",
+            "subjectAltName = " + ",".join("DNS:" + san for san in sans),
+        ]
+    lines += [
+        "subjectKeyIdentifier = hash",
+        "[req]",
+        "distinguished_name = dn",
+        "[dn]",
+    ]
+
+    with open(path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _generate_hierarchy(spec, directory):
+    """
+    Generate one hierarchy into directory, which must be empty.
+    """
+    subject = "/C=US/ST=WA/L=Seattle/O=Amazon/OU=s2n/CN={}"
+
+    issuer = None
+    chain = []
+    for level in range(spec.depth + 1):
+        is_leaf = (level == spec.depth)
+        name = "leaf" if is_leaf else "ca{}".format(level)
+        key = name + "_key.pem"
+        cert = name + "_cert.pem"
+        ext = name + ".cnf"
+
+        _generate_key(spec, key, directory)
+        _write_extensions(os.path.join(directory, ext), not is_leaf, spec.sans)
+        cn = spec.sans[0] if is_leaf else "s2n test {} {}".format(spec.name, name)
+
+        if issuer is None:
+            _run(['openssl', 'req', '-x509', '-new', '-key', key, '-subj', subject.format(cn), '-days', _DAYS,
+                '-' + spec.digest, '-config', ext, '-extensions', 'ext', '-out', cert], directory)
+        else:
+            csr = name + ".csr"
+            _run(['openssl', 'req', '-new', '-key', key, '-subj', subject.format(cn), '-config', ext, '-out', csr], directory)
+            _run(['openssl', 'x509', '-req', '-in', csr, '-CA', issuer[0], '-CAkey', issuer[1],
+                '-set_serial', str(level + 1), '-days', _DAYS, '-' + spec.digest,
+                '-extfile', ext, '-extensions', 'ext', '-out', cert], directory)
+
+        chain.append(cert)
+        issuer = (cert, key)
+
+    def read(name):
+        with open(os.path.join(directory, name)) as f:
+            return f.read()
+
+    # The certificate file holds the leaf followed by the intermediates, which is
+    # what s2nd and s_server expect. The root is only in the CA file.
+    prefix = spec.name.lower()
+    with open(os.path.join(directory, prefix + "_cert.pem"), 'w') as f:
+        f.write("".join(read(c) for c in reversed(chain[1:])))
+    shutil.copyfile(os.path.join(directory, "leaf_key.pem"), os.path.join(directory, prefix + "_key.pem"))
+    shutil.copyfile(os.path.join(directory, chain[0]), os.path.join(directory, prefix + "_ca_cert.pem"))
+
+
+def generate(spec, output_directory):
+    """
+    Generate a hierarchy unless it already exists. Returns (spec, directory, generated).
+
+    The hierarchy is built in a temporary directory and renamed into place, so
+    a directory named after the spec hash is always complete.
+    """
+    directory = os.path.join(output_directory, spec_hash(spec))
+    if os.path.isdir(directory):
+        return spec, directory, False
+
+    work = tempfile.mkdtemp(prefix='.tmp-', dir=output_directory)
+    try:
+        _generate_hierarchy(spec, work)
+        os.rename(work, directory)
+    except OSError:
+        # Another run generated the same hierarchy first
+        if not os.path.isdir(directory):
+            raise
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    return spec, directory, True
+
+
+def _key_name(key_type, key_param):
+    if key_type == 'ecdsa':
+        return "ECDSA_" + key_param.replace('-', '')
+    if key_type == 'rsa-pss':
+        return "RSA_PSS_{}".format(key_param)
+    return "RSA_{}".format(key_param)
+
+
+def build_specs(key_types, depths, san_counts, digest, sni_count):
+    specs = []
+    for key_type, key_param in key_types:
+        for depth in depths:
+            for san_count in san_counts:
+                name = "{}_{}_DEPTH{}_SANS{}".format(_key_name(key_type, key_param), digest.upper(), depth, san_count)
+                sans = ["{}.s2n.test".format(name.lower().replace('_', '-'))]
+                sans += ["san{}.{}".format(i, sans[0]) for i in range(1, san_count)]
+                specs.append(PkiSpec(name, key_type, key_param, digest, depth, sans))
+
+    # SNI certificates use the first key type, and are signed directly by their own root
+    key_type, key_param = key_types[0]
+    for i in range(sni_count):
+        name = "{}_{}_SNI{}".format(_key_name(key_type, key_param), digest.upper(), i)
+        specs.append(PkiSpec(name, key_type, key_param, digest, 1, ["sni{}.s2n.test".format(i)]))
+
+    return specs
+
+
+def write_manifest(output_directory, results):
+    certificates = []
+    for spec, directory, _ in results:
+        prefix = spec.name.lower()
+        certificates.append({
+            "name": spec.name,
+            "directory": os.path.relpath(directory, output_directory),
+            "prefix": prefix,
+            "ca": prefix + "_ca_cert.pem",
+            "key_type": spec.key_type,
+            "key_param": spec.key_param,
+            "digest": spec.digest,
+            "depth": spec.depth,
+            "sans": spec.sans,
+        })
+
+    path = os.path.join(output_directory, MANIFEST_NAME)
+    with open(path + ".tmp", 'w') as f:
+        json.dump({"version": GENERATOR_VERSION, "certificates": certificates}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+    return path
+
+
+def load_certificates(manifest_path):
+    """
+    Return a Cert for every hierarchy in a manifest written by this tool. Each
+    Cert also has `ca` (the root to trust), `sans` and `depth`.
+    An empty list is returned if manifest_path is None.
+    """
+    if manifest_path is None:
+        return []
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    base = os.path.dirname(manifest_path)
+    certificates = []
+    for entry in manifest["certificates"]:
+        location = os.path.join(base, entry["directory"]) + os.sep
+        cert = Cert(entry["name"], entry["prefix"], location=location)
+        cert.ca = location + entry["ca"]
+        cert.sans = entry["sans"]
+        cert.depth = entry["depth"]
+        certificates.append(cert)
+
+    return certificates
+
+
+def _parse_key_type(value):
+    key_type, _, key_param = value.partition(':')
+    if key_type not in ('rsa', 'rsa-pss', 'ecdsa') or not key_param:
+        raise argparse.ArgumentTypeError("Expected rsa:<bits>, rsa-pss:<bits> or ecdsa:<curve>, not {}".format(value))
+    return key_type, key_param
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIRECTORY, help="Directory for the hierarchies and the manifest")
+    parser.add_argument("--key-types", default=[('rsa', '2048')], type=lambda v: [_parse_key_type(k) for k in v.split(',')],
+            help="Comma separated rsa:<bits>, rsa-pss:<bits> or ecdsa:<curve> (default rsa:2048)")
+    parser.add_argument("--depths", default=[1], type=_int_list, help="Comma separated numbers of CAs above the leaf (default 1)")
+    parser.add_argument("--san-counts", default=[1], type=_int_list, help="Comma separated numbers of SANs on the leaf (default 1)")
+    parser.add_argument("--digest", default="sha256")
+    parser.add_argument("--sni", default=0, type=int, help="Also generate this many certificates with unique names")
+    parser.add_argument("--jobs", default=os.cpu_count(), type=int)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    # Generated material is never checked in
+    with open(os.path.join(args.output, ".gitignore"), 'w') as f:
+        f.write("*\n")
+
+    specs = build_specs(args.key_types, args.depths, args.san_counts, args.digest, args.sni)
+
+    start = time.monotonic()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        results = list(executor.map(generate, specs, [args.output] * len(specs)))
+
+    manifest = write_manifest(args.output, results)
+    generated = len([r for r in results if r[2]])
+    print("Generated {} hierarchies, {} already existed, in {:.1f}s. Manifest: {}".format(
+        generated, len(results) - generated, time.monotonic() - start, manifest))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
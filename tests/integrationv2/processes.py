@@ -12,6 +12,9 @@ from time import monotonic as _time
 _PopenSelector = selectors.PollSelector
 _PIPE_BUF = getattr(select, 'PIPE_BUF', 512)
 
+# Most seconds between two samples of a process' peak RSS
+_PEAK_RSS_INTERVAL = .05
+
 
 class _processCommunicator(object):
     """
@@ -44,6 +47,12 @@ class _processCommunicator(object):
         # during the initial call.
         self._communication_started = False
 
+        # The child's resource usage, from os.wait4 once it has exited
+        self.rusage = None
+
+        # The child's peak RSS in kB, sampled from /proc while it runs
+        self.peak_rss_kb = None
+
     def wait_for(self, wait_for_marker, timeout=None):
         """
         Wait for a specific marker in stdout.
@@ -143,7 +152,9 @@ class _processCommunicator(object):
                         '_check_timeout(..., skip_check_and_raise=True) '
                         'failed to raise TimeoutExpired.')
 
-                ready = selector.select(timeout)
+                # Wake up now and then to sample the peak RSS, even if the process is quiet
+                ready = selector.select(_PEAK_RSS_INTERVAL if timeout is None else min(timeout, _PEAK_RSS_INTERVAL))
+                self._sample_peak_rss()
                 self._check_timeout(endtime, orig_timeout, stdout, stderr)
 
                 for key, events in ready:
@@ -189,7 +200,7 @@ class _processCommunicator(object):
                     input_data_sent = None
                     self.proc.stdin.close()
 
-        self.proc.wait(timeout=self._remaining_time(endtime))
+        self._wait4(endtime, orig_timeout, stdout, stderr)
 
         # All data exchanged.  Translate lists into strings.
         if stdout is not None:
@@ -199,6 +210,56 @@ class _processCommunicator(object):
 
         return (stdout, stderr)
 
+    def _wait4(self, endtime, orig_timeout, stdout_seq, stderr_seq):
+        """
+        Reap the process like Popen.wait(), but with os.wait4 so the child's
+        resource usage isn't thrown away. Popen only waits for a process
+        without a returncode, so setting it here keeps Popen from reaping it again.
+        """
+        if self.proc.returncode is not None:
+            return
+
+        delay = 0.0005
+        while True:
+            # The process' memory is released when it exits, so sample it before every attempt to reap it
+            self._sample_peak_rss()
+            pid, status, rusage = os.wait4(self.proc.pid, os.WNOHANG)
+            if pid == self.proc.pid:
+                break
+
+            self._check_timeout(endtime, orig_timeout, stdout_seq, stderr_seq)
+            delay = min(delay * 2, _PEAK_RSS_INTERVAL)
+            if endtime is not None:
+                delay = min(delay, self._remaining_time(endtime))
+            time.sleep(max(delay, 0))
+
+        if os.WIFSIGNALED(status):
+            self.proc.returncode = -os.WTERMSIG(status)
+        else:
+            self.proc.returncode = os.WEXITSTATUS(status)
+        self.rusage = rusage
+
+    def _sample_peak_rss(self):
+        """
+        Read the process' high-water RSS (VmHWM) from /proc. ru_maxrss from
+        os.wait4 can't be used for this: it includes the memory of the pytest
+        process the child was forked from, up to the exec. VmHWM only grows, so
+        the last sample taken before the process exits is its peak, short of
+        whatever it allocated after that sample.
+        """
+        if self.proc.returncode is not None:
+            return
+
+        try:
+            with open("/proc/{}/status".format(self.proc.pid)) as status:
+                for line in status:
+                    if line.startswith("VmHWM:"):
+                        self.peak_rss_kb = int(line.split()[1])
+                        return
+        except OSError:
+            # Not Linux, or the process is gone
+            pass
+
     def _remaining_time(self, endtime):
         """Convenience for _communicate when computing timeouts."""
         if endtime is None:
@@ -231,12 +292,15 @@ class ManagedProcess(threading.Thread):
     The stdin/stdout/stderr and exist code a monitored and results
     are made available to the caller.
     """
-    def __init__(self, cmd_line, provider_set_ready_condition, wait_for_marker=None, ready_to_send=None, timeout=5, data_source=None):
+    def __init__(self, cmd_line, provider_set_ready_condition, wait_for_marker=None, ready_to_send=None, timeout=5, data_source=None, output_parser=None):
         threading.Thread.__init__(self)
 
         # Command line to execute in the subprocess
         self.cmd_line = cmd_line
 
+        # Parses the handshake details out of stdout, see parsers.py
+        self.output_parser = output_parser
+
         # Total time to wait until killing the subprocess
         self.timeout = timeout
 
@@ -266,14 +330,19 @@ class ManagedProcess(threading.Thread):
     def run(self):
         with self.results_condition:
             try:
+                start = time.perf_counter()
                 proc = subprocess.Popen(self.cmd_line, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
                 self.proc = proc
             except Exception as ex:
-                self.results = Results(None, None, None, ex)
+                self.results = Results(None, None, None, ex, self.output_parser)
                 raise ex
 
             communicator = _processCommunicator(proc)
 
+            def results(proc_results, exception):
+                return Results(proc_results[0], proc_results[1], proc.returncode, exception, self.output_parser,
+                        rusage=communicator.rusage, peak_rss_kb=communicator.peak_rss_kb, wall_time=time.perf_counter() - start)
+
             if self.ready_to_test is not None:
                 # Some processes won't be ready until they have emitted some string in stdout.
                 communicator.wait_for(self.ready_to_test, timeout=self.timeout)
@@ -284,16 +353,16 @@ class ManagedProcess(threading.Thread):
             proc_results = None
             try:
                 proc_results = communicator.communicate(input_data=self.data_source, ready_to_send=self.ready_to_send, timeout=self.timeout)
-                self.results = Results(proc_results[0], proc_results[1], proc.returncode, None)
+                self.results = results(proc_results, None)
             except subprocess.TimeoutExpired as ex:
                 proc.kill()
                 wrapped_ex = TimeoutException(ex)
 
                 # Read any remaining output
                 proc_results = communicator.communicate()
-                self.results = Results(proc_results[0], proc_results[1], proc.returncode, wrapped_ex)
+                self.results = results(proc_results, wrapped_ex)
             except Exception as ex:
-                self.results = Results(proc_results[0], proc_results[1], proc.returncode, ex)
+                self.results = results(proc_results, ex)
                 raise ex
             finally:
                 # This data is dumped to stdout so we capture this
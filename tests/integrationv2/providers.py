@@ -1,8 +1,80 @@
+import collections
 import pytest
+import sys
 import threading
 
 from common import ProviderOptions, Ciphers, Curves, Protocols
 from global_flags import get_flag, S2N_PROVIDER_VERSION
+from parsers import S2NOutputParser, OpenSSLOutputParser, BoringSSLOutputParser
+
+
+class CommandLineTemplates(object):
+    """
+    A cache of the command lines built by the providers.
+
+    The command line only depends on the provider, the mode and the
+    ProviderOptions, and most of those repeat across thousands of test cases.
+    Only the port is different for every test. So each command line is built
+    once with a placeholder port, and later providers with the same options
+    copy the template and fill in their port.
+
+    `hits` and `misses` count the template lookups, so the time spent building
+    command lines shows up when profiling a run.
+    """
+
+    PORT_PLACEHOLDER = '<port>'
+
+    _templates = {}
+    hits = 0
+    misses = 0
+
+    # Options which don't change the command line
+    _ignored_options = ('port', 'data_to_send')
+
+    @staticmethod
+    def _hashable(value):
+        if isinstance(value, (list, tuple)):
+            return tuple(CommandLineTemplates._hashable(v) for v in value)
+        if value is None or isinstance(value, (str, int, bool)):
+            return value
+        # Ciphers, curves and protocols are identified by their names
+        return (type(value).__name__, str(value))
+
+    @classmethod
+    def key(cls, provider_class, options):
+        values = tuple((name, cls._hashable(value)) for name, value in sorted(vars(options).items())
+                if name not in cls._ignored_options)
+
+        # Some providers wait for the handshake before sending data, so only
+        # whether there is data to send matters.
+        return (provider_class, values, options.data_to_send is not None)
+
+    @classmethod
+    def get(cls, key):
+        template = cls._templates.get(key)
+        if template is None:
+            cls.misses += 1
+        else:
+            cls.hits += 1
+
+        return template
+
+    @classmethod
+    def add(cls, key, template):
+        cls._templates[key] = template
+
+    @classmethod
+    def clear(cls):
+        cls._templates = {}
+        cls.hits = 0
+        cls.misses = 0
+
+
+# A command line built with CommandLineTemplates.PORT_PLACEHOLDER. `port_args` are the
+# indexes of the arguments containing the placeholder. The markers and the ready
+# state are whatever the provider's setup left behind.
+CommandLineTemplate = collections.namedtuple('CommandLineTemplate',
+        'cmd_line port_args ready_to_test_marker ready_to_send_input_marker provider_ready')
 
 
 class Provider(object):
@@ -14,6 +86,9 @@ class Provider(object):
     ClientMode = "client"
     ServerMode = "server"
 
+    # The OutputParser for this provider's stdout, used by Results.output
+    output_parser = None
+
     def __init__(self, options: ProviderOptions):
         # If the test should wait for a specific output message before beginning,
         # put that message in ready_to_test_marker
@@ -31,10 +106,42 @@ class Provider(object):
             raise TypeError
 
         self.options = options
-        if self.options.mode == Provider.ServerMode:
-            self.cmd_line = self.setup_server()
-        elif self.options.mode == Provider.ClientMode:
-            self.cmd_line = self.setup_client()
+        if self.options.mode in (Provider.ServerMode, Provider.ClientMode):
+            self.cmd_line = self._build_cmd_line()
+
+    def _build_cmd_line(self):
+        """
+        Return the command line from CommandLineTemplates, or run the provider's
+        setup with a placeholder port and add the result as a new template.
+        """
+        key = CommandLineTemplates.key(type(self), self.options)
+        template = CommandLineTemplates.get(key)
+
+        if template is None:
+            port = self.options.port
+            self.options.port = CommandLineTemplates.PORT_PLACEHOLDER
+            try:
+                if self.options.mode == Provider.ServerMode:
+                    cmd_line = self.setup_server()
+                else:
+                    cmd_line = self.setup_client()
+            finally:
+                self.options.port = port
+
+            port_args = [i for i, arg in enumerate(cmd_line) if CommandLineTemplates.PORT_PLACEHOLDER in arg]
+            template = CommandLineTemplate(tuple(cmd_line), port_args, self.ready_to_test_marker,
+                    self.ready_to_send_input_marker, self._provider_ready)
+            CommandLineTemplates.add(key, template)
+        else:
+            self.ready_to_test_marker = template.ready_to_test_marker
+            self.ready_to_send_input_marker = template.ready_to_send_input_marker
+            self._provider_ready = template.provider_ready
+
+        cmd_line = list(template.cmd_line)
+        for i in template.port_args:
+            cmd_line[i] = cmd_line[i].replace(CommandLineTemplates.PORT_PLACEHOLDER, self.options.port)
+
+        return cmd_line
 
     def setup_client(self):
         """
@@ -76,23 +183,37 @@ class Tcpdump(Provider):
     TcpDump is used by the dynamic record test. It only needs to watch
     a handful of packets before it can exit.
 
+    The raw packets are written to stdout in pcap format, use the helpers
+    in capture.py to decode the TCP segments and TLS records.
+
     This class still follows the provider setup, but all values are hardcoded
     because this isn't expected to be used outside of the dynamic record test.
+    Tests needing a different capture can subclass and override packet_count
+    or capture_filter.
     """
+
+    # Number of packets to capture before exiting.
+    packet_count = 10
+
+    # Format string for the capture filter, the port is filled in from the options.
+    capture_filter = "dst port {}"
+
     def __init__(self, options: ProviderOptions):
         Provider.__init__(self, options)
 
     def setup_client(self):
         self.ready_to_test_marker = 'listening on lo'
-        tcpdump_filter = "dst port {}".format(self.options.port)
+        tcpdump_filter = self.capture_filter.format(self.options.port)
 
         cmd_line = ["tcpdump",
-            # Line buffer the output
-            "-l",
+            # Write raw pcap to stdout, flushing after every packet so
+            # nothing is lost if the process has to be killed.
+            "-w", "-",
+            "-U",
 
-            # Only read 10 packets before exiting. This is enough to find a large
-            # packet, and still exit before the timeout.
-            "-c", "10",
+            # Only read packet_count packets before exiting. The default is
+            # enough to find a large packet, and still exit before the timeout.
+            "-c", str(self.packet_count),
 
             # Watch the loopback device
             "-i", "lo",
@@ -111,6 +232,8 @@ class S2N(Provider):
     """
     The S2N provider translates flags into s2nc/s2nd command line arguments.
     """
+    output_parser = S2NOutputParser
+
     def __init__(self, options: ProviderOptions):
         self.ready_to_send_input_marker = None
         Provider.__init__(self, options)
@@ -213,6 +336,10 @@ class S2N(Provider):
         if self.options.reconnects_before_exit is not None:
             cmd_line.append('--max-conns={}'.format(self.options.reconnects_before_exit))
 
+        if self.options.data_to_send is not None:
+            # s2nd forwards stdin to the client once the handshake is complete
+            self.ready_to_send_input_marker = 'Cipher negotiated:'
+
         if self.options.extra_flags is not None:
             cmd_line.extend(self.options.extra_flags)
 
@@ -223,6 +350,8 @@ class S2N(Provider):
 
 class OpenSSL(Provider):
 
+    output_parser = OpenSSLOutputParser
+
     _version = get_flag(S2N_PROVIDER_VERSION)
 
     def __init__(self, options: ProviderOptions):
@@ -416,12 +545,69 @@ class OpenSSL(Provider):
         return cmd_line
 
 
+class TimedClient(Provider):
+    """
+    TimedClient runs timed_client.py, a Python TLS client that reads until the
+    server closes the connection and reports how long the handshake, the first
+    and the last application byte took, and the size of every application data
+    record. It is used by the benchmarks and only supports client mode.
+
+    If reconnects_before_exit is set, the client instead measures that many
+    handshakes. Set reconnect to resume the previous session on each of them.
+    To send a different server name on each handshake, pass several
+    '--server-name' arguments in extra_flags.
+    """
+    def __init__(self, options: ProviderOptions):
+        Provider.__init__(self, options)
+
+    @classmethod
+    def supports_protocol(cls, protocol, with_cert=None):
+        # Older protocols are disabled in the libcrypto Python is usually linked with
+        return protocol >= Protocols.TLS12
+
+    @classmethod
+    def supports_cipher(cls, cipher, with_curve=None):
+        # Python's ssl module can't restrict the TLS1.3 ciphersuites
+        return cipher.min_version < Protocols.TLS13
+
+    def setup_server(self):
+        pytest.skip('TimedClient does not support server mode')
+
+    def setup_client(self):
+        cmd_line = [sys.executable, 'timed_client.py', self.options.host, self.options.port]
+
+        if self.options.protocol is not None:
+            cmd_line.extend(['--protocol', self.options.protocol.name])
+
+        if self.options.cipher is not None:
+            cmd_line.extend(['--cipher', self.options.cipher.name])
+
+        if self.options.reconnects_before_exit is not None:
+            cmd_line.extend(['--connections', str(self.options.reconnects_before_exit)])
+
+        if self.options.reconnect is True:
+            cmd_line.append('--resume')
+
+        if self.options.server_name is not None:
+            cmd_line.extend(['--server-name', self.options.server_name])
+
+        if self.options.extra_flags is not None:
+            cmd_line.extend(self.options.extra_flags)
+
+        # Clients are always ready to connect
+        self.set_provider_ready()
+
+        return cmd_line
+
+
 class BoringSSL(Provider):
     """
     NOTE: In order to focus on the general use of this framework, BoringSSL
     is not yet supported. The client works, the server has not yet been
     implemented, neither are in the default configuration.
     """
+    output_parser = BoringSSLOutputParser
+
     def __init__(self, options: ProviderOptions):
         self.ready_to_send_input_marker = None
         Provider.__init__(self, options)
@@ -0,0 +1,189 @@
+"""
+Structured test report.
+
+With --json-report=<path>, this pytest plugin appends one compact JSON line per
+test to path as soon as the test finishes, so a huge run is never held in
+memory and a crashed run still leaves every finished test behind. Each line has
+the test's nodeid, outcome, duration and parameters, and for every process it
+launched through managed_process: the provider, exit code, wall and CPU time,
+peak memory, context switches and what the handshake negotiated.
+
+Every line is written with a single append, so pytest-xdist workers can share
+the same file.
+
+Run this file on a report to total the CPU cost per provider and cipher, per
+handshake and per MB of application data, e.g. to compare s2n and OpenSSL
+from the same run:
+
+    python report.py /tmp/report.jsonl
+"""
+import argparse
+import collections
+import json
+import os
+import pytest
+import sys
+
+
+def _negotiated(provider, results):
+    """
+    The handshake details a provider printed, or None if it has no OutputParser.
+    """
+    if provider.output_parser is None or results.stdout is None:
+        return None
+
+    output = results.output
+    return {
+        "protocol": output.protocol.name if output.protocol is not None else None,
+        "cipher": output.cipher,
+        "curve": output.curve,
+        "kem": output.kem,
+        "resumed": output.resumed,
+        # Every provider prints the cipher once per handshake
+        "handshakes": output.count('cipher'),
+    }
+
+
+def _process_entry(provider, process):
+    data = provider.options.data_to_send
+    entry = {
+        "provider": type(provider).__name__,
+        "mode": provider.options.mode,
+        "bytes_sent": len(data) if data is not None else 0,
+    }
+
+    results = process.results
+    if results is None:
+        return entry
+
+    entry.update({
+        "exit_code": results.exit_code,
+        "exception": None if results.exception is None else type(results.exception).__name__,
+        "wall_s": results.wall_time,
+        # From /proc while the process ran, see _processCommunicator._sample_peak_rss
+        "max_rss_kb": results.peak_rss_kb,
+    })
+
+    if results.rusage is not None:
+        entry.update({
+            "user_s": results.rusage.ru_utime,
+            "sys_s": results.rusage.ru_stime,
+            "voluntary_switches": results.rusage.ru_nvcsw,
+            "involuntary_switches": results.rusage.ru_nivcsw,
+        })
+
+    entry["negotiated"] = _negotiated(provider, results)
+    return entry
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("report", "structured test report")
+    group.addoption("--json-report", action="store", dest="json-report", default=None, type=str,
+            help="Append one JSON line per test to this file")
+
+
+def pytest_configure(config):
+    path = config.getoption('json-report', None)
+    if path is not None:
+        config.pluginmanager.register(JsonReport(path), "json-report")
+
+
+class JsonReport(object):
+    def __init__(self, path):
+        self.path = path
+        # nodeid -> (outcome, total duration) of the phases reported so far
+        self.outcomes = {}
+
+    def pytest_runtest_logreport(self, report):
+        """
+        A test fails if any phase fails, and is skipped if the setup or call was skipped.
+        """
+        outcome, duration = self.outcomes.get(report.nodeid, ("passed", 0.0))
+        if report.outcome != "passed" and outcome != "failed":
+            outcome = report.outcome
+        self.outcomes[report.nodeid] = (outcome, duration + report.duration)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        """
+        Write the line once the test's fixtures have been torn down, which is
+        when managed_process has joined every process.
+        """
+        yield
+
+        outcome, duration = self.outcomes.pop(item.nodeid, (None, None))
+        params = item.callspec.params if hasattr(item, 'callspec') else {}
+        line = json.dumps({
+            "nodeid": item.nodeid,
+            "outcome": outcome,
+            "duration_s": duration,
+            "params": {k: str(v) for k, v in params.items()},
+            "processes": [_process_entry(provider, process) for provider, process in getattr(item, 'managed_processes', [])],
+        }, separators=(',', ':'), sort_keys=True) + "\n"
+
+        # Don't keep every process' output alive until the end of the run
+        item.managed_processes = []
+
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+
+# Totals for one (provider, mode, cipher)
+_Usage = collections.namedtuple('_Usage', 'processes handshakes cpu_s app_bytes max_rss_kb switches')
+
+
+def summarize(lines):
+    """
+    Total the resource usage in a report per (provider, mode, negotiated cipher).
+    A process is charged for all the application data sent in its test, by
+    either side, since the receiver does as much work as the sender.
+    """
+    totals = {}
+    for line in lines:
+        processes = line["processes"]
+        app_bytes = sum(p.get("bytes_sent", 0) for p in processes)
+        for process in processes:
+            if process.get("user_s") is None:
+                continue
+
+            negotiated = process.get("negotiated") or {}
+            key = (process["provider"], process["mode"], negotiated.get("cipher"))
+            usage = totals.get(key, _Usage(0, 0, 0.0, 0, 0, 0))
+            totals[key] = _Usage(
+                usage.processes + 1,
+                usage.handshakes + negotiated.get("handshakes", 0),
+                usage.cpu_s + process["user_s"] + process["sys_s"],
+                usage.app_bytes + app_bytes,
+                max(usage.max_rss_kb, process.get("max_rss_kb") or 0),
+                usage.switches + process["voluntary_switches"] + process["involuntary_switches"])
+
+    return totals
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("report", help="File written with --json-report")
+    args = parser.parse_args(argv)
+
+    with open(args.report) as f:
+        totals = summarize(json.loads(line) for line in f if line.strip())
+
+    print("{:<12} {:<7} {:<32} {:>9} {:>10} {:>9} {:>12} {:>11} {:>12} {:>10}".format(
+        "provider", "mode", "cipher", "processes", "handshakes", "cpu_s", "cpu_ms/hs", "cpu_ms/MB", "max_rss_kb", "switches"))
+    for (provider, mode, cipher), usage in sorted(totals.items(), key=lambda t: tuple(str(k) for k in t[0])):
+        per_handshake = usage.cpu_s * 1000 / usage.handshakes if usage.handshakes else None
+        per_mb = usage.cpu_s * 1000 / (usage.app_bytes / 1e6) if usage.app_bytes else None
+        print("{:<12} {:<7} {:<32} {:>9} {:>10} {:>9.3f} {:>12} {:>11} {:>12} {:>10}".format(
+            provider, mode, str(cipher), usage.processes, usage.handshakes, usage.cpu_s,
+            "-" if per_handshake is None else "{:.3f}".format(per_handshake),
+            "-" if per_mb is None else "{:.1f}".format(per_mb),
+            usage.max_rss_kb, usage.switches))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
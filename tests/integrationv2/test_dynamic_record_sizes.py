@@ -4,35 +4,21 @@ import pytest
 import subprocess
 import time
 
+from capture import decode_tcp_segments
 from configuration import available_ports, ALL_TEST_CIPHERS, ALL_TEST_CURVES, ALL_TEST_CERTS, PROVIDERS, PROTOCOLS
 from common import ProviderOptions, data_bytes, Protocols
-from fixtures import managed_process, custom_mtu
+from fixtures import managed_process, emulated_network
 from providers import Provider, S2N, OpenSSL, Tcpdump
 from utils import invalid_test_parameters, get_parameter_name, get_expected_s2n_version
 
 
 def find_fragmented_packet(results):
     """
-    This function searches Tcpdump's standard output and looks for packets
-    that have a length larger than the MTU(hardcoded to 1500) of the device.
-
-    When traffic goes over a known port, such as 8080, the protocol is appended
-    to the output line. This happens even when using `-nn` on the command line.
-    That is why we need two ways to detect the length of the packet.
+    This function decodes Tcpdump's pcap output and looks for TCP segments
+    with a payload larger than the MTU(hardcoded to 1500) of the device.
     """
-    for line in results.decode('utf-8').split('\n'):
-        pieces = line.split(' ')
-        if len(pieces) < 3:
-            continue
-
-        packet_len = 0
-        if pieces[-2] == 'length':
-            packet_len = int(pieces[-1])
-        elif pieces[-3] == 'length':
-            # In this case the length has a colon `1234:`, so we must trim it.
-            packet_len = int(pieces[-2][:-1])
-
-        if packet_len > 1500:
+    for segment in decode_tcp_segments(results):
+        if len(segment.payload) > 1500:
             return True
 
     return False
@@ -44,10 +30,14 @@ def find_fragmented_packet(results):
 @pytest.mark.parametrize("provider", [OpenSSL])
 @pytest.mark.parametrize("protocol", PROTOCOLS, ids=get_parameter_name)
 @pytest.mark.parametrize("certificate", ALL_TEST_CERTS, ids=get_parameter_name)
-def test_s2n_client_dynamic_record(custom_mtu, managed_process, cipher, curve, provider, protocol, certificate):
+def test_s2n_client_dynamic_record(emulated_network, managed_process, cipher, curve, provider, protocol, certificate):
     host = "localhost"
     port = next(available_ports)
 
+    # Run every process in a private namespace whose loopback has a realistic
+    # MTU, instead of changing the host's loopback device.
+    network = emulated_network(mtu=1500)
+
     # 16384 bytes is enough to reliably get a packet that will exceed the MTU
     bytes_to_send = data_bytes(16384)
     client_options = ProviderOptions(
@@ -69,9 +59,9 @@ def test_s2n_client_dynamic_record(custom_mtu, managed_process, cipher, curve, p
 
     # This test shouldn't last longer than 5 seconds, even though
     # Tcpdump tends to take a second to startup.
-    tcpdump = managed_process(Tcpdump, client_options, timeout=5)
-    server = managed_process(provider, server_options, timeout=5)
-    client = managed_process(S2N, client_options, timeout=5)
+    tcpdump = managed_process(Tcpdump, client_options, timeout=5, network=network)
+    server = managed_process(provider, server_options, timeout=5, network=network)
+    client = managed_process(S2N, client_options, timeout=5, network=network)
 
     for results in client.get_results():
         assert results.exception is None
@@ -82,7 +72,7 @@ def test_s2n_client_dynamic_record(custom_mtu, managed_process, cipher, curve, p
         assert results.exception is None
         assert results.exit_code == 0
 
-    # The Tcpdump provider only captures 12 packets. This is enough
+    # The Tcpdump provider only captures 10 packets. This is enough
     # to detect a packet larger than the MTU, but less than the
     # total packets sent. This is important because it lets Tcpdump
     # exit cleanly, which means all the output is available for us
@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+
+from configuration import available_ports
+from common import ProviderOptions, Protocols, Ciphers, Certificates
+from endpoint_driver import EndpointCheck, StandIn, check_key, load_profiles, write_profiles, run_replay, _client_options, _run_client, _failed
+from providers import Provider, OpenSSL
+from utils import get_parameter_name
+
+
+TIMEOUT = 5
+
+# Stands in for a well known endpoint, so nothing leaves the host
+ENDPOINT = {"endpoint": "localhost"}
+
+
+async def record(check, cipher, certificate):
+    """
+    Handshake with a local server, as --record does with the real endpoint.
+    """
+    options = ProviderOptions(
+        mode=Provider.ServerMode,
+        host="localhost",
+        port=next(available_ports),
+        cipher=cipher,
+        cert=certificate.cert,
+        key=certificate.key,
+        protocol=check.protocol,
+        reconnects_before_exit=1)
+
+    server = StandIn(OpenSSL, options, 'ACCEPT')
+    await server.start(TIMEOUT)
+    try:
+        return await _run_client(asyncio.Semaphore(1), check, _client_options(check, "localhost", server.port, None), TIMEOUT)
+    finally:
+        await server.stop()
+
+
+@pytest.mark.parametrize("protocol,cipher", [
+    (Protocols.TLS13, Ciphers.AES128_GCM_SHA256),
+    (Protocols.TLS12, Ciphers.ECDHE_ECDSA_AES128_GCM_SHA256),
+], ids=get_parameter_name)
+def test_record_and_replay(tmp_path, protocol, cipher):
+    check = EndpointCheck(ENDPOINT, protocol)
+
+    result = asyncio.run(record(check, cipher, Certificates.ECDSA_256))
+    assert result["exit_code"] == 0, result["stderr"]
+
+    recording = str(tmp_path / "profiles.json")
+    write_profiles(recording, [result])
+    profiles = load_profiles(recording)
+    assert profiles[check_key(check)]["protocol"] == protocol.name
+    assert profiles[check_key(check)]["cipher"] == cipher.name
+
+    replayed = asyncio.run(run_replay([check], profiles, 1, TIMEOUT))
+
+    assert len(replayed) == 1
+    assert not replayed[0].get("skipped")
+    assert _failed(replayed[0], profiles, [], True) is None
+
+
+def test_replay_skips_unknown_cipher():
+    check = EndpointCheck(ENDPOINT, Protocols.TLS12)
+    profiles = {
+        check_key(check): {"check": check_key(check), "protocol": "TLS1.2", "cipher": "NOT-A-CIPHER", "curve": None, "kem": None},
+    }
+
+    replayed = asyncio.run(run_replay([check], profiles, 1, TIMEOUT))
+
+    assert replayed == [{"check": check_key(check), "skipped": "no stand-in for cipher NOT-A-CIPHER"}]
@@ -58,11 +58,12 @@ def test_s2n_server_happy_path(managed_process, cipher, provider, curve, protoco
     for results in server.get_results():
         assert results.exception is None
         assert results.exit_code == 0
-        assert bytes("Actual protocol version: {}".format(expected_version).encode('utf-8')) in results.stdout
+        assert results.output.protocol is not None
+        assert results.output.protocol.value == int(expected_version)
         assert random_bytes in results.stdout
 
         if provider is not S2N:
-            assert bytes("Cipher negotiated: {}".format(cipher.name).encode('utf-8')) in results.stdout
+            assert results.output.cipher == cipher.name
 
 
 @pytest.mark.uncollect_if(func=invalid_test_parameters)
@@ -108,7 +109,8 @@ def test_s2n_client_happy_path(managed_process, cipher, provider, curve, protoco
     for results in client.get_results():
         assert results.exception is None
         assert results.exit_code == 0
-        assert bytes("Actual protocol version: {}".format(expected_version).encode('utf-8')) in results.stdout
+        assert results.output.protocol is not None
+        assert results.output.protocol.value == int(expected_version)
 
     # The server will be one of all supported providers. We
     # just want to make sure there was no exception and that
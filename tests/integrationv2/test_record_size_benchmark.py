@@ -0,0 +1,93 @@
+import copy
+import pytest
+
+from benchmark import NETWORK_PROFILES, get_network_name, setup_network, skip_unless_benchmarking, parse_benchmark_results, record_benchmark
+from configuration import available_ports
+from common import ProviderOptions, Ciphers, Certificates, Protocols, data_bytes
+from fixtures import managed_process, emulated_network
+from providers import Provider, S2N, TimedClient
+from timed_client import BENCHMARK_MARKER
+from utils import invalid_test_parameters, get_parameter_name, get_expected_s2n_version
+
+
+# s2n sizes low latency records so the plaintext fits in a single ethernet
+# frame. With the cipher overhead added, every record is still below the MTU.
+ETH_MTU = 1500
+
+RECORD_SIZE_MODES = ['--prefer-low-latency', '--prefer-throughput']
+
+PAYLOAD_SIZES = [1024, 16384, 131072, 1048576]
+
+# None lets the server pick, which is the only choice for TLS1.3
+BENCHMARK_CIPHERS = [
+    None,
+    Ciphers.ECDHE_RSA_AES128_GCM_SHA256,
+    Ciphers.ECDHE_RSA_AES256_GCM_SHA384,
+    Ciphers.ECDHE_RSA_CHACHA20_POLY1305,
+    Ciphers.ECDHE_RSA_AES128_SHA,
+]
+
+
+@pytest.mark.uncollect_if(func=invalid_test_parameters)
+@pytest.mark.parametrize("cipher", BENCHMARK_CIPHERS, ids=get_parameter_name)
+@pytest.mark.parametrize("provider", [TimedClient])
+@pytest.mark.parametrize("protocol", [Protocols.TLS13, Protocols.TLS12], ids=get_parameter_name)
+@pytest.mark.parametrize("payload_size", PAYLOAD_SIZES, ids=get_parameter_name)
+@pytest.mark.parametrize("mode", RECORD_SIZE_MODES)
+@pytest.mark.parametrize("network_profile", NETWORK_PROFILES, ids=get_network_name)
+def test_s2n_server_record_size_latency(emulated_network, managed_process, cipher, provider, protocol, payload_size, mode, network_profile):
+    """
+    Measure the time to the first application byte and the total transfer time
+    seen by a client downloading from s2nd in each record size mode.
+    """
+    skip_unless_benchmarking()
+
+    network = setup_network(emulated_network, network_profile)
+    port = next(available_ports)
+    certificate = Certificates.RSA_2048_SHA256
+
+    payload = data_bytes(payload_size)
+    client_options = ProviderOptions(
+        mode=Provider.ClientMode,
+        host="localhost",
+        port=port,
+        cipher=cipher,
+        insecure=True,
+        protocol=protocol)
+
+    server_options = copy.copy(client_options)
+    server_options.mode = Provider.ServerMode
+    server_options.data_to_send = payload
+    server_options.extra_flags = [mode]
+    server_options.key = certificate.key
+    server_options.cert = certificate.cert
+
+    server = managed_process(S2N, server_options, timeout=10, network=network)
+    client = managed_process(provider, client_options, timeout=10, network=network)
+
+    expected_version = get_expected_s2n_version(protocol, provider)
+
+    for results in server.get_results():
+        assert results.exception is None
+        assert results.exit_code == 0
+        assert bytes("Actual protocol version: {}".format(expected_version).encode('utf-8')) in results.stdout
+
+    for results in client.get_results():
+        assert results.exception is None
+        assert results.exit_code == 0
+
+        measurements = parse_benchmark_results(results.stdout, BENCHMARK_MARKER)
+        assert len(measurements) == 1
+        measurement = measurements[0]
+
+        assert measurement["bytes_received"] == payload_size
+        if mode == '--prefer-low-latency':
+            assert measurement["max_record"] < ETH_MTU
+
+        record_benchmark("record_size_latency", {
+            "cipher": cipher,
+            "protocol": protocol,
+            "payload_size": payload_size,
+            "mode": mode.lstrip('-'),
+            "network": get_network_name(network_profile),
+        }, measurement)
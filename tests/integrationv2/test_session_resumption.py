@@ -47,7 +47,7 @@ def test_session_resumption_s2n_server(managed_process, cipher, curve, protocol,
     for results in client.get_results():
         assert results.exception is None
         assert results.exit_code == 0
-        assert results.stdout.count(bytes("Session-ID:".encode('utf-8'))) == 6
+        assert len(results.output.session_ids) == 6
 
     expected_version = get_expected_s2n_version(protocol, OpenSSL)
 
@@ -55,7 +55,7 @@ def test_session_resumption_s2n_server(managed_process, cipher, curve, protocol,
     for results in server.get_results():
         assert results.exception is None
         assert results.exit_code == 0
-        assert results.stdout.count(bytes("Actual protocol version: {}".format(expected_version).encode('utf-8'))) == 6
+        assert [p.value for p in results.output.values('protocol')] == [int(expected_version)] * 6
 
 
 @pytest.mark.uncollect_if(func=invalid_test_parameters)
@@ -96,9 +96,9 @@ def test_session_resumption_s2n_client(managed_process, cipher, curve, protocol,
     for results in client.get_results():
         assert results.exception is None
         assert results.exit_code == 0
-        assert results.stdout.count(bytes("Actual protocol version: {}".format(expected_version).encode('utf-8'))) == 6
+        assert [p.value for p in results.output.values('protocol')] == [int(expected_version)] * 6
 
     for results in server.get_results():
         assert results.exception is None
         assert results.exit_code == 0
-        assert results.stdout.count(bytes("6 server accepts that finished".encode('utf-8')))
+        assert results.output.values('accepts_finished') == [6]
@@ -0,0 +1,125 @@
+import copy
+import pytest
+
+from benchmark import skip_unless_benchmarking, parse_benchmark_results, record_benchmark
+from configuration import available_ports
+from common import ProviderOptions, Ciphers, Certificates, Protocols
+from fixtures import managed_process
+from providers import Provider, S2N, TimedClient
+from timed_client import BENCHMARK_MARKER
+from utils import invalid_test_parameters, get_parameter_name
+
+
+# Number of handshakes measured per test case
+HANDSHAKES = 100
+
+# s2n does not support TLS1.3 resumption, and the client doesn't support older protocols
+BENCHMARK_PROTOCOLS = [Protocols.TLS12]
+
+BENCHMARK_CIPHERS = [
+    Ciphers.ECDHE_RSA_AES128_GCM_SHA256,
+    Ciphers.ECDHE_RSA_AES256_GCM_SHA384,
+    Ciphers.ECDHE_RSA_CHACHA20_POLY1305,
+    Ciphers.ECDHE_ECDSA_AES128_GCM_SHA256,
+    Ciphers.AES128_SHA,
+    Ciphers.DHE_RSA_AES128_GCM_SHA256,
+]
+
+BENCHMARK_CERTS = [
+    Certificates.RSA_2048_SHA256,
+    Certificates.ECDSA_256,
+]
+
+
+def filter_full_handshakes(*args, **kwargs):
+    """
+    A full handshake doesn't depend on how sessions are resumed, so only run
+    it once, against s2nd's default of issuing tickets.
+    """
+    if not kwargs.get('resume') and not kwargs.get('use_ticket'):
+        return True
+
+    return invalid_test_parameters(*args, **kwargs)
+
+
+@pytest.mark.uncollect_if(func=filter_full_handshakes)
+@pytest.mark.parametrize("cipher", BENCHMARK_CIPHERS, ids=get_parameter_name)
+@pytest.mark.parametrize("certificate", BENCHMARK_CERTS, ids=get_parameter_name)
+@pytest.mark.parametrize("protocol", BENCHMARK_PROTOCOLS, ids=get_parameter_name)
+@pytest.mark.parametrize("provider", [TimedClient], ids=get_parameter_name)
+@pytest.mark.parametrize("use_ticket", [True, False], ids=lambda x: "tickets" if x else "session_id_cache")
+@pytest.mark.parametrize("resume", [True, False], ids=lambda x: "resumed" if x else "full")
+def test_s2n_server_session_resumption_rate(managed_process, cipher, certificate, protocol, provider, use_ticket, resume):
+    """
+    Measure the handshake rate against s2nd when every handshake is a full
+    handshake, and when every handshake after the first resumes the previous
+    session with either a session ticket or s2nd's session ID cache.
+
+    The CPU time s2nd used per handshake is recorded alongside the client's,
+    to size ticket and session cache capacity for s2nd. It includes starting
+    s2nd and loading its certificate, once for all HANDSHAKES.
+    """
+    skip_unless_benchmarking()
+
+    port = next(available_ports)
+
+    client_options = ProviderOptions(
+        mode=Provider.ClientMode,
+        host="localhost",
+        port=port,
+        cipher=cipher,
+        insecure=True,
+        reconnect=resume,
+        reconnects_before_exit=HANDSHAKES,
+        protocol=protocol)
+
+    server_options = copy.copy(client_options)
+    server_options.mode = Provider.ServerMode
+    server_options.cipher = None
+    server_options.reconnect = None
+    server_options.use_session_ticket = use_ticket
+    server_options.key = certificate.key
+    server_options.cert = certificate.cert
+
+    server = managed_process(S2N, server_options, timeout=30)
+    client = managed_process(provider, client_options, timeout=30)
+
+    for results in server.get_results():
+        assert results.exception is None
+        assert results.exit_code == 0
+        server_resumed = results.output.resumed
+        server_usage = results.rusage
+        server_peak_rss_kb = results.peak_rss_kb
+
+    for results in client.get_results():
+        assert results.exception is None
+        assert results.exit_code == 0
+
+        measurements = parse_benchmark_results(results.stdout, BENCHMARK_MARKER)
+        assert len(measurements) == 1
+        measurement = measurements[0]
+
+    # The client and server must agree on which handshakes were resumed
+    assert measurement["resumed_handshakes"] == server_resumed
+    if resume:
+        assert measurement["full_handshakes"] == 1
+    else:
+        assert server_resumed == 0
+
+    measurement["server_cpu_ms_per_handshake"] = (server_usage.ru_utime + server_usage.ru_stime) * 1000 / HANDSHAKES
+    measurement["server_peak_rss_kb"] = server_peak_rss_kb
+
+    if not resume:
+        resumption = "none"
+    elif use_ticket:
+        resumption = "tickets"
+    else:
+        resumption = "session_id_cache"
+
+    record_benchmark("session_resumption_rate", {
+        "cipher": cipher,
+        "certificate": certificate,
+        "protocol": protocol,
+        "resumption": resumption,
+        "resume": resume,
+    }, measurement)
@@ -0,0 +1,182 @@
+import concurrent.futures
+import copy
+import os
+import pytest
+import random
+import time
+
+import pki
+from benchmark import skip_unless_benchmarking, parse_benchmark_results, record_benchmark
+from configuration import available_ports
+from common import ProviderOptions, Protocols
+from fixtures import managed_process
+from providers import Provider, S2N, TimedClient
+from timed_client import BENCHMARK_MARKER
+from utils import get_parameter_name
+
+
+# Numbers of certificates loaded into s2nd
+CERTIFICATE_COUNTS = [100, 1000, 10000]
+
+# Number of handshakes measured per test case
+HANDSHAKES = 200
+
+BENCHMARK_PROTOCOLS = [Protocols.TLS13, Protocols.TLS12]
+
+# How the client picks the server name for each handshake:
+#   random: a random loaded name for every handshake
+#   last: the name of the certificate s2nd loaded last
+#   unknown: a name no certificate matches, so s2nd falls back to its default certificate
+NAME_MODES = ["random", "last", "unknown"]
+
+UNKNOWN_SERVER_NAME = "unknown.s2n.test"
+
+# Generating 10k certificates takes a while the first time, but they are
+# kept in pki.DEFAULT_OUTPUT_DIRECTORY for later runs.
+SETUP_TIMEOUT = 120
+
+
+class S2NCertDir(S2N):
+    """
+    s2nd listens before loading its certificates, so wait until they are all
+    loaded before starting the client.
+    """
+    def setup_server(self):
+        cmd_line = S2N.setup_server(self)
+        self.ready_to_test_marker = 'Loaded'
+        return cmd_line
+
+
+def _rss_kb(pid):
+    with open("/proc/{}/status".format(pid)) as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+
+    return None
+
+
+@pytest.fixture(scope="module")
+def sni_cert_dir(tmp_path_factory):
+    """
+    Return a function creating a directory with `count` SNI certificates for
+    s2nd's --cert-dir. The certificates are generated by pki.py, and linked
+    into the directory without their CA certificates.
+    """
+    directories = {}
+
+    def _fn(count):
+        if count in directories:
+            return directories[count]
+
+        specs = pki.build_specs([('ecdsa', 'P-256')], [], [], 'sha256', count)
+        os.makedirs(pki.DEFAULT_OUTPUT_DIRECTORY, exist_ok=True)
+        with concurrent.futures.ProcessPoolExecutor() as executor:
+            generated = list(executor.map(pki.generate, specs, [pki.DEFAULT_OUTPUT_DIRECTORY] * len(specs)))
+
+        directory = str(tmp_path_factory.mktemp("sni{}".format(count)))
+        for spec, spec_directory, _ in generated:
+            for suffix in ("_cert.pem", "_key.pem"):
+                name = spec.name.lower() + suffix
+                os.symlink(os.path.abspath(os.path.join(spec_directory, name)), os.path.join(directory, name))
+
+        # s2nd loads the directory in alphabetical order
+        last = max(specs, key=lambda s: s.name.lower())
+        directories[count] = (directory, [s.sans[0] for s in specs], last.sans[0])
+        return directories[count]
+
+    return _fn
+
+
+def _server_names(mode, names, last, seed):
+    if mode == "random":
+        return random.Random(seed).choices(names, k=HANDSHAKES)
+    if mode == "last":
+        return [last] * HANDSHAKES
+
+    return [UNKNOWN_SERVER_NAME] * HANDSHAKES
+
+
+def _launch_server(managed_process, options, directory):
+    """
+    Launch s2nd with every certificate in directory. Returns the process, the
+    time taken to load the certificates and s2nd's resident memory once loaded.
+    """
+    options = copy.copy(options)
+    options.extra_flags = ['--cert-dir', directory]
+
+    start = time.perf_counter()
+    server = managed_process(S2NCertDir, options, timeout=SETUP_TIMEOUT)
+    load_s = time.perf_counter() - start
+
+    return server, load_s, _rss_kb(server.proc.pid)
+
+
+@pytest.mark.parametrize("count", CERTIFICATE_COUNTS, ids=lambda x: "{}_certs".format(x))
+@pytest.mark.parametrize("protocol", BENCHMARK_PROTOCOLS, ids=get_parameter_name)
+@pytest.mark.parametrize("provider", [TimedClient], ids=get_parameter_name)
+@pytest.mark.parametrize("name_mode", NAME_MODES)
+def test_s2n_server_sni_scaling(managed_process, sni_cert_dir, count, protocol, provider, name_mode):
+    """
+    Measure how s2nd's certificate selection scales with the number of loaded
+    certificates: the handshake latency for each way of picking the server
+    name, the time to load the certificates and the memory used per certificate.
+    """
+    skip_unless_benchmarking()
+
+    directory, names, last = sni_cert_dir(count)
+    baseline_directory, _, _ = sni_cert_dir(1)
+    server_names = _server_names(name_mode, names, last, count)
+
+    server_options = ProviderOptions(
+        mode=Provider.ServerMode,
+        host="localhost",
+        port=next(available_ports),
+        insecure=True,
+        reconnects_before_exit=1,
+        protocol=protocol)
+
+    # The memory used by s2nd with a single certificate, to subtract from the total
+    baseline, _, baseline_rss_kb = _launch_server(managed_process, server_options, baseline_directory)
+    baseline.proc.kill()
+
+    server_options.port = str(next(available_ports))
+    server_options.reconnects_before_exit = HANDSHAKES
+    server, load_s, rss_kb = _launch_server(managed_process, server_options, directory)
+
+    client_options = ProviderOptions(
+        mode=Provider.ClientMode,
+        host="localhost",
+        port=server_options.port,
+        insecure=True,
+        reconnects_before_exit=HANDSHAKES,
+        extra_flags=[arg for name in server_names for arg in ('--server-name', name)],
+        protocol=protocol)
+
+    client = managed_process(provider, client_options, timeout=SETUP_TIMEOUT)
+
+    for results in client.get_results():
+        assert results.exception is None
+        assert results.exit_code == 0
+
+        measurements = parse_benchmark_results(results.stdout, BENCHMARK_MARKER)
+        assert len(measurements) == 1
+        measurement = measurements[0]
+
+    for results in server.get_results():
+        assert results.exception is None
+        assert results.exit_code == 0
+        assert "Loaded {} certificates".format(count).encode('utf-8') in results.stdout
+        assert results.output.values('server_name') == server_names
+
+    measurement.update({
+        "load_s": load_s,
+        "rss_kb": rss_kb,
+        "rss_kb_per_certificate": (rss_kb - baseline_rss_kb) / (count - 1),
+    })
+
+    record_benchmark("sni_selection_scaling", {
+        "certificates": count,
+        "protocol": protocol,
+        "server_names": name_mode,
+    }, measurement)
@@ -0,0 +1,314 @@
+"""
+A minimal TLS client which measures how quickly application data arrives, or
+how quickly it can complete handshakes.
+
+It is launched by the TimedClient provider, so it can be run by managed_process
+(and inside an emulated_network) like any other provider. The raw TLS records
+are split off the socket by hand and fed to the TLS library one at a time, so
+the client knows exactly which records carried application data.
+
+By default the client connects once, completes the handshake and reads until
+the server closes the connection. With --connections it instead performs that
+many handshakes in a row, optionally resuming the previous session each time.
+Pass --server-name (repeatedly) to send those names in the SNI extension, one
+per handshake in turn.
+
+The measurements are printed as a single line: the BENCHMARK_MARKER followed by JSON.
+"""
+import argparse
+import json
+import resource
+import socket
+import ssl
+import struct
+import sys
+import time
+
+
+BENCHMARK_MARKER = "BENCHMARK: "
+
+_PROTOCOLS = {
+    "TLS1.3": ssl.TLSVersion.TLSv1_3,
+    "TLS1.2": ssl.TLSVersion.TLSv1_2,
+    "TLS1.1": ssl.TLSVersion.TLSv1_1,
+    "TLS1.0": ssl.TLSVersion.TLSv1,
+}
+
+_TLS_RECORD_HEADER_LEN = 5
+
+
+class RecordReader(object):
+    """
+    Splits the bytes read from a socket into whole TLS records.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+
+    def read_record(self):
+        """
+        Return (content_type, length, raw record bytes), or None once the peer closes the socket.
+        """
+        while True:
+            if len(self.buffer) >= _TLS_RECORD_HEADER_LEN:
+                content_type, _, length = struct.unpack_from('!BHH', self.buffer, 0)
+                total = _TLS_RECORD_HEADER_LEN + length
+                if len(self.buffer) >= total:
+                    raw = bytes(self.buffer[:total])
+                    del self.buffer[:total]
+                    return content_type, length, raw
+
+            data = self.sock.recv(65536)
+            if not data:
+                return None
+            self.buffer += data
+
+
+def connect(host, port, timeout):
+    """
+    The server may still be starting, so keep retrying until the timeout.
+    Returns the socket and the time the successful connection attempt started.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        start = time.perf_counter()
+        try:
+            return socket.create_connection((host, port), timeout=timeout), start
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def create_context(protocol, cipher):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    if protocol is not None:
+        context.minimum_version = _PROTOCOLS[protocol]
+        context.maximum_version = _PROTOCOLS[protocol]
+    if cipher is not None:
+        context.set_ciphers(cipher)
+
+    return context
+
+
+class Connection(object):
+    """
+    A TLS connection driven record by record through memory BIOs.
+    All times are time.perf_counter() values.
+    """
+    def __init__(self, context, host, port, timeout, session=None, server_name=None):
+        self.incoming = ssl.MemoryBIO()
+        self.outgoing = ssl.MemoryBIO()
+        self.tls = context.wrap_bio(self.incoming, self.outgoing, server_hostname=server_name or host, session=session)
+
+        self.sock, self.start = connect(host, port, timeout)
+        # Don't let Nagle's algorithm delay the small handshake and alert records
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connected = time.perf_counter()
+        self.reader = RecordReader(self.sock)
+
+        self.handshake_records = 0
+        while True:
+            try:
+                self.tls.do_handshake()
+                self.flush()
+                break
+            except ssl.SSLWantReadError:
+                self.flush()
+                record = self.reader.read_record()
+                if record is None:
+                    raise ConnectionError("Server closed the connection during the handshake")
+                self.incoming.write(record[2])
+                self.handshake_records += 1
+        self.handshake_done = time.perf_counter()
+
+    def flush(self):
+        data = self.outgoing.read()
+        if data:
+            self.sock.sendall(data)
+
+    def read_record(self):
+        """
+        Read one record and return (record length, plaintext length, peer closed).
+        Returns None if the socket was closed.
+        """
+        record = self.reader.read_record()
+        if record is None:
+            return None
+
+        self.incoming.write(record[2])
+        plaintext_len = 0
+        closed = False
+        try:
+            while True:
+                plaintext = self.tls.read(65536)
+                if not plaintext:
+                    closed = True
+                    break
+                plaintext_len += len(plaintext)
+        except ssl.SSLWantReadError:
+            pass
+        except ssl.SSLZeroReturnError:
+            closed = True
+        self.flush()
+
+        return record[1], plaintext_len, closed
+
+    def close(self, peer_closed=False):
+        """
+        Send our close_notify. Unless the peer already closed, wait for theirs.
+        """
+        try:
+            while True:
+                try:
+                    self.tls.unwrap()
+                    self.flush()
+                    break
+                except ssl.SSLWantReadError:
+                    self.flush()
+                    if peer_closed or self.read_record() is None:
+                        break
+        except (ssl.SSLError, OSError):
+            pass
+        self.sock.close()
+
+
+def run_download(host, port, protocol, cipher, timeout, server_names):
+    conn = Connection(create_context(protocol, cipher), host, port, timeout, server_name=server_names[0])
+
+    first_byte = None
+    last_byte = None
+    bytes_received = 0
+    record_sizes = []
+    other_records = 0
+    closed_cleanly = False
+
+    while not closed_cleanly:
+        result = conn.read_record()
+        if result is None:
+            break
+
+        record_len, plaintext_len, closed_cleanly = result
+
+        # Post handshake messages (session tickets, key updates) and alerts
+        # don't produce any plaintext.
+        if plaintext_len == 0:
+            other_records += 1
+            continue
+
+        now = time.perf_counter()
+        if first_byte is None:
+            first_byte = now
+        last_byte = now
+        bytes_received += plaintext_len
+        record_sizes.append(record_len)
+
+    conn.close(peer_closed=closed_cleanly)
+
+    def elapsed_ms(end):
+        return None if end is None else (end - conn.start) * 1000
+
+    return {
+        "protocol": conn.tls.version(),
+        "cipher": conn.tls.cipher()[0],
+        "connect_ms": elapsed_ms(conn.connected),
+        "handshake_ms": elapsed_ms(conn.handshake_done),
+        "first_byte_ms": elapsed_ms(first_byte),
+        "last_byte_ms": elapsed_ms(last_byte),
+        "bytes_received": bytes_received,
+        "handshake_records": conn.handshake_records,
+        "data_records": len(record_sizes),
+        "other_records": other_records,
+        "min_record": min(record_sizes) if record_sizes else 0,
+        "max_record": max(record_sizes) if record_sizes else 0,
+        "closed_cleanly": closed_cleanly,
+    }
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_handshakes(host, port, protocol, cipher, timeout, connections, resume, server_names):
+    context = create_context(protocol, cipher)
+
+    session = None
+    full_ms = []
+    resumed_ms = []
+    protocol_version = None
+    cipher_name = None
+
+    cpu_start = _cpu_seconds()
+    start = time.perf_counter()
+    for i in range(connections):
+        conn = Connection(context, host, port, timeout, session=session if resume else None,
+                server_name=server_names[i % len(server_names)])
+        elapsed_ms = (conn.handshake_done - conn.start) * 1000
+        if conn.tls.session_reused:
+            resumed_ms.append(elapsed_ms)
+        else:
+            full_ms.append(elapsed_ms)
+
+        protocol_version = conn.tls.version()
+        cipher_name = conn.tls.cipher()[0]
+        session = conn.tls.session
+        conn.close()
+    elapsed = time.perf_counter() - start
+    cpu = _cpu_seconds() - cpu_start
+
+    def mean(values):
+        return sum(values) / len(values) if values else None
+
+    return {
+        "protocol": protocol_version,
+        "cipher": cipher_name,
+        "connections": connections,
+        "full_handshakes": len(full_ms),
+        "resumed_handshakes": len(resumed_ms),
+        "hit_ratio": len(resumed_ms) / connections,
+        "elapsed_s": elapsed,
+        "handshakes_per_sec": connections / elapsed,
+        "full_handshake_ms": mean(full_ms),
+        "resumed_handshake_ms": mean(resumed_ms),
+        "p50_handshake_ms": _percentile(full_ms + resumed_ms, 0.5),
+        "p99_handshake_ms": _percentile(full_ms + resumed_ms, 0.99),
+        "client_cpu_ms_per_handshake": cpu * 1000 / connections,
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("host")
+    parser.add_argument("port", type=int)
+    parser.add_argument("--protocol", choices=sorted(_PROTOCOLS), default=None)
+    parser.add_argument("--cipher", default=None, help="OpenSSL cipher string, ignored by TLS1.3")
+    parser.add_argument("--timeout", type=float, default=5)
+    parser.add_argument("--connections", type=int, default=None, help="Measure this many handshakes instead of a download")
+    parser.add_argument("--resume", action="store_true", help="Resume the previous session on every handshake")
+    parser.add_argument("--server-name", action="append", dest="server_names", default=None,
+            help="Server name to send in the SNI extension (default: host). Repeat to use each name in turn")
+    args = parser.parse_args(argv)
+
+    server_names = args.server_names or [None]
+    if args.connections is None:
+        results = run_download(args.host, args.port, args.protocol, args.cipher, args.timeout, server_names)
+    else:
+        results = run_handshakes(args.host, args.port, args.protocol, args.cipher, args.timeout, args.connections,
+                args.resume, server_names)
+    print(BENCHMARK_MARKER + json.dumps(results), flush=True)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,48 +1,137 @@
-#! /usr/bin/python
+#! /usr/bin/env python3
 
-import sys
+"""
+Map the .bpl line numbers in a Boogie trace to the C source lines they came from.
+
+usage is <bpl-file-name> <trace-to-convert>, where the trace may be - for stdin.
+
+For every trace line naming a .bpl line, prints the C source location in
+effect at that line: the closest sourceloc before it in its basic block, or the
+first one of the block. The basic blocks and their sourcelocs are indexed once
+per .bpl file, and the index is kept in $SIDETRAIL_CACHE (by default
+~/.cache/sidetrail), keyed by the hash of the .bpl file.
+"""
+
+import bisect
+import hashlib
+import json
+import os
 import re
-from pprint import pprint
-
-args = sys.argv[1:]
-assert len(args) == 2, "usage is <bpl-file-name> <trace-to-convert>"
-print args
-
-def make_bpl_c_mapping(bpl_filename):
-    linenum = 0
-    bpl_c_mapping = {}
-    current_bb_line = -1
-    with open(bpl_filename) as bpl_file:
-        for line in bpl_file:
-            linenum += 1
-            if re.match(r'\$bb\d+', line):
-                current_bb_line = linenum
-                bpl_c_mapping[current_bb_line] = []
-
-            matchObj = re.match(r'  assume {:sourceloc "(.+)", (\d+), (\d+)} true;', line)
-            if matchObj:
-                matched_filename = matchObj.group(1)
-                matched_fileline = matchObj.group(2)
-                bpl_c_mapping[current_bb_line].append((matched_filename, matched_fileline))
-
-    return bpl_c_mapping
-
-def convert_trace_to_c(trace_filename, bpl_c_mapping):
-    with open(trace_filename) as tracefile:
-        for line in tracefile:
-            matchObj = re.match(r'.*\.bpl\((\d+),\d+\).*', line)
-            if matchObj:
-                bpl_line = int(matchObj.group(1))
-                if  bpl_line in bpl_c_mapping:
-                    mapping = bpl_c_mapping[bpl_line]
-                    if len(mapping) > 0:
-                        print mapping[0]
-                    else:
-                        print "No Source Loc"
-                else:
-                    print "unknown basic block"
-
-                print "\t\t", matchObj.group(0), matchObj.group(1)
-
-bpl_c_mapping = make_bpl_c_mapping(args[0])
-convert_trace_to_c(args[1], bpl_c_mapping)
+import sys
+
+BB_HEADER = re.compile(r'\$bb\d+')
+SOURCELOC = re.compile(r'  assume {:sourceloc "(.+)", (\d+), (\d+)} true;')
+TRACE_LINE = re.compile(r'.*\.bpl\((\d+),\d+\).*')
+
+INDEX_VERSION = 1
+CACHE_DIR = os.environ.get('SIDETRAIL_CACHE', os.path.expanduser('~/.cache/sidetrail'))
+
+
+class BplIndex:
+    """
+    The line each basic block starts on, and the line and C location of every
+    sourceloc, both sorted by line.
+    """
+
+    def __init__(self, block_lines, loc_lines, locs):
+        self.block_lines = block_lines
+        self.loc_lines = loc_lines
+        self.locs = locs
+
+    @classmethod
+    def build(cls, bpl_filename):
+        block_lines = []
+        loc_lines = []
+        locs = []
+        with open(bpl_filename) as bpl_file:
+            for linenum, line in enumerate(bpl_file, 1):
+                if BB_HEADER.match(line):
+                    block_lines.append(linenum)
+                    continue
+
+                match = SOURCELOC.match(line)
+                if match:
+                    loc_lines.append(linenum)
+                    locs.append((match.group(1), match.group(2)))
+
+        return cls(block_lines, loc_lines, locs)
+
+    @classmethod
+    def load(cls, bpl_filename, cache_dir=CACHE_DIR):
+        """
+        Return the index of bpl_filename, from the cache if it was built before.
+        """
+        digest = hashlib.sha256()
+        with open(bpl_filename, 'rb') as bpl_file:
+            for chunk in iter(lambda: bpl_file.read(1 << 20), b''):
+                digest.update(chunk)
+        cache_file = os.path.join(cache_dir, 'bpl-index-%s.json' % digest.hexdigest())
+
+        try:
+            with open(cache_file) as f:
+                cached = json.load(f)
+            if cached['version'] == INDEX_VERSION:
+                return cls(cached['block_lines'], cached['loc_lines'], [tuple(loc) for loc in cached['locs']])
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = cls.build(bpl_filename)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_file + '.tmp', 'w') as f:
+                json.dump({
+                    'version': INDEX_VERSION,
+                    'block_lines': index.block_lines,
+                    'loc_lines': index.loc_lines,
+                    'locs': index.locs,
+                }, f)
+            os.replace(cache_file + '.tmp', cache_file)
+        except OSError as e:
+            print("Not caching the index: %s" % e, file=sys.stderr)
+        return index
+
+    def lookup(self, bpl_line):
+        """
+        Return the C location of bpl_line, "No Source Loc" if its basic block
+        has none, or None if it is before the first basic block.
+        """
+        block = bisect.bisect_right(self.block_lines, bpl_line) - 1
+        if block < 0:
+            return None
+        block_start = self.block_lines[block]
+        block_end = self.block_lines[block + 1] if block + 1 < len(self.block_lines) else float('inf')
+
+        # The closest sourceloc at or before the line, if it is in the same block
+        loc = bisect.bisect_right(self.loc_lines, bpl_line) - 1
+        if loc >= 0 and self.loc_lines[loc] > block_start:
+            return self.locs[loc]
+
+        # Otherwise the first one of the block
+        loc = bisect.bisect_right(self.loc_lines, block_start)
+        if loc < len(self.loc_lines) and self.loc_lines[loc] < block_end:
+            return self.locs[loc]
+        return "No Source Loc"
+
+
+def convert_trace_to_c(tracefile, index, out=sys.stdout):
+    for line in tracefile:
+        match = TRACE_LINE.match(line)
+        if match:
+            mapping = index.lookup(int(match.group(1)))
+            print(mapping if mapping is not None else "unknown basic block", file=out)
+            print("\t\t", match.group(0), match.group(1), file=out)
+
+
+def main(args):
+    assert len(args) == 2, "usage is <bpl-file-name> <trace-to-convert>"
+
+    index = BplIndex.load(args[0])
+    if args[1] == '-':
+        convert_trace_to_c(sys.stdin, index)
+    else:
+        with open(args[1]) as tracefile:
+            convert_trace_to_c(tracefile, index)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,196 @@
+#! /usr/bin/env python3
+
+"""
+Run the sidetrail proofs in tests/sidetrail/working concurrently.
+
+usage is run_proofs.py [--jobs N] [--timeout SECONDS] [--force] [proof ...]
+
+Each proof runs like codebuild/bin/run_sidetrail.sh runs it: copy_as_needed.sh,
+make clean, make, then count_success.pl on the output. SMACK and its tools must
+already be on the PATH.
+
+A proof that passed is not run again until the sources it verifies change: the
+files copy_as_needed.sh puts in its directory, its own files and the ct-verif
+scripts. The results are kept in $SIDETRAIL_CACHE (by default ~/.cache/sidetrail).
+
+When a proof fails, the .bpl locations in its counterexample are mapped back to
+C with bpl_trace_to_c.py and written to trace_to_c.txt in the proof directory.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from bpl_trace_to_c import BplIndex, convert_trace_to_c, CACHE_DIR
+
+SIDETRAIL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+WORKING_DIR = os.path.join(SIDETRAIL_DIR, 'working')
+
+# Everything shared by the proofs, besides what copy_as_needed.sh copies
+SHARED_INPUTS = [
+    os.path.join(SIDETRAIL_DIR, 'lib', 'ct-verif.mk'),
+    os.path.join(SIDETRAIL_DIR, 'bin', 'ct-verif.rb'),
+    os.path.join(SIDETRAIL_DIR, 'count_success.pl'),
+]
+
+# Files written by running a proof, which aren't inputs
+GENERATED = re.compile(r'(@|\.log$|^out\.txt$|^trace_to_c\.txt$|\.orig$|\.rej$|\.smt2$)')
+
+BPL_LOCATION = re.compile(r'([^\s():]+\.bpl)\(\d+,\d+\)')
+
+RESULTS_FILE = os.path.join(CACHE_DIR, 'proof-results.json')
+
+
+def find_proofs():
+    return sorted(name for name in os.listdir(WORKING_DIR)
+                  if os.path.isfile(os.path.join(WORKING_DIR, name, 'copy_as_needed.sh')))
+
+
+def source_hash(proof_dir):
+    """
+    Hash the inputs of a proof, once copy_as_needed.sh has run.
+    """
+    digest = hashlib.sha256()
+    paths = list(SHARED_INPUTS)
+    for root, dirs, files in os.walk(proof_dir):
+        dirs.sort()
+        paths.extend(os.path.join(root, f) for f in sorted(files) if not GENERATED.search(f))
+
+    for path in paths:
+        digest.update(os.path.relpath(path, SIDETRAIL_DIR).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def run(cmd, cwd, out, deadline):
+    """
+    Run cmd, appending its output to out. Returns its exit code, or None if
+    it was still running at the deadline.
+    """
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=out, stderr=subprocess.STDOUT, start_new_session=True)
+    try:
+        return proc.wait(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+    except subprocess.TimeoutExpired:
+        # ct-verif runs boogie and z3 under make, stop them all
+        os.killpg(proc.pid, 9)
+        proc.wait()
+        return None
+
+
+def map_counterexample(proof_dir, output_file):
+    """
+    Map every .bpl location in a proof's output to C. Returns the file written,
+    or None if the output had none.
+    """
+    with open(output_file, errors='replace') as f:
+        lines = f.readlines()
+
+    bpl_files = sorted(set(m.group(1) for line in lines for m in BPL_LOCATION.finditer(line)))
+    bpl_files = [b for b in bpl_files if os.path.isfile(os.path.join(proof_dir, b))]
+    if not bpl_files:
+        return None
+
+    mapped = os.path.join(proof_dir, 'trace_to_c.txt')
+    with open(mapped, 'w') as out:
+        for bpl_file in bpl_files:
+            print("==", bpl_file, file=out)
+            index = BplIndex.load(os.path.join(proof_dir, bpl_file))
+            convert_trace_to_c((line for line in lines if bpl_file + '(' in line), index, out)
+    return mapped
+
+
+def run_proof(proof, passed_key, timeout):
+    """
+    Run one proof, unless its sources hash to passed_key.
+    Returns (status, seconds, source hash, detail).
+    """
+    proof_dir = os.path.join(WORKING_DIR, proof)
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout
+    output_file = os.path.join(proof_dir, 'out.txt')
+
+    with open(output_file, 'w') as out:
+        if run(['./copy_as_needed.sh'], proof_dir, out, deadline) != 0:
+            return 'ERROR', time.monotonic() - start, None, 'copy_as_needed.sh failed, see ' + output_file
+
+        key = source_hash(proof_dir)
+        if key == passed_key:
+            return 'CACHED', time.monotonic() - start, key, None
+
+        run(['make', 'clean'], proof_dir, out, deadline)
+        if run(['make'], proof_dir, out, deadline) is None:
+            return 'TIMEOUT', time.monotonic() - start, key, 'output so far in ' + output_file
+
+    seconds = time.monotonic() - start
+    check = subprocess.run([os.path.join(SIDETRAIL_DIR, 'count_success.pl'), '1', '0', output_file],
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    if check.returncode == 0:
+        return 'PASSED', seconds, key, None
+
+    detail = check.stdout.strip() + "\n\toutput in " + output_file
+    mapped = map_counterexample(proof_dir, output_file)
+    if mapped is not None:
+        detail += "\n\tcounterexample mapped to C in " + mapped
+    return 'FAILED', seconds, key, detail
+
+
+def load_results():
+    try:
+        with open(RESULTS_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_results(results):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(RESULTS_FILE + '.tmp', 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    os.replace(RESULTS_FILE + '.tmp', RESULTS_FILE)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count())
+    parser.add_argument('--timeout', type=float, default=None, help="Seconds after which a proof fails")
+    parser.add_argument('--force', action='store_true', help="Run the proofs that passed before too")
+    parser.add_argument('proofs', nargs='*', help="Directories in working/ to run (default: all)")
+    args = parser.parse_args(argv)
+
+    proofs = args.proofs or find_proofs()
+    # Proof -> source hash it last passed with
+    passed = load_results()
+
+    start = time.monotonic()
+    statuses = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(run_proof, proof, None if args.force else passed.get(proof), args.timeout): proof
+                   for proof in proofs}
+        for future in concurrent.futures.as_completed(futures):
+            proof = futures[future]
+            status, seconds, key, detail = future.result()
+            statuses[proof] = status
+            if status in ('PASSED', 'CACHED'):
+                passed[proof] = key
+            else:
+                passed.pop(proof, None)
+            print("%-8s %8.1fs  %s" % (status, seconds, proof), flush=True)
+            if detail:
+                print("\t" + detail, flush=True)
+
+    save_results(passed)
+
+    failed = [proof for proof, status in statuses.items() if status not in ('PASSED', 'CACHED')]
+    print("%d proofs, %d failed, in %.1fs" % (len(proofs), len(failed), time.monotonic() - start))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))